@@ -2,15 +2,41 @@ import pygame
 import random
 import math
 import os
-from enum import Enum
+import time
+import argparse
+import csv
+import json
+import struct
+import zlib
+import marshal
+import mmap
+import bisect
+from array import array
+from collections import OrderedDict, deque
+from itertools import repeat
+from enum import Enum, IntEnum
+
+try:
+    import numpy as np
+except ImportError:  # Projectiles fall back to plain lists without NumPy
+    np = None
 
 # Initialize pygame
 pygame.init()
 
 # Screen dimensions
 WIDTH, HEIGHT = 800, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Epic Adventure")
+
+# Everything draws to this surface. Until open_window() is called it is an
+# off-screen surface, so the module can be imported (and the game logic run)
+# without opening a window.
+screen = pygame.Surface((WIDTH, HEIGHT))
+
+def open_window():
+    global screen
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Epic Adventure")
+    return screen
 
 # Colors
 BLACK = (0, 0, 0)
@@ -30,9 +56,193 @@ BROWN = (139, 69, 19)  # Brown color for horns
 PINK = (255, 105, 180)  # Pink color for hearts
 ORANGE = (255, 165, 0)  # Orange for explosions
 
+# Fonts are looked up once per (face, size), and rendered text is kept in a
+# small LRU cache, so the HUD and menus don't rasterise the same strings
+# every frame. Only strings that change (score, timers) get re-rendered.
+fonts = {}
+TEXT_CACHE_SIZE = 256
+text_cache = OrderedDict()
+
+def get_font(size, face='Arial'):
+    font = fonts.get((face, size))
+    if font is None:
+        font = fonts[(face, size)] = pygame.font.SysFont(face, size)
+    return font
+
+def render_text(font, text, color):
+    key = (font, text, color)
+    surface = text_cache.get(key)
+    if surface is None:
+        surface = text_cache[key] = font.render(text, True, color)
+        if len(text_cache) > TEXT_CACHE_SIZE:
+            text_cache.popitem(last=False)
+    else:
+        text_cache.move_to_end(key)
+    return surface
+
+# Characters, enemies and hearts are drawn once per look into a sprite and
+# blitted from then on. A look is an entity type, size and tint; there are
+# only a few dozen, so the cache isn't bounded. Sprites are cropped to what
+# was actually drawn, and looks without any translucent pixels (all but the
+# final boss) use a run-length encoded colour key instead of per-pixel alpha,
+# which blits several times faster.
+SPRITE_PAD = 30  # Room on the painting canvas around the body for horns, hats and crowns
+SPRITE_KEY = (255, 0, 254)  # Transparent colour of keyed sprites; no look uses it
+sprites = {}
+
+def get_sprite(key, half_size, paint, *args):
+    # paint(surface, x, y, *args) draws the look centred on (x, y) on a
+    # canvas half_size from the centre each way. Returns the sprite and the
+    # offset of its top left corner from the centre.
+    sprite = sprites.get(key)
+    if sprite is None:
+        canvas = pygame.Surface((half_size * 2, half_size * 2), pygame.SRCALPHA)
+        paint(canvas, half_size, half_size, *args)
+        area = canvas.get_bounding_rect()
+        window = pygame.display.get_surface() is not None  # convert() needs a window
+        if pygame.mask.from_surface(canvas, 0).count() == pygame.mask.from_surface(canvas, 254).count():
+            # Every drawn pixel is opaque
+            surface = pygame.Surface(area.size)
+            surface.fill(SPRITE_KEY)
+            surface.blit(canvas, (0, 0), area)
+            surface.set_colorkey(SPRITE_KEY, pygame.RLEACCEL)
+            if window:
+                surface = surface.convert()
+        else:
+            surface = canvas.subsurface(area).copy()
+            if window:
+                surface = surface.convert_alpha()
+        sprite = sprites[key] = (surface, area.x - half_size, area.y - half_size)
+    return sprite
+
+def sprite_rect(sprite, x, y):
+    # Screen area a get_sprite() result covers when blitted centred on (x, y)
+    surface, left, top = sprite
+    return surface.get_rect(topleft=(int(x) + left, int(y) + top))
+
+# Glows, trails and halos are soft circles on alpha surfaces. They're cached
+# by size and colour, with fading alphas rounded to ALPHA_STEP and pulsing
+# sizes to 1/GLOW_SIZE_STEPS of their size, so an effect that fades or pulses
+# over a few hundred ms reuses a few dozen surfaces instead of allocating new
+# ones every frame. Least recently used ones are dropped once the cached pixels take up
+# more than GLOW_CACHE_BYTES; a full-screen beam glow alone is about 2 MB.
+GLOW_CACHE_BYTES = 16 * 1024 * 1024
+ALPHA_STEP = 8
+GLOW_SIZE_STEPS = 16
+glow_cache = OrderedDict()
+glow_cache_bytes = 0
+
+def cache_glow(key, surface):
+    global glow_cache_bytes
+    glow_cache[key] = surface
+    glow_cache_bytes += surface.get_pitch() * surface.get_height()
+    while glow_cache_bytes > GLOW_CACHE_BYTES and len(glow_cache) > 1:
+        _, old = glow_cache.popitem(last=False)
+        glow_cache_bytes -= old.get_pitch() * old.get_height()
+
+def get_glow(half_size, circles):
+    # circles: ((r, g, b, a), radius) pairs, drawn in order around the centre
+    key = (half_size, circles)
+    surface = glow_cache.get(key)
+    if surface is None:
+        surface = pygame.Surface((half_size * 2, half_size * 2), pygame.SRCALPHA)
+        for color, radius in circles:
+            pygame.draw.circle(surface, color, (half_size, half_size), radius)
+        cache_glow(key, surface)
+    else:
+        glow_cache.move_to_end(key)
+    return surface
+
+def get_line_glow(x0, y0, x1, y1, color, width):
+    # A thick line on an alpha surface only as big as the line's bounding
+    # rect. Returns the surface and the screen position to blit it at.
+    pad = width
+    left = min(x0, x1) - pad
+    top = min(y0, y1) - pad
+    key = ('line', x1 - x0, y1 - y0, color, width)
+    surface = glow_cache.get(key)
+    if surface is None:
+        surface = pygame.Surface((abs(x1 - x0) + pad * 2, abs(y1 - y0) + pad * 2), pygame.SRCALPHA)
+        pygame.draw.line(surface, color, (x0 - left, y0 - top), (x1 - left, y1 - top), width)
+        cache_glow(key, surface)
+    else:
+        glow_cache.move_to_end(key)
+    return surface, (left, top)
+
+def quantize_alpha(alpha):
+    return alpha - alpha % ALPHA_STEP
+
+def quantize_glow_size(size):
+    # Coarser steps for bigger glows, so any size pulses through a few surfaces
+    return size - size % max(1, size // GLOW_SIZE_STEPS)
+
+def tint_color(color, tint):
+    r, g, b = color
+    if tint == 'frozen':
+        # Blue-tinted version of the original color
+        return (max(0, r - 100), max(0, g - 50), min(255, b + 150))
+    if tint == 'slowed':
+        # Yellow-tinted version for slowed enemies
+        return (min(255, r + 50), min(255, g + 50), max(0, b - 50))
+    return color
+
 # Clock for controlling frame rate
 clock = pygame.time.Clock()
 FPS = 60
+FRAME_MS = 1000 / FPS  # Length of one frame in milliseconds
+
+# The simulation runs in fixed steps of SIM_STEP_MS, independent of how fast
+# frames are drawn. Velocities are in pixels per FRAME_MS, so a step moves
+# things by velocity * (step length / FRAME_MS).
+SIM_STEP_MS = FRAME_MS
+MAX_SIM_STEPS_PER_FRAME = 5  # Catch-up cap after a slow frame
+
+# Spawn positions, enemy speeds and wave sizes come from this generator. Draw
+# code (embers, sparkles) keeps using the global random module, so drawing
+# or not drawing frames can't change how a seeded game plays out.
+sim_random = random.Random()
+
+# Game clock. Cooldowns, freezes, slows, speed boosts, spawn timers and score
+# ticks all read this instead of pygame.time.get_ticks(), so game time stops
+# while paused and can be scaled or fast-forwarded. Headless runs step it by
+# hand, which is how a 320 second run to the General takes a few seconds.
+class GameClock:
+    def __init__(self, time_scale=1.0, step_ms=SIM_STEP_MS):
+        self.time = 0.0  # Game time in milliseconds
+        self.time_scale = time_scale  # 2.0 runs the game twice as fast
+        self.paused = False
+        self.step_ms = step_ms
+        self.accumulator = 0.0  # Real time banked but not yet simulated
+    
+    def now(self):
+        return int(self.time)
+    
+    def update(self, real_ms):
+        # Bank the real time that passed (scaled) and return how many fixed
+        # steps are due. Nothing is banked while paused. If we fell further
+        # behind than the catch-up cap, the rest of the backlog is dropped so
+        # a long stall doesn't turn into a burst of simulation.
+        if self.paused:
+            return 0
+        self.accumulator += real_ms * self.time_scale
+        steps = int(self.accumulator // self.step_ms)
+        if steps > MAX_SIM_STEPS_PER_FRAME:
+            steps = MAX_SIM_STEPS_PER_FRAME
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= steps * self.step_ms
+        return steps
+    
+    def advance(self, ms):
+        # Fast-forward by ms of game time (works even while paused)
+        self.time += ms
+        return self.now()
+    
+    def pause(self):
+        self.paused = True
+    
+    def resume(self):
+        self.paused = False
 
 # Game states
 class GameState(Enum):
@@ -52,8 +262,411 @@ class CharacterType(Enum):
     SAMURAI = 5
     SHOOTER = 6  # New character type
 
+# Keyboard state for runs without a real keyboard (headless simulation).
+# Indexed like pygame.key.get_pressed(): keys[pygame.K_LEFT] -> bool
+class KeyState:
+    def __init__(self, pressed=()):
+        self.pressed = frozenset(pressed)
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+NO_KEYS = KeyState()
+
+# The keys Character.move reads, as bits of a one-byte mask (for recordings)
+MOVE_KEYS = (
+    (pygame.K_LEFT, pygame.K_a),
+    (pygame.K_RIGHT, pygame.K_d),
+    (pygame.K_UP, pygame.K_w),
+    (pygame.K_DOWN, pygame.K_s),
+)
+
+def keys_to_mask(keys):
+    mask = 0
+    for bit, (arrow, letter) in enumerate(MOVE_KEYS):
+        if keys[arrow] or keys[letter]:
+            mask |= 1 << bit
+    return mask
+
+def mask_to_keys(mask):
+    return KeyState(arrow for bit, (arrow, letter) in enumerate(MOVE_KEYS) if mask & (1 << bit))
+
+# Mouse actions during play. Recorded with the game time they happened at
+class PlayerAction(IntEnum):
+    SHOOT = 0
+    AWAKEN = 1
+
+# Projectile kinds. Integer codes so the hot loops compare ints, and so the
+# NumPy store can keep the kind in an int8 column.
+class ProjectileKind(IntEnum):
+    BULLET = 0
+    LASER = 1
+    MAGIC = 2
+    SNIPER_BULLET = 3
+    FREEZE_WAVE = 4
+    SLOW_WAVE = 5
+    SWORD = 6
+    BEAM = 7
+    KNIGHT_ARC_WAVE = 8
+    SAMURAI_SLICE = 9
+    MAGIC_ORB = 10
+    BOUNCING_BALL = 11
+    BOUNCE_EFFECT = 12
+    EXPLOSION = 13
+    ENEMY_SHOT = 14
+
+# Projectile records. Every kind has the fields of Projectile; kinds that need
+# more get a subclass with its own slots. penetrate is fixed per kind, so it's
+# a class attribute rather than a slot.
+class Projectile:
+    __slots__ = ('kind', 'x', 'y', 'dx', 'dy', 'size', 'color', 'damage', 'angle', 'lifetime', 'seq', 'dead')
+    penetrate = False
+    
+    def __init__(self, kind, x, y, dx, dy, size, color, damage, angle=0, lifetime=0):
+        self.dead = False  # Set when used up; the record is dropped at the end of the tick
+        self.seq = 0  # Fire order, numbered by Character.add_projectile
+        self.kind = kind
+        self.x = x
+        self.y = y
+        self.dx = dx
+        self.dy = dy
+        self.size = size
+        self.color = color
+        self.damage = damage
+        self.angle = angle
+        self.lifetime = lifetime
+
+class SniperBullet(Projectile):
+    __slots__ = ('length',)
+    
+    def __init__(self, x, y, dx, dy, size, color, damage, angle=0, lifetime=0, length=0):
+        Projectile.__init__(self, ProjectileKind.SNIPER_BULLET, x, y, dx, dy, size, color, damage, angle, lifetime)
+        self.length = length
+
+class Sword(Projectile):
+    __slots__ = ('length',)
+    
+    def __init__(self, x, y, dx, dy, size, color, damage, angle=0, lifetime=0, length=0):
+        Projectile.__init__(self, ProjectileKind.SWORD, x, y, dx, dy, size, color, damage, angle, lifetime)
+        self.length = length
+
+class Beam(Projectile):
+    __slots__ = ('length', 'width', 'dir_x', 'dir_y', 'end_x', 'end_y')
+    penetrate = True
+    
+    def __init__(self, x, y, dx, dy, size, color, damage, angle=0, lifetime=0, length=0, width=0):
+        Projectile.__init__(self, ProjectileKind.BEAM, x, y, dx, dy, size, color, damage, angle, lifetime)
+        self.length = length
+        self.width = width
+        # The beam doesn't move, so its direction and far end are fixed
+        self.dir_x = math.cos(angle)
+        self.dir_y = math.sin(angle)
+        self.end_x = x + self.dir_x * length
+        self.end_y = y + self.dir_y * length
+
+class KnightArcWave(Projectile):
+    __slots__ = ('width', 'half_width', 'range', 'stage')
+    penetrate = True
+    
+    def __init__(self, x, y, dx, dy, size, color, damage, angle=0, lifetime=0, width=0, range=0, stage=0):
+        Projectile.__init__(self, ProjectileKind.KNIGHT_ARC_WAVE, x, y, dx, dy, size, color, damage, angle, lifetime)
+        self.width = width  # Arc width in degrees
+        self.half_width = math.radians(width / 2)  # Half the arc, in radians
+        self.range = range
+        self.stage = stage  # Current animation stage
+
+class SamuraiSlice(Projectile):
+    __slots__ = ('width', 'half_width')
+    penetrate = True
+    
+    def __init__(self, x, y, dx, dy, size, color, damage, angle=0, lifetime=0, width=0):
+        Projectile.__init__(self, ProjectileKind.SAMURAI_SLICE, x, y, dx, dy, size, color, damage, angle, lifetime)
+        self.width = width  # Arc width in degrees
+        self.half_width = math.radians(width / 2)  # Half the arc, in radians
+
+class MagicOrb(Projectile):
+    __slots__ = ()
+    penetrate = True
+    
+    def __init__(self, x, y, dx, dy, size, color, damage, angle=0, lifetime=0):
+        Projectile.__init__(self, ProjectileKind.MAGIC_ORB, x, y, dx, dy, size, color, damage, angle, lifetime)
+
+class BouncingBall(Projectile):
+    __slots__ = ('bounces',)
+    penetrate = True
+    
+    def __init__(self, x, y, dx, dy, size, color, damage, angle=0, lifetime=0, bounces=0):
+        Projectile.__init__(self, ProjectileKind.BOUNCING_BALL, x, y, dx, dy, size, color, damage, angle, lifetime)
+        self.bounces = bounces  # Number of bounces, for effects
+
+class Explosion(Projectile):
+    __slots__ = ('radius', 'frame', 'max_frames')
+    
+    def __init__(self, x, y, dx, dy, size, color, damage, angle=0, lifetime=0, radius=0, frame=0, max_frames=0):
+        Projectile.__init__(self, ProjectileKind.EXPLOSION, x, y, dx, dy, size, color, damage, angle, lifetime)
+        self.radius = radius
+        self.frame = frame
+        self.max_frames = max_frames
+
+class SlowWave(Projectile):
+    __slots__ = ('slow_duration', 'slow_factor')
+    
+    def __init__(self, x, y, dx, dy, size, color, damage, angle=0, lifetime=0, slow_duration=0, slow_factor=1.0):
+        Projectile.__init__(self, ProjectileKind.SLOW_WAVE, x, y, dx, dy, size, color, damage, angle, lifetime)
+        self.slow_duration = slow_duration
+        self.slow_factor = slow_factor
+
+# Free-list pools, so the steady stream of projectiles and enemy waves reuses
+# records instead of allocating new ones. acquire() re-runs __init__ on a
+# released record, which resets every field in place.
+class Pool:
+    def __init__(self, cls):
+        self.cls = cls
+        self.free = []
+        self.created = 0  # Records made because the free list was empty
+        self.reused = 0  # Records handed out from the free list
+    
+    def acquire(self, *args, **kwargs):
+        if self.free:
+            obj = self.free.pop()
+            obj.__init__(*args, **kwargs)
+            self.reused += 1
+            return obj
+        self.created += 1
+        return self.cls(*args, **kwargs)
+    
+    def blank(self):
+        # A record with no fields set, for restore_record() to fill in
+        if self.free:
+            self.reused += 1
+            return self.free.pop()
+        self.created += 1
+        return self.cls.__new__(self.cls)
+    
+    def release(self, obj):
+        # obj must no longer be referenced by the game
+        self.free.append(obj)
+    
+    def stats(self):
+        requests = self.created + self.reused
+        return {
+            'free': len(self.free),
+            'created': self.created,
+            'reused': self.reused,
+            'hit_rate': self.reused / requests if requests else 0.0,
+        }
+
+projectile_pools = {cls: Pool(cls) for cls in (Projectile, SniperBullet, Sword, Beam, KnightArcWave,
+                                               SamuraiSlice, MagicOrb, BouncingBall, Explosion, SlowWave)}
+
+def new_projectile(cls, **fields):
+    return projectile_pools[cls].acquire(**fields)
+
+def free_projectile(p):
+    projectile_pools[type(p)].release(p)
+
+# Game state snapshots (keyframes in recordings) are nested tuples of plain
+# values. A projectile record becomes (class code, *its slot values).
+RECORD_CLASSES = tuple(projectile_pools)  # Code -> record class
+RECORD_CODES = {cls: code for code, cls in enumerate(RECORD_CLASSES)}
+RECORD_FIELDS = {cls: tuple(name for klass in reversed(cls.__mro__) for name in getattr(klass, '__slots__', ())
+                            if name != 'dead')
+                 for cls in RECORD_CLASSES}
+RECORD_SEQ = 1 + RECORD_FIELDS[Projectile].index('seq')  # Same place in every class's row
+
+def plain(value):
+    # Snapshots only hold built-in types: enums become ints, NumPy scalars
+    # become Python numbers
+    kind = type(value)
+    if kind is float or kind is int or kind is bool or kind is tuple or value is None:
+        return value
+    if isinstance(value, IntEnum):
+        return int(value)
+    return value.item()
+
+def record_state(p):
+    return (RECORD_CODES[type(p)],) + tuple(plain(getattr(p, name)) for name in RECORD_FIELDS[type(p)])
+
+def record_seq(row):
+    return row[RECORD_SEQ]
+
+def restore_record(row):
+    cls = RECORD_CLASSES[row[0]]
+    p = projectile_pools[cls].blank()
+    p.dead = False
+    for name, value in zip(RECORD_FIELDS[cls], row[1:]):
+        setattr(p, name, value)
+    p.kind = PROJECTILE_KINDS[p.kind]
+    return p
+
+# Bullet-like player projectiles all move in a straight line, expire on a
+# timer or off screen, and nothing else. With NumPy, once there are
+# STORE_MIN_PROJECTILES player projectiles they move into a ProjectileStore
+# so moving and culling hundreds of them is a few array ops; below that the
+# store's fixed per-tick costs outweigh it and they stay records (see
+# Character.pick_bullet_storage). Everything else (swords, beams, arcs, ...)
+# always stays a record in a list.
+BULLET_KINDS = frozenset((ProjectileKind.BULLET, ProjectileKind.LASER, ProjectileKind.MAGIC,
+                          ProjectileKind.SNIPER_BULLET, ProjectileKind.FREEZE_WAVE,
+                          ProjectileKind.SLOW_WAVE))
+PROJECTILE_KINDS = tuple(ProjectileKind)  # Code -> ProjectileKind
+USE_NUMPY = np is not None  # Projectile store and enemy batch; --no-numpy turns this off
+STORE_MIN_PROJECTILES = 64  # Break-even on square_bullet_storm; back to records below half this
+AREA_MASK_MIN_ENEMIES = 120  # Below this the per-enemy area kernels are faster than the masks
+BATCH_MIN_ENEMIES = 16  # Enemies before they move as a batch (break-even is about 12); unbatched below half this
+STORE_RECORD_CLASSES = {ProjectileKind.SNIPER_BULLET: SniperBullet, ProjectileKind.SLOW_WAVE: SlowWave}
+
+class ProjectileStore:
+    # Structure-of-arrays storage: one NumPy column per field, rows 0..count-1
+    # are live projectiles, in fire order (seq). Colours are RGB rows; kind is
+    # a ProjectileKind code.
+    FLOAT_COLUMNS = ('x', 'y', 'dx', 'dy', 'lifetime', 'angle', 'slow_factor')
+    INT_COLUMNS = ('size', 'length', 'damage', 'slow_duration')
+    COLUMNS = FLOAT_COLUMNS + INT_COLUMNS + ('seq',)
+    
+    def __init__(self, capacity=64):
+        self.count = 0
+        for name in self.FLOAT_COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=np.float64))
+        for name in self.INT_COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=np.int32))
+        self.seq = np.zeros(capacity, dtype=np.int64)
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)
+        self.alive = np.zeros(capacity, dtype=bool)
+    
+    def __len__(self):
+        return self.count
+    
+    def grow(self):
+        capacity = len(self.x) * 2
+        for name in self.COLUMNS + ('kind', 'color', 'alive'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+    
+    def append(self, p):
+        # Takes the same record Character.shoot builds
+        if self.count == len(self.x):
+            self.grow()
+        i = self.count
+        self.x[i] = p.x
+        self.y[i] = p.y
+        self.dx[i] = p.dx
+        self.dy[i] = p.dy
+        self.lifetime[i] = p.lifetime
+        self.angle[i] = p.angle
+        self.slow_factor[i] = getattr(p, 'slow_factor', 1.0)
+        self.size[i] = p.size
+        self.length[i] = getattr(p, 'length', 0)
+        self.damage[i] = p.damage
+        self.slow_duration[i] = getattr(p, 'slow_duration', 0)
+        self.seq[i] = p.seq
+        self.kind[i] = p.kind
+        self.color[i] = p.color[:3]
+        self.alive[i] = True
+        self.count += 1
+    
+    def update(self, dt=SIM_STEP_MS):
+        # Move, age and cull every bullet at once
+        n = self.count
+        if n == 0:
+            return
+        step = dt / FRAME_MS
+        x, y = self.x[:n], self.y[:n]
+        x += self.dx[:n] * step
+        y += self.dy[:n] * step
+        
+        # Lifetime 0 means "no time limit, only leaves by going off screen"
+        lifetime = self.lifetime[:n]
+        timed = lifetime > 0
+        lifetime -= np.where(timed, dt, 0.0)
+        expired = timed & (lifetime <= 0)
+        on_screen = (x >= 0) & (x <= WIDTH) & (y >= 0) & (y <= HEIGHT)
+        self.alive[:n] &= on_screen & ~expired
+        self.compact()
+    
+    def clear(self):
+        self.alive[:self.count] = False
+        self.count = 0
+    
+    def kill(self, index):
+        # Removed at the next compact(), so indices stay valid until then
+        self.alive[index] = False
+    
+    def compact(self):
+        n = self.count
+        alive = self.alive[:n]
+        if alive.all():
+            return
+        keep = np.flatnonzero(alive)
+        k = len(keep)
+        for name in self.COLUMNS + ('kind', 'color'):
+            column = getattr(self, name)
+            column[:k] = column[keep]
+        self.alive[:k] = True
+        self.alive[k:n] = False
+        self.count = k
+    
+    def views(self):
+        # Views are built from plain-list copies of the columns, which is much
+        # faster than indexing NumPy arrays one element at a time. They are
+        # valid until the store is next updated, appended to or compacted.
+        n = self.count
+        kinds = PROJECTILE_KINDS
+        return list(map(ProjectileView, repeat(self), range(n),
+                        [kinds[code] for code in self.kind[:n].tolist()],
+                        [tuple(rgb) for rgb in self.color[:n].tolist()],
+                        *(getattr(self, name)[:n].tolist() for name in self.COLUMNS)))
+    
+    def record_states(self):
+        # Every row in record_state() form, as if it had stayed a record
+        n = self.count
+        rows = {name: getattr(self, name)[:n].tolist() for name in self.COLUMNS}
+        rows['kind'] = self.kind[:n].tolist()
+        rows['color'] = [tuple(rgb) for rgb in self.color[:n].tolist()]
+        states = []
+        for i in range(n):
+            cls = STORE_RECORD_CLASSES.get(rows['kind'][i], Projectile)
+            states.append((RECORD_CODES[cls],) + tuple(rows[name][i] for name in RECORD_FIELDS[cls]))
+        return states
+    
+    def insert_into(self, grid, items):
+        # Broad phase insert of every row, as the matching entry of items. The
+        # reach per kind must match insert_projectile().
+        n = self.count
+        if n == 0:
+            return
+        kind = self.kind[:n]
+        size = self.size[:n]
+        reach = size.astype(np.float64)
+        sniper = kind == ProjectileKind.SNIPER_BULLET
+        reach[sniper] = np.maximum(self.length[:n][sniper], size[sniper]) / 2
+        reach[kind == ProjectileKind.SLOW_WAVE] *= 1.5
+        grid.insert_circles(items, self.x[:n], self.y[:n], reach)
+
+class ProjectileView:
+    # A read-only copy of one row of a ProjectileStore, so collision and
+    # drawing code can treat stored bullets like any other projectile.
+    # Changes go through the store (remove_projectile kills the row).
+    __slots__ = ('store', 'index', 'kind', 'color') + ProjectileStore.COLUMNS
+    penetrate = False
+    
+    def __init__(self, store, index, kind, color, *columns):
+        self.store = store
+        self.index = index
+        self.kind = kind
+        self.color = color
+        for name, value in zip(ProjectileStore.COLUMNS, columns):
+            setattr(self, name, value)
+
 # Character class
 class Character:
+    # What changes during a game, as saved in snapshots (the rest follows from the type)
+    SNAPSHOT_FIELDS = ('x', 'y', 'speed', 'health', 'last_shot', 'last_awakening', 'freeze_end_time',
+                       'speed_boost_end_time', 'shots_fired')
+    
     def __init__(self, character_type):
         self.type = character_type
         self.x = WIDTH // 2
@@ -61,6 +674,10 @@ class Character:
         self.size = 30
         self.speed = 5
         self.projectiles = []
+        self.dead_projectiles = 0  # Listed projectiles flagged dead since the last compact
+        self.bullets = None  # bullet_store while it's in use, see pick_bullet_storage
+        self.bullet_store = ProjectileStore() if USE_NUMPY else None
+        self.shots_fired = 0  # Projectiles added so far; the next one's seq
         self.last_shot = 0
         self.cooldown = 0
         self.awakening_cooldown = 15000  # Default cooldown
@@ -114,101 +731,132 @@ class Character:
             self.color = LIGHT_GRAY
             self.speed = 4
             self.awakening_cooldown = 20000  # 20 seconds
+        
+        self.last_shot = -self.cooldown  # Allow a shot right at the start
 
-    def draw(self):
+    def draw(self, current_time):
+        x, y = int(self.x), int(self.y)
+        if self.type == CharacterType.SQUARE:
+            self.paint(screen, x, y)  # A single rect is no slower than a blit
+        else:
+            sprite, left, top = self.sprite()
+            screen.blit(sprite, (x + left, y + top))
+        
+        # Show speed boost effect if active
+        if self.type == CharacterType.ROBOT and current_time < self.speed_boost_end_time:
+            # Draw speed boost effect (yellow glow)
+            points = []
+            for i in range(6):
+                angle = 2 * math.pi * i / 6
+                points.append((
+                    x + int(self.size / 2 * math.cos(angle)),
+                    y + int(self.size / 2 * math.sin(angle))
+                ))
+            boost_surface = pygame.Surface((self.size*2, self.size*2), pygame.SRCALPHA)
+            for i in range(3):
+                alpha = 100 - i * 30
+                pygame.draw.polygon(boost_surface, (255, 255, 0, alpha), points)
+            screen.blit(boost_surface, (x - self.size, y - self.size))
+    
+    def sprite(self):
+        # The cached look draw() blits (every type but the square)
+        return get_sprite(('character', self.type, self.size), self.size + SPRITE_PAD, self.paint)
+    
+    def bounds(self):
+        # Screen area draw() covers
+        x, y = int(self.x), int(self.y)
         if self.type == CharacterType.SQUARE:
-            pygame.draw.rect(screen, self.color, (self.x - self.size // 2, self.y - self.size // 2, self.size, self.size))
+            rect = centered_rect(x, y, self.size // 2)
+        else:
+            rect = sprite_rect(self.sprite(), x, y)
+        if self.type == CharacterType.ROBOT:
+            rect.union_ip((x - self.size, y - self.size, self.size * 2, self.size * 2))  # Speed boost
+        return rect
+    
+    def paint(self, surface, x, y):
+        # Draws the character's look centred on (x, y)
+        if self.type == CharacterType.SQUARE:
+            pygame.draw.rect(surface, self.color, (x - self.size // 2, y - self.size // 2, self.size, self.size))
         elif self.type == CharacterType.KNIGHT:
             # Square knight with grid pattern
-            pygame.draw.rect(screen, self.color, (self.x - self.size // 2, self.y - self.size // 2, self.size, self.size))
+            pygame.draw.rect(surface, self.color, (x - self.size // 2, y - self.size // 2, self.size, self.size))
             # Grid pattern
             for i in range(3):
-                pygame.draw.line(screen, BLACK, 
-                                 (self.x - self.size // 2, self.y - self.size // 2 + i * self.size // 3), 
-                                 (self.x + self.size // 2, self.y - self.size // 2 + i * self.size // 3), 1)
-                pygame.draw.line(screen, BLACK, 
-                                 (self.x - self.size // 2 + i * self.size // 3, self.y - self.size // 2), 
-                                 (self.x - self.size // 2 + i * self.size // 3, self.y + self.size // 2), 1)
+                pygame.draw.line(surface, BLACK, 
+                                 (x - self.size // 2, y - self.size // 2 + i * self.size // 3), 
+                                 (x + self.size // 2, y - self.size // 2 + i * self.size // 3), 1)
+                pygame.draw.line(surface, BLACK, 
+                                 (x - self.size // 2 + i * self.size // 3, y - self.size // 2), 
+                                 (x - self.size // 2 + i * self.size // 3, y + self.size // 2), 1)
         elif self.type == CharacterType.ROBOT:
             # Hexagonal robot
             points = []
             for i in range(6):
                 angle = 2 * math.pi * i / 6
                 points.append((
-                    self.x + int(self.size / 2 * math.cos(angle)),
-                    self.y + int(self.size / 2 * math.sin(angle))
+                    x + int(self.size / 2 * math.cos(angle)),
+                    y + int(self.size / 2 * math.sin(angle))
                 ))
-            pygame.draw.polygon(screen, self.color, points)
+            pygame.draw.polygon(surface, self.color, points)
             # Robot eyes
-            pygame.draw.circle(screen, RED, (self.x - self.size // 4, self.y - self.size // 6), self.size // 8)
-            pygame.draw.circle(screen, RED, (self.x + self.size // 4, self.y - self.size // 6), self.size // 8)
-            
-            # Show speed boost effect if active
-            current_time = pygame.time.get_ticks()
-            if current_time < self.speed_boost_end_time:
-                # Draw speed boost effect (yellow glow)
-                boost_surface = pygame.Surface((self.size*2, self.size*2), pygame.SRCALPHA)
-                for i in range(3):
-                    alpha = 100 - i * 30
-                    pygame.draw.polygon(boost_surface, (255, 255, 0, alpha), points)
-                screen.blit(boost_surface, (self.x - self.size, self.y - self.size))
-                
+            pygame.draw.circle(surface, RED, (x - self.size // 4, y - self.size // 6), self.size // 8)
+            pygame.draw.circle(surface, RED, (x + self.size // 4, y - self.size // 6), self.size // 8)
         elif self.type == CharacterType.WIZARD:
             # Circular wizard
-            pygame.draw.circle(screen, self.color, (self.x, self.y), self.size // 2)
+            pygame.draw.circle(surface, self.color, (x, y), self.size // 2)
             # Wizard hat (green triangle with rounded tip)
             hat_points = [
-                (self.x, self.y - self.size - self.size // 3),  # Top point
-                (self.x - self.size // 2, self.y - self.size // 2),  # Bottom left
-                (self.x + self.size // 2, self.y - self.size // 2)   # Bottom right
+                (x, y - self.size - self.size // 3),  # Top point
+                (x - self.size // 2, y - self.size // 2),  # Bottom left
+                (x + self.size // 2, y - self.size // 2)   # Bottom right
             ]
-            pygame.draw.polygon(screen, GREEN, hat_points)
+            pygame.draw.polygon(surface, GREEN, hat_points)
             # Rounded tip for hat
-            pygame.draw.circle(screen, GREEN, (self.x, self.y - self.size - self.size // 3), self.size // 8)
+            pygame.draw.circle(surface, GREEN, (x, y - self.size - self.size // 3), self.size // 8)
         elif self.type == CharacterType.SNIPER:
             # Light green square with dark green suspenders
-            pygame.draw.rect(screen, LIGHT_GREEN, (self.x - self.size // 2, self.y - self.size // 2, self.size, self.size))
+            pygame.draw.rect(surface, LIGHT_GREEN, (x - self.size // 2, y - self.size // 2, self.size, self.size))
             # Dark green suspenders (vertical straps)
-            pygame.draw.line(screen, DARK_GREEN, 
-                            (self.x - self.size // 4, self.y - self.size // 2), 
-                            (self.x - self.size // 4, self.y + self.size // 2), 4)
-            pygame.draw.line(screen, DARK_GREEN, 
-                            (self.x + self.size // 4, self.y - self.size // 2), 
-                            (self.x + self.size // 4, self.y + self.size // 2), 4)
+            pygame.draw.line(surface, DARK_GREEN, 
+                            (x - self.size // 4, y - self.size // 2), 
+                            (x - self.size // 4, y + self.size // 2), 4)
+            pygame.draw.line(surface, DARK_GREEN, 
+                            (x + self.size // 4, y - self.size // 2), 
+                            (x + self.size // 4, y + self.size // 2), 4)
             # Horizontal connector
-            pygame.draw.line(screen, DARK_GREEN, 
-                            (self.x - self.size // 4, self.y), 
-                            (self.x + self.size // 4, self.y), 3)
+            pygame.draw.line(surface, DARK_GREEN, 
+                            (x - self.size // 4, y), 
+                            (x + self.size // 4, y), 3)
         elif self.type == CharacterType.SAMURAI:
             # Red octagon with dark red armor
             points = []
             for i in range(8):
                 angle = 2 * math.pi * i / 8
                 points.append((
-                    self.x + int(self.size / 2 * math.cos(angle)),
-                    self.y + int(self.size / 2 * math.sin(angle))
+                    x + int(self.size / 2 * math.cos(angle)),
+                    y + int(self.size / 2 * math.sin(angle))
                 ))
-            pygame.draw.polygon(screen, RED, points)
+            pygame.draw.polygon(surface, RED, points)
             
             # Dark red armor - create a smaller octagon inside
             armor_points = []
             for i in range(8):
                 angle = 2 * math.pi * i / 8
                 armor_points.append((
-                    self.x + int(self.size / 3 * math.cos(angle)),
-                    self.y + int(self.size / 3 * math.sin(angle))
+                    x + int(self.size / 3 * math.cos(angle)),
+                    y + int(self.size / 3 * math.sin(angle))
                 ))
-            pygame.draw.polygon(screen, DARK_RED, armor_points)
+            pygame.draw.polygon(surface, DARK_RED, armor_points)
         elif self.type == CharacterType.SHOOTER:
             # Light gray pentagon with dark brown jacket
             points = []
             for i in range(5):
                 angle = 2 * math.pi * i / 5 - math.pi/2  # Start from top point
                 points.append((
-                    self.x + int(self.size / 2 * math.cos(angle)),
-                    self.y + int(self.size / 2 * math.sin(angle))
+                    x + int(self.size / 2 * math.cos(angle)),
+                    y + int(self.size / 2 * math.sin(angle))
                 ))
-            pygame.draw.polygon(screen, LIGHT_GRAY, points)
+            pygame.draw.polygon(surface, LIGHT_GRAY, points)
             
             # Dark brown jacket (drawing a smaller pentagon inside)
             jacket_points = []
@@ -217,21 +865,20 @@ class Character:
                 # Make jacket a bit larger on top to look like a jacket
                 radius = self.size / 3 if i == 0 else self.size / 4
                 jacket_points.append((
-                    self.x + int(radius * math.cos(angle)),
-                    self.y + int(radius * math.sin(angle))
+                    x + int(radius * math.cos(angle)),
+                    y + int(radius * math.sin(angle))
                 ))
-            pygame.draw.polygon(screen, DARK_BROWN, jacket_points)
+            pygame.draw.polygon(surface, DARK_BROWN, jacket_points)
             
             # Add collar detail
-            collar_left = (self.x - self.size // 6, self.y - self.size // 6)
-            collar_right = (self.x + self.size // 6, self.y - self.size // 6)
-            collar_top = (self.x, self.y - self.size // 3)
-            pygame.draw.line(screen, LIGHT_GRAY, collar_left, collar_top, 2)
-            pygame.draw.line(screen, LIGHT_GRAY, collar_right, collar_top, 2)
+            collar_left = (x - self.size // 6, y - self.size // 6)
+            collar_right = (x + self.size // 6, y - self.size // 6)
+            collar_top = (x, y - self.size // 3)
+            pygame.draw.line(surface, LIGHT_GRAY, collar_left, collar_top, 2)
+            pygame.draw.line(surface, LIGHT_GRAY, collar_right, collar_top, 2)
             
-    def move(self, keys):
+    def move(self, keys, current_time, step=1.0):
         # Check if robot has speed boost
-        current_time = pygame.time.get_ticks()
         if self.type == CharacterType.ROBOT and current_time < self.speed_boost_end_time:
             current_speed = self.speed  # Already doubled in awakening method
         else:
@@ -239,6 +886,7 @@ class Character:
             if self.type == CharacterType.ROBOT and self.speed != self.normal_speed and current_time >= self.speed_boost_end_time:
                 self.speed = self.normal_speed
             current_speed = self.speed
+        current_speed *= step  # Scale by simulation step length
             
         if keys[pygame.K_LEFT] or keys[pygame.K_a]:
             self.x -= current_speed
@@ -253,8 +901,7 @@ class Character:
         self.x = max(self.size // 2, min(WIDTH - self.size // 2, self.x))
         self.y = max(self.size // 2, min(HEIGHT - self.size // 2, self.y))
 
-    def shoot(self, target_x, target_y):
-        current_time = pygame.time.get_ticks()
+    def shoot(self, target_x, target_y, current_time):
         if current_time - self.last_shot > self.cooldown:
             self.last_shot = current_time
             
@@ -268,13 +915,14 @@ class Character:
             
             # Different projectile behaviors per character
             if self.type == CharacterType.SQUARE:
-                self.projectiles.append({
-                    'x': self.x, 'y': self.y,
-                    'dx': dx * 8, 'dy': dy * 8,
-                    'size': 10, 'color': GREEN,
-                    'damage': 1, 'type': 'bullet',
-                    'angle': 0, 'lifetime': 0
-                })
+                self.add_projectile(new_projectile(Projectile,
+                    kind=ProjectileKind.BULLET,
+                    x=self.x, y=self.y,
+                    dx=dx * 8, dy=dy * 8,
+                    size=10, color=GREEN,
+                    damage=1,
+                    angle=0, lifetime=0
+                ))
             elif self.type == CharacterType.KNIGHT:
                 # Sword attack - rectangle sword attack in direction of mouse
                 angle = math.atan2(dy, dx)
@@ -285,46 +933,47 @@ class Character:
                 sword_center_x = self.x + (self.size // 2 + sword_length // 2) * dx
                 sword_center_y = self.y + (self.size // 2 + sword_length // 2) * dy
                 
-                self.projectiles.append({
-                    'x': sword_center_x, 'y': sword_center_y,
-                    'dx': dx, 'dy': dy,
-                    'size': sword_width,
-                    'length': sword_length,
-                    'color': GRAY,  # Gray color for sword
-                    'damage': 2,
-                    'type': 'sword',
-                    'angle': angle, 'lifetime': 200
-                })
+                self.add_projectile(new_projectile(Sword,
+                    x=sword_center_x, y=sword_center_y,
+                    dx=dx, dy=dy,
+                    size=sword_width,
+                    length=sword_length,
+                    color=GRAY,  # Gray color for sword
+                    damage=2,
+                    angle=angle, lifetime=200
+                ))
             elif self.type == CharacterType.ROBOT:
-                self.projectiles.append({
-                    'x': self.x, 'y': self.y,
-                    'dx': dx * 12, 'dy': dy * 12,
-                    'size': 7, 'color': RED,
-                    'damage': 1, 'type': 'laser',
-                    'angle': 0, 'lifetime': 0
-                })
+                self.add_projectile(new_projectile(Projectile,
+                    kind=ProjectileKind.LASER,
+                    x=self.x, y=self.y,
+                    dx=dx * 12, dy=dy * 12,
+                    size=7, color=RED,
+                    damage=1,
+                    angle=0, lifetime=0
+                ))
             elif self.type == CharacterType.WIZARD:
-                self.projectiles.append({
-                    'x': self.x, 'y': self.y,
-                    'dx': dx * 6, 'dy': dy * 6,
-                    'size': 15, 'color': LIGHT_GREEN,
-                    'damage': 2, 'type': 'magic',
-                    'angle': 0, 'lifetime': 0
-                })
+                self.add_projectile(new_projectile(Projectile,
+                    kind=ProjectileKind.MAGIC,
+                    x=self.x, y=self.y,
+                    dx=dx * 6, dy=dy * 6,
+                    size=15, color=LIGHT_GREEN,
+                    damage=2,
+                    angle=0, lifetime=0
+                ))
             elif self.type == CharacterType.SNIPER:
                 # Updated sniper to shoot rectangular gray bullets
                 bullet_length = 16
                 bullet_width = 6
                 
-                self.projectiles.append({
-                    'x': self.x, 'y': self.y,
-                    'dx': dx * 15, 'dy': dy * 15,  # Fast bullets
-                    'size': bullet_width,
-                    'length': bullet_length,
-                    'color': LIGHT_GRAY,
-                    'damage': 3, 'type': 'sniper_bullet',
-                    'angle': angle, 'lifetime': 0
-                })
+                self.add_projectile(new_projectile(SniperBullet,
+                    x=self.x, y=self.y,
+                    dx=dx * 15, dy=dy * 15,  # Fast bullets
+                    size=bullet_width,
+                    length=bullet_length,
+                    color=LIGHT_GRAY,
+                    damage=3,
+                    angle=angle, lifetime=0
+                ))
             elif self.type == CharacterType.SAMURAI:
                 # Updated Samurai to attack in mouse direction
                 slice_width = 160  # 160 degree arc
@@ -334,55 +983,56 @@ class Character:
                 attack_x = self.x + dx * attack_dist
                 attack_y = self.y + dy * attack_dist
                 
-                self.projectiles.append({
-                    'x': attack_x, 'y': attack_y,
-                    'dx': 0, 'dy': 0,  # Doesn't move
-                    'size': 60, 'color': RED,
-                    'damage': 1, 'type': 'samurai_slice',
-                    'angle': angle, 'lifetime': 90,
-                    'width': slice_width,
-                    'penetrate': True
-                })
+                self.add_projectile(new_projectile(SamuraiSlice,
+                    x=attack_x, y=attack_y,
+                    dx=0, dy=0,  # Doesn't move
+                    size=60, color=RED,
+                    damage=1,
+                    angle=angle, lifetime=90,
+                    width=slice_width,
+                ))
             elif self.type == CharacterType.SHOOTER:
                 # Shooter: Triple shot in slightly different directions
                 base_speed = 9
                 spread_angle = 15  # degrees
                 
                 # Central bullet - straight ahead
-                self.projectiles.append({
-                    'x': self.x, 'y': self.y,
-                    'dx': dx * base_speed, 'dy': dy * base_speed,
-                    'size': 8, 'color': YELLOW,
-                    'damage': 1, 'type': 'bullet',
-                    'angle': angle, 'lifetime': 0
-                })
+                self.add_projectile(new_projectile(Projectile,
+                    kind=ProjectileKind.BULLET,
+                    x=self.x, y=self.y,
+                    dx=dx * base_speed, dy=dy * base_speed,
+                    size=8, color=YELLOW,
+                    damage=1,
+                    angle=angle, lifetime=0
+                ))
                 
                 # Left bullet - angled slightly left
                 left_angle = angle - math.radians(spread_angle)
                 left_dx = math.cos(left_angle)
                 left_dy = math.sin(left_angle)
-                self.projectiles.append({
-                    'x': self.x, 'y': self.y,
-                    'dx': left_dx * base_speed, 'dy': left_dy * base_speed,
-                    'size': 8, 'color': YELLOW,
-                    'damage': 1, 'type': 'bullet',
-                    'angle': left_angle, 'lifetime': 0
-                })
+                self.add_projectile(new_projectile(Projectile,
+                    kind=ProjectileKind.BULLET,
+                    x=self.x, y=self.y,
+                    dx=left_dx * base_speed, dy=left_dy * base_speed,
+                    size=8, color=YELLOW,
+                    damage=1,
+                    angle=left_angle, lifetime=0
+                ))
                 
                 # Right bullet - angled slightly right
                 right_angle = angle + math.radians(spread_angle)
                 right_dx = math.cos(right_angle)
                 right_dy = math.sin(right_angle)
-                self.projectiles.append({
-                    'x': self.x, 'y': self.y,
-                    'dx': right_dx * base_speed, 'dy': right_dy * base_speed,
-                    'size': 8, 'color': YELLOW,
-                    'damage': 1, 'type': 'bullet',
-                    'angle': right_angle, 'lifetime': 0
-                })
-
-    def awakening(self, target_x, target_y):
-        current_time = pygame.time.get_ticks()
+                self.add_projectile(new_projectile(Projectile,
+                    kind=ProjectileKind.BULLET,
+                    x=self.x, y=self.y,
+                    dx=right_dx * base_speed, dy=right_dy * base_speed,
+                    size=8, color=YELLOW,
+                    damage=1,
+                    angle=right_angle, lifetime=0
+                ))
+
+    def awakening(self, target_x, target_y, current_time):
         if current_time - self.last_awakening > self.awakening_cooldown:
             self.last_awakening = current_time
             
@@ -401,44 +1051,43 @@ class Character:
                     bullet_angle = 2 * math.pi * i / 25
                     bullet_dx = math.cos(bullet_angle)
                     bullet_dy = math.sin(bullet_angle)
-                    self.projectiles.append({
-                        'x': self.x, 'y': self.y,
-                        'dx': bullet_dx * 8, 'dy': bullet_dy * 8,
-                        'size': 10, 'color': BLUE,
-                        'damage': 1, 'type': 'bullet',
-                        'angle': 0, 'lifetime': 0
-                    })
+                    self.add_projectile(new_projectile(Projectile,
+                        kind=ProjectileKind.BULLET,
+                        x=self.x, y=self.y,
+                        dx=bullet_dx * 8, dy=bullet_dy * 8,
+                        size=10, color=BLUE,
+                        damage=1,
+                        angle=0, lifetime=0
+                    ))
             
             elif self.type == CharacterType.KNIGHT:
                 # Updated Knight awakening:
                 # - Now mouse-targeted (uses target_x, target_y)
                 # - 2x larger range (900 instead of 450)
                 # - Passes through enemies (penetrate: True)
-                self.projectiles.append({
-                    'x': self.x, 'y': self.y,
-                    'dx': dx * 10, 'dy': dy * 10,
-                    'size': 20, 'color': BLUE,
-                    'damage': 5, 'type': 'knight_arc_wave',
-                    'angle': angle, 'lifetime': 500,
-                    'width': 120,  # Arc width
-                    'range': 900,  # 2x larger range (450 * 2)
-                    'stage': 0,    # Current animation stage
-                    'penetrate': True  # Passes through enemies
-                })
+                self.add_projectile(new_projectile(KnightArcWave,
+                    x=self.x, y=self.y,
+                    dx=dx * 10, dy=dy * 10,
+                    size=20, color=BLUE,
+                    damage=5,
+                    angle=angle, lifetime=500,
+                    width=120,  # Arc width
+                    range=900,  # 2x larger range (450 * 2)
+                    stage=0,    # Current animation stage
+                ))
             
             elif self.type == CharacterType.ROBOT:
                 # Robot: Long red beam that passes through enemies, deals 5 damage
-                self.projectiles.append({
-                    'x': self.x, 'y': self.y,
-                    'dx': dx * 15, 'dy': dy * 15,
-                    'size': 15, 'color': RED,
-                    'damage': 5, 'type': 'beam',
-                    'angle': angle,
-                    'lifetime': 2000,
-                    'length': 300,
-                    'width': 20,
-                    'penetrate': True
-                })
+                self.add_projectile(new_projectile(Beam,
+                    x=self.x, y=self.y,
+                    dx=dx * 15, dy=dy * 15,
+                    size=15, color=RED,
+                    damage=5,
+                    angle=angle,
+                    lifetime=2000,
+                    length=300,
+                    width=20,
+                ))
                 
                 # Apply speed boost
                 self.speed = self.normal_speed * 2  # Double speed
@@ -446,30 +1095,27 @@ class Character:
             
             elif self.type == CharacterType.WIZARD:
                 # Wizard: 2x larger range, passes through enemies
-                self.projectiles.append({
-                    'x': self.x, 'y': self.y,
-                    'dx': dx * 4, 'dy': dy * 4,
-                    'size': 60,  # 2x larger (30 * 2)
-                    'color': GREEN,
-                    'damage': 3, 'type': 'magic_orb',
-                    'angle': 0, 'lifetime': 2000,
-                    'penetrate': True
-                })
+                self.add_projectile(new_projectile(MagicOrb,
+                    x=self.x, y=self.y,
+                    dx=dx * 4, dy=dy * 4,
+                    size=60,  # 2x larger (30 * 2)
+                    color=GREEN,
+                    damage=3,
+                    angle=0, lifetime=2000,
+                ))
             
             elif self.type == CharacterType.SNIPER:
                 # NEW Sniper awakening: Bouncing blue ball that bounces for 5 seconds
                 # Choose initial direction (toward cursor)
-                self.projectiles.append({
-                    'x': self.x, 'y': self.y,
-                    'dx': dx * 20, 'dy': dy * 20,  # Slow moving ball (for bouncing)
-                    'size': 100, 'color': BLUE,
-                    'damage': 3,  # 3 damage as requested
-                    'type': 'bouncing_ball',
-                    'angle': angle, 
-                    'lifetime': 6000,  # 6 seconds lifetime
-                    'bounces': 0,  # Track number of bounces for effects
-                    'penetrate': True  # Can hit multiple enemies
-                })
+                self.add_projectile(new_projectile(BouncingBall,
+                    x=self.x, y=self.y,
+                    dx=dx * 20, dy=dy * 20,  # Slow moving ball (for bouncing)
+                    size=100, color=BLUE,
+                    damage=3,  # 3 damage as requested
+                    angle=angle, 
+                    lifetime=6000,  # 6 seconds lifetime
+                    bounces=0,  # Track number of bounces for effects
+                ))
                 
             elif self.type == CharacterType.SAMURAI:
                 # Samurai: Freeze all enemies for 5 seconds
@@ -479,14 +1125,15 @@ class Character:
                 wave_points = 12
                 for i in range(wave_points):
                     wave_angle = 2 * math.pi * i / wave_points
-                    self.projectiles.append({
-                        'x': self.x, 'y': self.y,
-                        'dx': math.cos(wave_angle) * 15,
-                        'dy': math.sin(wave_angle) * 15,
-                        'size': 25, 'color': (255, 100, 100, 150),
-                        'damage': 0, 'type': 'freeze_wave',
-                        'angle': wave_angle, 'lifetime': 800,
-                    })
+                    self.add_projectile(new_projectile(Projectile,
+                        kind=ProjectileKind.FREEZE_WAVE,
+                        x=self.x, y=self.y,
+                        dx=math.cos(wave_angle) * 15,
+                        dy=math.sin(wave_angle) * 15,
+                        size=25, color=(255, 100, 100, 150),
+                        damage=0,
+                        angle=wave_angle, lifetime=800,
+                    ))
                     
             elif self.type == CharacterType.SHOOTER:
                 # Shooter's awakening: 360-degree wave that slows enemies and does damage
@@ -496,248 +1143,346 @@ class Character:
                 wave_points = 36  # More points for smoother circle
                 for i in range(wave_points):
                     wave_angle = 2 * math.pi * i / wave_points
-                    self.projectiles.append({
-                        'x': self.x, 'y': self.y,
-                        'dx': math.cos(wave_angle) * 10,  # Fast moving wave
-                        'dy': math.sin(wave_angle) * 10,
-                        'size': 30, 'color': (255, 200, 0, 180),  # Golden color
-                        'damage': 1, 'type': 'slow_wave',  # Does 1 damage and slows
-                        'angle': wave_angle, 'lifetime': 1000,
-                        'slow_duration': 3000,  # 3 seconds slow effect
-                        'slow_factor': 0.5,  # Slows to half speed
-                    })
-
-    def update_projectiles(self):
-        current_time = pygame.time.get_ticks()
+                    self.add_projectile(new_projectile(SlowWave,
+                        x=self.x, y=self.y,
+                        dx=math.cos(wave_angle) * 10,  # Fast moving wave
+                        dy=math.sin(wave_angle) * 10,
+                        size=30, color=(255, 200, 0, 180),  # Golden color
+                        damage=1,  # Does 1 damage and slows
+                        angle=wave_angle, lifetime=1000,
+                        slow_duration=3000,  # 3 seconds slow effect
+                        slow_factor=0.5,  # Slows to half speed
+                    ))
+
+    def add_projectile(self, p):
+        # Number it in fire order, which decides which projectile hits an
+        # enemy first when several could
+        p.seq = self.shots_fired
+        self.shots_fired += 1
+        self.place_projectile(p)
+    
+    def place_projectile(self, p):
+        # Projectiles must be placed in seq order
+        if self.bullets is not None and p.kind in BULLET_KINDS:
+            self.bullets.append(p)
+            free_projectile(p)  # The store copied it
+        else:
+            self.projectiles.append(p)
+    
+    def pick_bullet_storage(self):
+        # Move the bullet kinds into the store once there are enough of them
+        # for the array ops to pay off, and back into records once there
+        # aren't. The gap between the two thresholds stops it flipping every
+        # tick. Fire order, and so the outcome, is the same either way.
+        bullets = self.bullets
+        if bullets is None:
+            if len(self.projectiles) < STORE_MIN_PROJECTILES:
+                return
+            self.bullets = bullets = self.bullet_store
+            listed = []
+            for p in self.projectiles:
+                if p.kind in BULLET_KINDS:
+                    bullets.append(p)
+                    free_projectile(p)
+                else:
+                    listed.append(p)
+            self.projectiles = listed
+        elif bullets.count < STORE_MIN_PROJECTILES // 2:
+            records = [restore_record(row) for row in bullets.record_states()]
+            bullets.clear()
+            self.bullets = None
+            self.projectiles = sorted(self.projectiles + records, key=lambda p: p.seq)
+    
+    def all_projectiles(self):
+        # Listed projectiles and views onto the stored bullets, in fire order
+        return self.ordered_projectiles()[0]
+    
+    def ordered_projectiles(self):
+        # all_projectiles(), plus where in it the listed projectiles and the
+        # stored bullets went. Both are already in seq order, so they merge
+        # with two searchsorted calls.
+        listed = self.projectiles
+        bullets = self.bullets
+        if bullets is None or bullets.count == 0:
+            return listed, range(len(listed)), ()
+        views = bullets.views()
+        if not listed:
+            return views, (), range(len(views))
+        listed_seq = np.array([p.seq for p in listed], dtype=np.int64)
+        stored_seq = bullets.seq[:bullets.count]
+        listed_at = (np.arange(len(listed)) + np.searchsorted(stored_seq, listed_seq)).tolist()
+        stored_at = (np.arange(len(views)) + np.searchsorted(listed_seq, stored_seq)).tolist()
+        projectiles = [None] * (len(listed) + len(views))
+        for index, p in zip(listed_at, listed):
+            projectiles[index] = p
+        for index, view in zip(stored_at, views):
+            projectiles[index] = view
+        return projectiles, listed_at, stored_at
+    
+    def remove_projectile(self, p):
+        if isinstance(p, ProjectileView):
+            p.store.kill(p.index)  # Dropped at the next compact()
+        else:
+            p.dead = True  # Dropped at the next compact_projectiles()
+            self.dead_projectiles += 1
+    
+    def clear_projectiles(self):
+        # Drop every projectile (before a snapshot restore)
+        for p in self.projectiles:
+            free_projectile(p)
+        self.projectiles.clear()
+        self.dead_projectiles = 0
+        if self.bullets is not None:
+            self.bullets.clear()
+    
+    def compact_projectiles(self):
+        # Drop everything removed since the last call in one pass
+        if self.bullets is not None:
+            self.bullets.compact()
+        if not self.dead_projectiles:
+            return
+        kept = []
+        for p in self.projectiles:
+            if p.dead:
+                free_projectile(p)
+            else:
+                kept.append(p)
+        self.projectiles = kept
+        self.dead_projectiles = 0
+    
+    def update_projectiles(self, dt=SIM_STEP_MS):
+        step = dt / FRAME_MS  # Velocities are per frame, lifetimes in ms
+        if self.bullet_store is not None:
+            self.pick_bullet_storage()
+        if self.bullets is not None:
+            self.bullets.update(dt)
         new_projectiles = []
         for p in self.projectiles:
             # For normal projectiles and some awakening projectiles
-            if p['type'] in ['bullet', 'laser', 'magic', 'arc_segment', 'magic_orb', 'freeze_wave', 'slow_wave']:
-                p['x'] += p['dx']
-                p['y'] += p['dy']
+            if p.kind in (ProjectileKind.BULLET, ProjectileKind.LASER, ProjectileKind.MAGIC, ProjectileKind.MAGIC_ORB, ProjectileKind.FREEZE_WAVE, ProjectileKind.SLOW_WAVE):
+                p.x += p.dx * step
+                p.y += p.dy * step
                 
                 # Check lifetime for timed projectiles
-                if 'lifetime' in p and p['lifetime'] > 0:
-                    p['lifetime'] -= 16  # Decrease lifetime
-                    if p['lifetime'] <= 0:
+                if p.lifetime > 0:
+                    p.lifetime -= dt  # Decrease lifetime
+                    if p.lifetime <= 0:
                         continue  # Skip adding this projectile to new list
                 
                 # Remove if out of bounds, unless it's a beam that's still active
-                if 0 <= p['x'] <= WIDTH and 0 <= p['y'] <= HEIGHT:
+                if 0 <= p.x <= WIDTH and 0 <= p.y <= HEIGHT:
                     new_projectiles.append(p)
             
             # For bouncing ball (sniper awakening)
-            elif p['type'] == 'bouncing_ball':
+            elif p.kind == ProjectileKind.BOUNCING_BALL:
                 # Update position
-                p['x'] += p['dx']
-                p['y'] += p['dy']
+                p.x += p.dx * step
+                p.y += p.dy * step
                 
                 # Check for collisions with walls and bounce
                 hit_wall = False
                 
                 # Left/right walls
-                if p['x'] - p['size'] < 0:
-                    p['x'] = p['size']  # Place at wall
-                    p['dx'] = -p['dx']  # Reverse x direction
+                if p.x - p.size < 0:
+                    p.x = p.size  # Place at wall
+                    p.dx = -p.dx  # Reverse x direction
                     hit_wall = True
-                elif p['x'] + p['size'] > WIDTH:
-                    p['x'] = WIDTH - p['size']  # Place at wall
-                    p['dx'] = -p['dx']  # Reverse x direction
+                elif p.x + p.size > WIDTH:
+                    p.x = WIDTH - p.size  # Place at wall
+                    p.dx = -p.dx  # Reverse x direction
                     hit_wall = True
                     
                 # Top/bottom walls
-                if p['y'] - p['size'] < 0:
-                    p['y'] = p['size']  # Place at wall
-                    p['dy'] = -p['dy']  # Reverse y direction
+                if p.y - p.size < 0:
+                    p.y = p.size  # Place at wall
+                    p.dy = -p.dy  # Reverse y direction
                     hit_wall = True
-                elif p['y'] + p['size'] > HEIGHT:
-                    p['y'] = HEIGHT - p['size']  # Place at wall
-                    p['dy'] = -p['dy']  # Reverse y direction
+                elif p.y + p.size > HEIGHT:
+                    p.y = HEIGHT - p.size  # Place at wall
+                    p.dy = -p.dy  # Reverse y direction
                     hit_wall = True
                 
                 if hit_wall:
-                    p['bounces'] += 1
+                    p.bounces += 1
                     # Create bounce effect
-                    self.projectiles.append({
-                        'x': p['x'], 'y': p['y'],
-                        'dx': 0, 'dy': 0,
-                        'size': p['size'] * 1.5,
-                        'color': (100, 150, 255, 150),  # Light blue with transparency
-                        'damage': 0, 'type': 'bounce_effect',
-                        'angle': 0, 'lifetime': 200  # Short lifetime for visual effect
-                    })
+                    self.add_projectile(new_projectile(Projectile,
+                        kind=ProjectileKind.BOUNCE_EFFECT,
+                        x=p.x, y=p.y,
+                        dx=0, dy=0,
+                        size=p.size * 1.5,
+                        color=(100, 150, 255, 150),  # Light blue with transparency
+                        damage=0,
+                        angle=0, lifetime=200  # Short lifetime for visual effect
+                    ))
                 
                 # Update lifetime
-                p['lifetime'] -= 16
-                if p['lifetime'] > 0:
+                p.lifetime -= dt
+                if p.lifetime > 0:
                     new_projectiles.append(p)
             
             # For bounce effect (visual only)
-            elif p['type'] == 'bounce_effect':
-                p['lifetime'] -= 16
-                if p['lifetime'] > 0:
+            elif p.kind == ProjectileKind.BOUNCE_EFFECT:
+                p.lifetime -= dt
+                if p.lifetime > 0:
                     new_projectiles.append(p)
                 
             # For sword and sniper projectiles
-            elif p['type'] in ['sword', 'sniper_bullet']:
-                if p['type'] == 'sniper_bullet':
-                    p['x'] += p['dx']
-                    p['y'] += p['dy']
+            elif p.kind in (ProjectileKind.SWORD, ProjectileKind.SNIPER_BULLET):
+                if p.kind == ProjectileKind.SNIPER_BULLET:
+                    p.x += p.dx * step
+                    p.y += p.dy * step
                     
                     # Remove if out of bounds
-                    if not (0 <= p['x'] <= WIDTH and 0 <= p['y'] <= HEIGHT):
+                    if not (0 <= p.x <= WIDTH and 0 <= p.y <= HEIGHT):
                         continue
                 
-                if 'lifetime' in p and p['lifetime'] > 0:
-                    p['lifetime'] -= 16  # Decrease lifetime
-                    if p['lifetime'] <= 0:
+                if p.lifetime > 0:
+                    p.lifetime -= dt  # Decrease lifetime
+                    if p.lifetime <= 0:
                         continue
                 
                 new_projectiles.append(p)
             
             # For beam projectiles (robot awakening)
-            elif p['type'] == 'beam':
-                p['lifetime'] -= 16  # Decrease lifetime
-                if p['lifetime'] > 0:
+            elif p.kind == ProjectileKind.BEAM:
+                p.lifetime -= dt  # Decrease lifetime
+                if p.lifetime > 0:
                     new_projectiles.append(p)
                     
             # For knight's arc wave
-            elif p['type'] == 'knight_arc_wave':
-                p['lifetime'] -= 16  # Decrease lifetime
-                if p['lifetime'] > 0:
+            elif p.kind == ProjectileKind.KNIGHT_ARC_WAVE:
+                p.lifetime -= dt  # Decrease lifetime
+                if p.lifetime > 0:
                     # Move the wave outward
-                    p['stage'] += 1
+                    p.stage += step
                     new_projectiles.append(p)
                     
             # For samurai slice
-            elif p['type'] == 'samurai_slice':
-                p['lifetime'] -= 16  # Decrease lifetime
-                if p['lifetime'] > 0:
+            elif p.kind == ProjectileKind.SAMURAI_SLICE:
+                p.lifetime -= dt  # Decrease lifetime
+                if p.lifetime > 0:
                     new_projectiles.append(p)
         
+        if len(new_projectiles) < len(self.projectiles):
+            # Hand expired records back to their pools
+            kept = set(new_projectiles)
+            for p in self.projectiles:
+                if p not in kept:
+                    free_projectile(p)
         self.projectiles = new_projectiles
     
     def create_explosion(self, x, y, radius, damage):
         # Create explosion visual effect with specified radius (12% of screen)
-        self.projectiles.append({
-            'x': x, 'y': y,
-            'dx': 0, 'dy': 0,
-            'size': radius, 'color': ORANGE,  # Orange color for explosion
-            'damage': damage, 'type': 'explosion',
-            'angle': 0, 'lifetime': 300,  # Short lifetime for explosion visual
-            'radius': radius,
-            'frame': 0,  # Animation frame
-            'max_frames': 10  # Total animation frames
-        })
+        self.add_projectile(new_projectile(Explosion,
+            x=x, y=y,
+            dx=0, dy=0,
+            size=radius, color=ORANGE,  # Orange color for explosion
+            damage=damage,
+            angle=0, lifetime=300,  # Short lifetime for explosion visual
+            radius=radius,
+            frame=0,  # Animation frame
+            max_frames=10  # Total animation frames
+        ))
 
-    def draw_projectiles(self):
-        for p in self.projectiles:
-            if p['type'] in ['bullet', 'magic', 'arc_segment']:
-                pygame.draw.circle(screen, p['color'], (int(p['x']), int(p['y'])), p['size'])
+    def draw_projectiles(self, current_time):
+        for p in self.all_projectiles():
+            if p.kind in (ProjectileKind.BULLET, ProjectileKind.MAGIC):
+                pygame.draw.circle(screen, p.color, (int(p.x), int(p.y)), p.size)
             
-            elif p['type'] == 'magic_orb':  # Wizard's awakening projectile
-                pygame.draw.circle(screen, p['color'], (int(p['x']), int(p['y'])), p['size'])
+            elif p.kind == ProjectileKind.MAGIC_ORB:  # Wizard's awakening projectile
+                pygame.draw.circle(screen, p.color, (int(p.x), int(p.y)), p.size)
                 # Add a glowing effect
-                glow_size = p['size'] + 10
-                glow_surface = pygame.Surface((glow_size*2, glow_size*2), pygame.SRCALPHA)
-                pygame.draw.circle(glow_surface, (*p['color'], 128), (glow_size, glow_size), glow_size)
-                screen.blit(glow_surface, (int(p['x'])-glow_size, int(p['y'])-glow_size), special_flags=pygame.BLEND_ADD)
+                glow_size = p.size + 10
+                glow_surface = get_glow(glow_size, (((*p.color, 128), glow_size),))
+                screen.blit(glow_surface, (int(p.x)-glow_size, int(p.y)-glow_size), special_flags=pygame.BLEND_ADD)
             
-            elif p['type'] == 'bouncing_ball':  # Sniper's awakening
+            elif p.kind == ProjectileKind.BOUNCING_BALL:  # Sniper's awakening
                 # Draw blue bouncing ball with glow effect
-                pygame.draw.circle(screen, p['color'], (int(p['x']), int(p['y'])), p['size'])
+                pygame.draw.circle(screen, p.color, (int(p.x), int(p.y)), p.size)
                 
                 # Add pulsing glow effect
-                pulse = (math.sin(pygame.time.get_ticks() * 0.01) + 1) * 0.3 + 0.7  # Value between 0.7 and 1.3
-                glow_size = int(p['size'] * 1.5 * pulse)
-                glow_surface = pygame.Surface((glow_size*2, glow_size*2), pygame.SRCALPHA)
+                pulse = (math.sin(current_time * 0.01) + 1) * 0.3 + 0.7  # Value between 0.7 and 1.3
+                glow_size = quantize_glow_size(int(p.size * 1.5 * pulse))
                 
-                # Multiple layers of glow
-                for i in range(3):
-                    alpha = int(100 * (1 - i/3))
-                    color = (100, 150, 255, alpha)  # Light blue glow
-                    pygame.draw.circle(glow_surface, color, (glow_size, glow_size), glow_size - i*5)
+                # Multiple layers of light blue glow
+                glow_surface = get_glow(glow_size, tuple(
+                    ((100, 150, 255, int(100 * (1 - i/3))), glow_size - i*5) for i in range(3)))
                 
-                screen.blit(glow_surface, (int(p['x'] - glow_size), int(p['y'] - glow_size)), special_flags=pygame.BLEND_ADD)
+                screen.blit(glow_surface, (int(p.x - glow_size), int(p.y - glow_size)), special_flags=pygame.BLEND_ADD)
                 
                 # Add energy trail
-                trail_length = min(5, p['bounces'] + 1)  # Longer trail after more bounces
+                trail_length = min(5, p.bounces + 1)  # Longer trail after more bounces
                 for i in range(trail_length):
-                    trail_x = int(p['x'] - p['dx'] * (i+1) * 2)
-                    trail_y = int(p['y'] - p['dy'] * (i+1) * 2)
-                    trail_size = p['size'] * (1 - i/trail_length * 0.8)
+                    trail_x = int(p.x - p.dx * (i+1) * 2)
+                    trail_y = int(p.y - p.dy * (i+1) * 2)
+                    trail_size = p.size * (1 - i/trail_length * 0.8)
                     alpha = int(200 * (1 - i/trail_length))
                     
-                    trail_surface = pygame.Surface((int(trail_size*2), int(trail_size*2)), pygame.SRCALPHA)
-                    pygame.draw.circle(trail_surface, (*p['color'], alpha), 
-                                      (int(trail_size), int(trail_size)), int(trail_size))
+                    trail_surface = get_glow(int(trail_size), (((*p.color, alpha), int(trail_size)),))
                     screen.blit(trail_surface, (trail_x - int(trail_size), trail_y - int(trail_size)))
                     
-            elif p['type'] == 'bounce_effect':
+            elif p.kind == ProjectileKind.BOUNCE_EFFECT:
                 # Draw bounce effect (expanding circle)
-                alpha = int(255 * p['lifetime'] / 200)  # Fade out
-                size = p['size'] * (1 - p['lifetime'] / 200 * 0.5)  # Expand slightly
+                alpha = quantize_alpha(int(255 * p.lifetime / 200))  # Fade out
+                size = p.size * (1 - p.lifetime / 200 * 0.5)  # Expand slightly
                 
-                bounce_surface = pygame.Surface((int(size*2), int(size*2)), pygame.SRCALPHA)
-                pygame.draw.circle(bounce_surface, (*p['color'][:3], alpha), 
-                                  (int(size), int(size)), int(size))
-                screen.blit(bounce_surface, (int(p['x'] - size), int(p['y'] - size)))
+                bounce_surface = get_glow(int(size), (((*p.color[:3], alpha), int(size)),))
+                screen.blit(bounce_surface, (int(p.x - size), int(p.y - size)))
             
-            elif p['type'] == 'laser':
-                pygame.draw.circle(screen, p['color'], (int(p['x']), int(p['y'])), p['size'])
+            elif p.kind == ProjectileKind.LASER:
+                pygame.draw.circle(screen, p.color, (int(p.x), int(p.y)), p.size)
             
-            elif p['type'] == 'sniper_bullet':
+            elif p.kind == ProjectileKind.SNIPER_BULLET:
                 # Draw rectangular bullet for sniper
-                bullet_surface = pygame.Surface((p['length'], p['size']), pygame.SRCALPHA)
-                pygame.draw.rect(bullet_surface, p['color'], (0, 0, p['length'], p['size']))
+                bullet_surface = pygame.Surface((p.length, p.size), pygame.SRCALPHA)
+                pygame.draw.rect(bullet_surface, p.color, (0, 0, p.length, p.size))
                 
                 # Rotate to match direction
-                rotated_bullet = pygame.transform.rotate(bullet_surface, -math.degrees(p['angle']))
-                bullet_rect = rotated_bullet.get_rect(center=(int(p['x']), int(p['y'])))
+                rotated_bullet = pygame.transform.rotate(bullet_surface, -math.degrees(p.angle))
+                bullet_rect = rotated_bullet.get_rect(center=(int(p.x), int(p.y)))
                 
                 # Draw the bullet
                 screen.blit(rotated_bullet, bullet_rect)
             
-            elif p['type'] == 'sword':
+            elif p.kind == ProjectileKind.SWORD:
                 # Draw rectangular sword in the direction of the mouse
-                angle = p['angle']
+                angle = p.angle
                 
                 # Create a surface for the sword
-                sword_surface = pygame.Surface((p['length'], p['size']), pygame.SRCALPHA)
-                pygame.draw.rect(sword_surface, p['color'], (0, 0, p['length'], p['size']))
+                sword_surface = pygame.Surface((p.length, p.size), pygame.SRCALPHA)
+                pygame.draw.rect(sword_surface, p.color, (0, 0, p.length, p.size))
                 
                 # Rotate the surface
                 rotated_sword = pygame.transform.rotate(sword_surface, -math.degrees(angle))
                 
                 # Get the rect for positioning
-                sword_rect = rotated_sword.get_rect(center=(p['x'], p['y']))
+                sword_rect = rotated_sword.get_rect(center=(p.x, p.y))
                 
                 # Draw the sword
                 screen.blit(rotated_sword, sword_rect)
             
-            elif p['type'] == 'beam':
+            elif p.kind == ProjectileKind.BEAM:
                 # Draw the robot's awakening beam
-                start_x, start_y = int(p['x']), int(p['y'])
-                end_x = int(p['x'] + math.cos(p['angle']) * p['length'])
-                end_y = int(p['y'] + math.sin(p['angle']) * p['length'])
+                start_x, start_y = int(p.x), int(p.y)
+                end_x = int(p.x + math.cos(p.angle) * p.length)
+                end_y = int(p.y + math.sin(p.angle) * p.length)
                 
                 # Draw the main beam line
-                pygame.draw.line(screen, p['color'], (start_x, start_y), (end_x, end_y), p['width'])
+                pygame.draw.line(screen, p.color, (start_x, start_y), (end_x, end_y), p.width)
                 
                 # Add a glowing effect around the beam
                 for i in range(3):
                     alpha = 150 - i * 50
-                    width = p['width'] + i * 4
-                    color = (*p['color'], alpha)
-                    s = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-                    pygame.draw.line(s, color, (start_x, start_y), (end_x, end_y), width)
-                    screen.blit(s, (0, 0), special_flags=pygame.BLEND_ADD)
-            
-            elif p['type'] == 'knight_arc_wave':
-                # Draw the Knight's arc wave - now directional using p['angle']
-                angle = p['angle']
-                arc_radius = min(p['range'], p['stage'] * 10)  # Grows outward
-                arc_width = p['width']
+                    width = p.width + i * 4
+                    color = (*p.color, alpha)
+                    s, position = get_line_glow(start_x, start_y, end_x, end_y, color, width)
+                    screen.blit(s, position, special_flags=pygame.BLEND_ADD)
+            
+            elif p.kind == ProjectileKind.KNIGHT_ARC_WAVE:
+                # Draw the Knight's arc wave - now directional using p.angle
+                angle = p.angle
+                arc_radius = int(min(p.range, p.stage * 10))  # Grows outward
+                arc_width = p.width
                 
                 # Create semi-transparent surface for the arc
                 arc_surface = pygame.Surface((arc_radius*2, arc_radius*2), pygame.SRCALPHA)
@@ -748,7 +1493,7 @@ class Character:
                 
                 # Draw multiple arcs for a thicker appearance
                 for thickness in range(0, 20, 5):
-                    arc_color = (*p['color'], 150 - thickness * 5)  # Fade out for thicker parts
+                    arc_color = (*p.color, 150 - thickness * 5)  # Fade out for thicker parts
                     pygame.draw.arc(arc_surface, arc_color, 
                                    (thickness, thickness, 
                                     (arc_radius-thickness)*2, (arc_radius-thickness)*2), 
@@ -764,12 +1509,12 @@ class Character:
                 # Draw the arc
                 screen.blit(rotated_arc, rotated_rect)
                 
-            elif p['type'] == 'explosion':
+            elif p.kind == ProjectileKind.EXPLOSION:
                 # Advanced explosion animation
-                frame = p['frame']
-                max_frames = p['max_frames']
+                frame = p.frame
+                max_frames = p.max_frames
                 progress = frame / max_frames
-                radius = p['radius'] * (1 - progress * 0.2)  # Slightly shrinks over time
+                radius = p.radius * (1 - progress * 0.2)  # Slightly shrinks over time
                 
                 # Create a surface for the explosion
                 explosion_size = int(radius * 2)
@@ -821,28 +1566,28 @@ class Character:
                 
                 # Draw the explosion
                 screen.blit(explosion_surface, 
-                           (int(p['x'] - explosion_size//2), 
-                            int(p['y'] - explosion_size//2)))
+                           (int(p.x - explosion_size//2), 
+                            int(p.y - explosion_size//2)))
                 
                 # Update animation frame
-                p['frame'] += 1
+                p.frame += 1
             
-            elif p['type'] == 'samurai_slice':
+            elif p.kind == ProjectileKind.SAMURAI_SLICE:
                 # Draw a circular slice around the samurai
-                slice_surface = pygame.Surface((p['size']*2, p['size']*2), pygame.SRCALPHA)
+                slice_surface = pygame.Surface((p.size*2, p.size*2), pygame.SRCALPHA)
                 
                 # Calculate the slice area
-                angle = p['angle']
-                slice_width = p['width']
+                angle = p.angle
+                slice_width = p.width
                 
                 # Draw the slice
                 start_angle = angle - math.radians(slice_width / 2)
                 end_angle = angle + math.radians(slice_width / 2)
                 
                 # Draw multiple arcs for a nicer appearance
-                fade = p['lifetime'] / 150  # 1.0 to 0.0 during lifetime
+                fade = p.lifetime / 150  # 1.0 to 0.0 during lifetime
                 for i in range(4):  # One more layer for better effect
-                    size = p['size'] - i * 5
+                    size = p.size - i * 5
                     alpha = int(200 * fade)
                     color = (255, 0, 0, alpha)  # Red with alpha
                     
@@ -851,12 +1596,17 @@ class Character:
                                   start_angle, end_angle, 5)  # Thicker line
                 
                 # Position the slice centered on attack point
-                screen.blit(slice_surface, (p['x'] - p['size'], p['y'] - p['size']))
+                screen.blit(slice_surface, (p.x - p.size, p.y - p.size))
                 
-                # Add a red trail effect
-                trail_surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+                # Add a red trail effect, on a surface just big enough for it.
+                # The trail stays within p.size of the attack point; the
+                # surface is placed at whole pixels so the lines land on the
+                # same pixels they would on the screen.
+                trail_left = math.floor(p.x) - p.size - 2
+                trail_top = math.floor(p.y) - p.size - 2
+                trail_surface = pygame.Surface((p.size*2 + 4, p.size*2 + 4), pygame.SRCALPHA)
                 trail_points = []
-                trail_width = p['width'] * math.pi / 180 * p['size']  # Convert degrees to radians for arc length
+                trail_width = p.width * math.pi / 180 * p.size  # Convert degrees to radians for arc length
                 
                 for i in range(5):
                     trail_alpha = int(150 * fade * (1 - i/5))
@@ -865,8 +1615,8 @@ class Character:
                     # Calculate arc points
                     for j in range(int(slice_width)):
                         point_angle = trail_angle - math.radians(slice_width/2) + math.radians(j)
-                        point_x = p['x'] + math.cos(point_angle) * (p['size'] - i*5)
-                        point_y = p['y'] + math.sin(point_angle) * (p['size'] - i*5)
+                        point_x = p.x - trail_left + math.cos(point_angle) * (p.size - i*5)
+                        point_y = p.y - trail_top + math.sin(point_angle) * (p.size - i*5)
                         
                         if len(trail_points) < 2:
                             trail_points.append((point_x, point_y))
@@ -876,44 +1626,43 @@ class Character:
                                           trail_points[0], trail_points[1], 2)
                             trail_points[0] = trail_points[1]
                 
-                screen.blit(trail_surface, (0, 0))
+                screen.blit(trail_surface, (trail_left, trail_top))
             
-            elif p['type'] == 'freeze_wave':
+            elif p.kind == ProjectileKind.FREEZE_WAVE:
                 # Draw a circular wave expanding outward
                 radius = 15
-                alpha = int(200 * (p['lifetime'] / 800))  # Fade as it expands
+                alpha = quantize_alpha(int(200 * (p.lifetime / 800)))  # Fade as it expands
                 
                 # Create a surface for the wave
-                wave_surface = pygame.Surface((radius*2, radius*2), pygame.SRCALPHA)
-                pygame.draw.circle(wave_surface, (*p['color'][:3], alpha), (radius, radius), radius)
+                wave_surface = get_glow(radius, (((*p.color[:3], alpha), radius),))
                 
                 # Draw the wave
-                screen.blit(wave_surface, (int(p['x'] - radius), int(p['y'] - radius)))
+                screen.blit(wave_surface, (int(p.x - radius), int(p.y - radius)))
                 
-            elif p['type'] == 'slow_wave':
+            elif p.kind == ProjectileKind.SLOW_WAVE:
                 # Draw the shooter's slow wave (golden expanding wave)
                 radius = 20
-                progress = p['lifetime'] / 1000  # 1.0 to 0.0
-                alpha = int(180 * progress)  # Fade out over time
+                progress = p.lifetime / 1000  # 1.0 to 0.0
+                alpha = quantize_alpha(int(180 * progress))  # Fade out over time
                 
                 # Create a surface for the wave particle
-                wave_surface = pygame.Surface((radius*2, radius*2), pygame.SRCALPHA)
-                pygame.draw.circle(wave_surface, (*p['color'][:3], alpha), (radius, radius), radius)
+                wave_surface = get_glow(radius, (((*p.color[:3], alpha), radius),))
                 
                 # Add golden glow effect
                 glow_radius = radius * 1.5
-                glow_surface = pygame.Surface((int(glow_radius*2), int(glow_radius*2)), pygame.SRCALPHA)
                 glow_color = (255, 215, 0, int(alpha * 0.6))  # More transparent version of gold
-                pygame.draw.circle(glow_surface, glow_color, 
-                                  (int(glow_radius), int(glow_radius)), int(glow_radius))
+                glow_surface = get_glow(int(glow_radius), ((glow_color, int(glow_radius)),))
                 
                 # Position and draw
-                screen.blit(glow_surface, (int(p['x'] - glow_radius), int(p['y'] - glow_radius)))
-                screen.blit(wave_surface, (int(p['x'] - radius), int(p['y'] - radius)))
+                screen.blit(glow_surface, (int(p.x - glow_radius), int(p.y - glow_radius)))
+                screen.blit(wave_surface, (int(p.x - radius), int(p.y - radius)))
 
+    def awakening_indicator_rect(self):
+        # The indicator box in the bottom right corner, with room for its text
+        return pygame.Rect(WIDTH - 170, HEIGHT - 40, 150, 20).inflate(20, 10)
+    
     # Draw awakening cooldown indicator
-    def draw_awakening_cooldown(self):
-        current_time = pygame.time.get_ticks()
+    def draw_awakening_cooldown(self, current_time):
         cooldown_remaining = max(0, self.awakening_cooldown - (current_time - self.last_awakening))
         
         # Position in the bottom right corner
@@ -938,24 +1687,207 @@ class Character:
         pygame.draw.rect(screen, BLACK, (x, y, indicator_width, indicator_height), 2)
         
         # Draw text
-        font = pygame.font.SysFont('Arial', 14)
+        font = get_font(14)
         if cooldown_remaining > 0:
-            text = font.render(f"Awakening: {cooldown_remaining/1000:.1f}s", True, BLACK)
+            text = render_text(font, f"Awakening: {cooldown_remaining/1000:.1f}s", BLACK)
         else:
-            text = font.render("Awakening: READY", True, BLACK)
+            text = render_text(font, "Awakening: READY", BLACK)
         
         text_rect = text.get_rect(center=(x + indicator_width/2, y + indicator_height/2))
         screen.blit(text, text_rect)
 
 
+# Enemy attribute that lives in the enemy's EnemyBatch row while it is in a
+# batch, and on the enemy itself otherwise
+class BatchField:
+    def __init__(self, name):
+        self.name = name
+        self.local = '_' + name
+    
+    def __get__(self, enemy, owner=None):
+        if enemy is None:
+            return self
+        if enemy._batch is None:
+            return getattr(enemy, self.local)
+        # item() hands out plain Python floats and bools rather than NumPy ones
+        return getattr(enemy._batch, self.name).item(enemy._slot)
+    
+    def __set__(self, enemy, value):
+        if enemy._batch is None:
+            setattr(enemy, self.local, value)
+        else:
+            getattr(enemy._batch, self.name)[enemy._slot] = value
+
+# Movement state of every enemy in a game as NumPy columns, so the whole
+# swarm moves toward the player in one pass. Only used once there are
+# BATCH_MIN_ENEMIES enemies (see Game.pick_enemy_batch); for fewer, moving
+# them one by one is faster. Enemy objects stay views onto their row (see
+# BatchField); removing an enemy moves the last row into its place and hands
+# the values back to the enemy. Sizes are copied in too (an enemy's size
+# never changes) for the area-of-effect hit masks.
+class EnemyBatch:
+    FLOAT_COLUMNS = ('x', 'y', 'speed', 'frozen_until', 'slowed_until', 'slow_factor')
+    FLAG_COLUMNS = ('frozen', 'slowed')
+    COLUMNS = FLOAT_COLUMNS + FLAG_COLUMNS
+    
+    def __init__(self, capacity=64):
+        self.members = []  # Enemy in each row
+        for name in self.FLOAT_COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=np.float64))
+        for name in self.FLAG_COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=bool))
+        self.size = np.zeros(capacity, dtype=np.int32)
+    
+    def __len__(self):
+        return len(self.members)
+    
+    def grow(self):
+        capacity = len(self.x) * 2
+        for name in self.COLUMNS + ('size',):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+    
+    def add(self, enemy):
+        if len(self.members) == len(self.x):
+            self.grow()
+        values = [getattr(enemy, name) for name in self.COLUMNS]
+        slot = len(self.members)
+        self.members.append(enemy)
+        enemy._batch = self
+        enemy._slot = slot
+        for name, value in zip(self.COLUMNS, values):
+            getattr(self, name)[slot] = value
+        self.size[slot] = enemy.size
+    
+    def add_many(self, enemies, columns):
+        # Add enemies whose batched fields are given as one list per column
+        # (snapshot restore), without going through add() for each
+        start = len(self.members)
+        end = start + len(enemies)
+        while end > len(self.x):
+            self.grow()
+        for slot, enemy in enumerate(enemies, start):
+            enemy._batch = self
+            enemy._slot = slot
+        self.members += enemies
+        for name, values in zip(self.COLUMNS, columns):
+            getattr(self, name)[start:end] = values
+        self.size[start:end] = [enemy.size for enemy in enemies]
+    
+    def clear(self):
+        # Forget every row; the enemies must not be used afterwards
+        self.members.clear()
+    
+    def release_all(self):
+        # Hand every row back to its enemy and empty the batch; the reverse
+        # of add_many()
+        n = len(self.members)
+        columns = [getattr(self, name)[:n].tolist() for name in self.COLUMNS]
+        fields = ['_' + name for name in self.COLUMNS]
+        for enemy, values in zip(self.members, zip(*columns)):
+            enemy._batch = None
+            enemy._slot = -1
+            for field, value in zip(fields, values):
+                setattr(enemy, field, value)
+        self.members.clear()
+    
+    def remove(self, enemy):
+        values = [getattr(enemy, name) for name in self.COLUMNS]
+        slot = enemy._slot
+        last = self.members.pop()
+        if last is not enemy:
+            # Swap the last row into the freed slot
+            for name in self.COLUMNS + ('size',):
+                column = getattr(self, name)
+                column[slot] = column[len(self.members)]
+            self.members[slot] = last
+            last._slot = slot
+        enemy._batch = None
+        enemy._slot = -1
+        for name, value in zip(self.COLUMNS, values):
+            setattr(enemy, name, value)
+    
+    def move(self, player_x, player_y, current_time, modifier=1.0, step=1.0):
+        # Same rules as Enemy.move, for every enemy at once
+        n = len(self.members)
+        if n == 0:
+            return
+        
+        # Frozen enemies stay put; unfreeze the ones whose time is up
+        frozen = self.frozen[:n]
+        moving = None
+        if frozen.any():
+            still_frozen = frozen & (current_time < self.frozen_until[:n])
+            frozen &= still_frozen
+            moving = ~still_frozen
+        
+        # Apply slow factors; clear the slows that ran out
+        slowed = self.slowed[:n]
+        current_modifier = modifier
+        if slowed.any():
+            slow_factor = self.slow_factor[:n]
+            still_slowed = slowed & (current_time < self.slowed_until[:n])
+            slow_factor[slowed & ~still_slowed] = 1.0
+            slowed &= still_slowed
+            current_modifier = np.where(still_slowed, modifier * slow_factor, modifier)
+        
+        # Move towards player
+        dx = player_x - self.x[:n]
+        dy = player_y - self.y[:n]
+        distance = np.maximum(1, np.sqrt(dx * dx + dy * dy))  # Avoid division by zero
+        dx /= distance
+        dy /= distance
+        move_x = dx * self.speed[:n] * current_modifier * step
+        move_y = dy * self.speed[:n] * current_modifier * step
+        if moving is not None:
+            move_x *= moving
+            move_y *= moving
+        self.x[:n] += move_x
+        self.y[:n] += move_y
+    
+    def columns(self):
+        # Every enemy with its position and size, for area_hit_set()
+        n = len(self.members)
+        return self.members, self.x[:n], self.y[:n], self.size[:n]
+
+# Enemy types
+class EnemyType(IntEnum):
+    NORMAL = 0  # Red enemies
+    PURPLE = 1
+    GREEN = 2
+    BOSS = 3
+
 # Enemy class
 class Enemy:
-    def __init__(self, enemy_type='normal', boss_level=1):
+    # _x, _y, ... hold the movement state while the enemy isn't in a batch
+    __slots__ = ('_batch', '_slot', '_x', '_y', '_speed', '_frozen_until', '_slowed_until',
+                 '_slow_factor', '_frozen', '_slowed', 'type', 'boss_level', 'projectiles',
+                 'last_shot', 'size', 'color', 'health', 'max_health', 'damage', 'cooldown', 'dead')
+    
+    # What changes during a game, as saved in snapshots (the rest follows from type and level)
+    SNAPSHOT_FIELDS = EnemyBatch.COLUMNS + ('last_shot', 'health')
+    
+    # Movement state, stored in the game's EnemyBatch while the enemy is alive
+    x = BatchField('x')
+    y = BatchField('y')
+    speed = BatchField('speed')
+    frozen_until = BatchField('frozen_until')
+    slowed_until = BatchField('slowed_until')
+    slow_factor = BatchField('slow_factor')
+    frozen = BatchField('frozen')
+    slowed = BatchField('slowed')
+    
+    def __init__(self, enemy_type=EnemyType.NORMAL, boss_level=1):
+        self._batch = None  # EnemyBatch holding our movement state, if any
+        self._slot = -1
+        self.dead = False  # Set by Game.remove_enemy; dropped at the end of the tick
         self.type = enemy_type
         self.boss_level = boss_level
-        self.x = random.randint(0, WIDTH)
-        self.y = random.randint(-50, -10)
-        self.speed = random.uniform(1.5, 2.5)
+        self.x = sim_random.randint(0, WIDTH)
+        self.y = sim_random.randint(-50, -10)
+        self.speed = sim_random.uniform(1.5, 2.5)
         self.projectiles = []
         self.last_shot = 0
         self.frozen = False
@@ -964,23 +1896,23 @@ class Enemy:
         self.slowed_until = 0
         self.slow_factor = 1.0  # No slowdown by default
         
-        if enemy_type == 'normal':  # Red enemies
+        if enemy_type == EnemyType.NORMAL:  # Red enemies
             self.size = 25
             self.color = RED
             self.health = 1
             self.damage = 1
-        elif enemy_type == 'purple':
+        elif enemy_type == EnemyType.PURPLE:
             self.size = 25
             self.color = PURPLE
             self.health = 2
             self.damage = 1
-        elif enemy_type == 'green':  # New green enemies
+        elif enemy_type == EnemyType.GREEN:  # New green enemies
             self.size = int(25 * 1.3)  # 1.3x larger
             self.color = DARK_GREEN
             self.health = 3
             self.damage = 1
             self.speed *= 0.7  # 1.2x slower
-        elif enemy_type == 'boss':
+        elif enemy_type == EnemyType.BOSS:
             if boss_level == 1:  # First boss
                 self.size = 60
                 self.color = RED
@@ -1012,130 +1944,185 @@ class Enemy:
             self.y = -self.size
             self.speed = 1
 
-    def draw(self):
-        # If frozen, draw with a blue tint
-        color = self.color
+    def draw(self, current_time):
+        sprite, left, top = self.sprite()
+        screen.blit(sprite, (int(self.x) + left, int(self.y) + top))
+        
+        if self.type == EnemyType.BOSS:
+            if self.boss_level == 4:
+                # Draw projectiles
+                self.draw_projectiles()
+            
+            # Draw boss health bar
+            self.draw_health_bar()
+            
+        # Draw ice crystals if frozen
         if self.frozen:
-            # Create a blue-tinted version of the original color
-            r, g, b = self.color
-            color = (max(0, r - 100), max(0, g - 50), min(255, b + 150))
-        elif self.slowed:
-            # Create a yellow-tinted version for slowed enemies
-            r, g, b = self.color
-            color = (min(255, r + 50), min(255, g + 50), max(0, b - 50))
+            # Draw small ice crystals around the enemy
+            for i in range(5):
+                angle = random.random() * math.pi * 2
+                distance = self.size * 0.6
+                crystal_x = self.x + math.cos(angle) * distance
+                crystal_y = self.y + math.sin(angle) * distance
+                crystal_size = random.randint(3, 6)
+                
+                # Draw a small blue crystal
+                pygame.draw.polygon(screen, (100, 150, 255), [
+                    (crystal_x, crystal_y - crystal_size),
+                    (crystal_x + crystal_size, crystal_y),
+                    (crystal_x, crystal_y + crystal_size),
+                    (crystal_x - crystal_size, crystal_y)
+                ])
         
-        pygame.draw.rect(screen, color, (self.x - self.size // 2, self.y - self.size // 2, self.size, self.size))
+        # Draw slow effect if slowed
+        elif self.slowed:
+            # Draw yellow sparkles around the enemy to indicate slowdown
+            for i in range(3):
+                angle = (current_time / 200 + i * 2.1) % (2 * math.pi)  # Rotating sparkles
+                distance = self.size * 0.7
+                sparkle_x = self.x + math.cos(angle) * distance
+                sparkle_y = self.y + math.sin(angle) * distance
+                sparkle_size = random.randint(2, 4)
+                
+                # Draw a small yellow sparkle
+                pygame.draw.circle(screen, (255, 255, 0), (int(sparkle_x), int(sparkle_y)), sparkle_size)
+    
+    def sprite(self):
+        # The cached look draw() blits. Frozen enemies are drawn with a blue
+        # tint, slowed ones yellow.
+        tint = 'frozen' if self.frozen else 'slowed' if self.slowed else None
+        return get_sprite(('enemy', self.type, self.boss_level, self.size, self.color, tint),
+                          self.size + SPRITE_PAD, self.paint, tint_color(self.color, tint))
+    
+    def bounds(self):
+        # Screen area draw() covers, including the boss health bar, ice
+        # crystals and sparkles but not boss projectiles
+        rect = sprite_rect(self.sprite(), self.x, self.y)
+        if self.type == EnemyType.BOSS:
+            bar_y = self.y - self.size / 2 - 20
+            rect.union_ip(pygame.Rect(int(self.x - self.size * 0.75) - 1, int(bar_y) - 1, int(self.size * 1.5) + 3, 13))
+            health_text = render_text(get_font(14), f"{self.health}/{self.max_health}", WHITE)
+            rect.union_ip(health_text.get_rect(center=(self.x, bar_y - 10)))
+        if self.frozen:
+            rect.union_ip(centered_rect(self.x, self.y, int(self.size * 0.6) + 6))
+        elif self.slowed:
+            rect.union_ip(centered_rect(self.x, self.y, int(self.size * 0.7) + 4))
+        return rect
+    
+    def paint(self, surface, x, y, color):
+        # Draws the enemy's look, in the given (tinted) colour, centred on (x, y)
+        pygame.draw.rect(surface, color, (x - self.size // 2, y - self.size // 2, self.size, self.size))
         
         # Draw horns for normal and purple enemies
-        if self.type in ['normal', 'purple']:
-            pygame.draw.polygon(screen, BROWN, [
-                (self.x - self.size // 4, self.y - self.size // 2),
-                (self.x - self.size // 4, self.y - self.size),
-                (self.x, self.y - self.size // 2)
+        if self.type == EnemyType.NORMAL or self.type == EnemyType.PURPLE:
+            pygame.draw.polygon(surface, BROWN, [
+                (x - self.size // 4, y - self.size // 2),
+                (x - self.size // 4, y - self.size),
+                (x, y - self.size // 2)
             ])
-            pygame.draw.polygon(screen, BROWN, [
-                (self.x + self.size // 4, self.y - self.size // 2),
-                (self.x + self.size // 4, self.y - self.size),
-                (self.x, self.y - self.size // 2)
+            pygame.draw.polygon(surface, BROWN, [
+                (x + self.size // 4, y - self.size // 2),
+                (x + self.size // 4, y - self.size),
+                (x, y - self.size // 2)
             ])
             
             # Draw eyes
-            pygame.draw.circle(screen, BLACK, (self.x - self.size // 4, self.y), 5)
-            pygame.draw.circle(screen, BLACK, (self.x + self.size // 4, self.y), 5)
+            pygame.draw.circle(surface, BLACK, (x - self.size // 4, y), 5)
+            pygame.draw.circle(surface, BLACK, (x + self.size // 4, y), 5)
         
         # Draw spikes for green enemies
-        elif self.type == 'green':
+        elif self.type == EnemyType.GREEN:
             # Top spikes
             for i in range(3):
                 offset = (i - 1) * self.size // 3
-                pygame.draw.polygon(screen, color, [
-                    (self.x + offset, self.y - self.size // 2),
-                    (self.x + offset, self.y - self.size),
-                    (self.x + offset + self.size // 9, self.y - self.size // 2)
+                pygame.draw.polygon(surface, color, [
+                    (x + offset, y - self.size // 2),
+                    (x + offset, y - self.size),
+                    (x + offset + self.size // 9, y - self.size // 2)
                 ])
             
             # Eyes (angrier looking)
-            pygame.draw.polygon(screen, RED, [
-                (self.x - self.size // 3, self.y - self.size // 8),
-                (self.x - self.size // 6, self.y - self.size // 8),
-                (self.x - self.size // 4, self.y + self.size // 8)
+            pygame.draw.polygon(surface, RED, [
+                (x - self.size // 3, y - self.size // 8),
+                (x - self.size // 6, y - self.size // 8),
+                (x - self.size // 4, y + self.size // 8)
             ])
-            pygame.draw.polygon(screen, RED, [
-                (self.x + self.size // 3, self.y - self.size // 8),
-                (self.x + self.size // 6, self.y - self.size // 8),
-                (self.x + self.size // 4, self.y + self.size // 8)
+            pygame.draw.polygon(surface, RED, [
+                (x + self.size // 3, y - self.size // 8),
+                (x + self.size // 6, y - self.size // 8),
+                (x + self.size // 4, y + self.size // 8)
             ])
         
         # Boss-specific details
-        if self.type == 'boss':
+        if self.type == EnemyType.BOSS:
             if self.boss_level == 1:
                 # Large purple eyes
-                pygame.draw.circle(screen, PURPLE, (self.x - self.size // 3, self.y - self.size // 6), 10)
-                pygame.draw.circle(screen, PURPLE, (self.x + self.size // 3, self.y - self.size // 6), 10)
+                pygame.draw.circle(surface, PURPLE, (x - self.size // 3, y - self.size // 6), 10)
+                pygame.draw.circle(surface, PURPLE, (x + self.size // 3, y - self.size // 6), 10)
                 # Black center in eyes
-                pygame.draw.circle(screen, BLACK, (self.x - self.size // 3, self.y - self.size // 6), 5)
-                pygame.draw.circle(screen, BLACK, (self.x + self.size // 3, self.y - self.size // 6), 5)
+                pygame.draw.circle(surface, BLACK, (x - self.size // 3, y - self.size // 6), 5)
+                pygame.draw.circle(surface, BLACK, (x + self.size // 3, y - self.size // 6), 5)
                 # Smile
-                pygame.draw.arc(screen, DARK_RED, 
-                                (self.x - self.size // 3, self.y, self.size * 2 // 3, self.size // 3), 
+                pygame.draw.arc(surface, DARK_RED, 
+                                (x - self.size // 3, y, self.size * 2 // 3, self.size // 3), 
                                 0, math.pi, 3)
             elif self.boss_level == 2:
                 # Large purple eyes for gray boss
-                pygame.draw.circle(screen, PURPLE, (self.x - self.size // 3, self.y - self.size // 6), 12)
-                pygame.draw.circle(screen, PURPLE, (self.x + self.size // 3, self.y - self.size // 6), 12)
+                pygame.draw.circle(surface, PURPLE, (x - self.size // 3, y - self.size // 6), 12)
+                pygame.draw.circle(surface, PURPLE, (x + self.size // 3, y - self.size // 6), 12)
                 # Black center in eyes
-                pygame.draw.circle(screen, BLACK, (self.x - self.size // 3, self.y - self.size // 6), 6)
-                pygame.draw.circle(screen, BLACK, (self.x + self.size // 3, self.y - self.size // 6), 6)
+                pygame.draw.circle(surface, BLACK, (x - self.size // 3, y - self.size // 6), 6)
+                pygame.draw.circle(surface, BLACK, (x + self.size // 3, y - self.size // 6), 6)
                 # Smile
-                pygame.draw.arc(screen, DARK_RED, 
-                                (self.x - self.size // 3, self.y, self.size * 2 // 3, self.size // 3), 
+                pygame.draw.arc(surface, DARK_RED, 
+                                (x - self.size // 3, y, self.size * 2 // 3, self.size // 3), 
                                 0, math.pi, 4)
             elif self.boss_level == 3:  # General boss
                 # Decorative elements for General
                 # Crown
                 crown_points = [
-                    (self.x - self.size // 2, self.y - self.size // 2),
-                    (self.x - self.size // 2, self.y - self.size // 2 - 15),
-                    (self.x - self.size // 4, self.y - self.size // 2 - 5),
-                    (self.x, self.y - self.size // 2 - 20),
-                    (self.x + self.size // 4, self.y - self.size // 2 - 5),
-                    (self.x + self.size // 2, self.y - self.size // 2 - 15),
-                    (self.x + self.size // 2, self.y - self.size // 2)
+                    (x - self.size // 2, y - self.size // 2),
+                    (x - self.size // 2, y - self.size // 2 - 15),
+                    (x - self.size // 4, y - self.size // 2 - 5),
+                    (x, y - self.size // 2 - 20),
+                    (x + self.size // 4, y - self.size // 2 - 5),
+                    (x + self.size // 2, y - self.size // 2 - 15),
+                    (x + self.size // 2, y - self.size // 2)
                 ]
-                pygame.draw.polygon(screen, YELLOW, crown_points)
+                pygame.draw.polygon(surface, YELLOW, crown_points)
                 
                 # Eyes
-                pygame.draw.circle(screen, RED, (self.x - self.size // 3, self.y - self.size // 6), 12)
-                pygame.draw.circle(screen, RED, (self.x + self.size // 3, self.y - self.size // 6), 12)
+                pygame.draw.circle(surface, RED, (x - self.size // 3, y - self.size // 6), 12)
+                pygame.draw.circle(surface, RED, (x + self.size // 3, y - self.size // 6), 12)
                 # Black center in eyes
-                pygame.draw.circle(screen, BLACK, (self.x - self.size // 3, self.y - self.size // 6), 6)
-                pygame.draw.circle(screen, BLACK, (self.x + self.size // 3, self.y - self.size // 6), 6)
+                pygame.draw.circle(surface, BLACK, (x - self.size // 3, y - self.size // 6), 6)
+                pygame.draw.circle(surface, BLACK, (x + self.size // 3, y - self.size // 6), 6)
                 
                 # Angry mouth
-                pygame.draw.arc(screen, BLACK, 
-                               (self.x - self.size // 3, self.y + self.size // 6, self.size * 2 // 3, self.size // 3), 
+                pygame.draw.arc(surface, BLACK, 
+                               (x - self.size // 3, y + self.size // 6, self.size * 2 // 3, self.size // 3), 
                                math.pi, 2 * math.pi, 4)
             
             elif self.boss_level == 4:  # Final boss
                 # Bigger, more intimidating design
                 # Crown with jewels
                 crown_points = [
-                    (self.x - self.size // 2, self.y - self.size // 2),
-                    (self.x - self.size // 2, self.y - self.size // 2 - 20),
-                    (self.x - self.size // 3, self.y - self.size // 2 - 10),
-                    (self.x - self.size // 6, self.y - self.size // 2 - 25),
-                    (self.x, self.y - self.size // 2 - 15),
-                    (self.x + self.size // 6, self.y - self.size // 2 - 25),
-                    (self.x + self.size // 3, self.y - self.size // 2 - 10),
-                    (self.x + self.size // 2, self.y - self.size // 2 - 20),
-                    (self.x + self.size // 2, self.y - self.size // 2)
+                    (x - self.size // 2, y - self.size // 2),
+                    (x - self.size // 2, y - self.size // 2 - 20),
+                    (x - self.size // 3, y - self.size // 2 - 10),
+                    (x - self.size // 6, y - self.size // 2 - 25),
+                    (x, y - self.size // 2 - 15),
+                    (x + self.size // 6, y - self.size // 2 - 25),
+                    (x + self.size // 3, y - self.size // 2 - 10),
+                    (x + self.size // 2, y - self.size // 2 - 20),
+                    (x + self.size // 2, y - self.size // 2)
                 ]
-                pygame.draw.polygon(screen, (255, 215, 0), crown_points)  # Gold color
+                pygame.draw.polygon(surface, (255, 215, 0), crown_points)  # Gold color
                 
                 # Jewels in crown
-                pygame.draw.circle(screen, RED, (self.x - self.size // 3, self.y - self.size // 2 - 15), 5)
-                pygame.draw.circle(screen, BLUE, (self.x, self.y - self.size // 2 - 15), 5)
-                pygame.draw.circle(screen, GREEN, (self.x + self.size // 3, self.y - self.size // 2 - 15), 5)
+                pygame.draw.circle(surface, RED, (x - self.size // 3, y - self.size // 2 - 15), 5)
+                pygame.draw.circle(surface, BLUE, (x, y - self.size // 2 - 15), 5)
+                pygame.draw.circle(surface, GREEN, (x + self.size // 3, y - self.size // 2 - 15), 5)
                 
                 # Glowing eyes
                 for i in range(3):
@@ -1143,84 +2130,46 @@ class Enemy:
                     radius = 12 + i * 3
                     s = pygame.Surface((radius*2, radius*2), pygame.SRCALPHA)
                     pygame.draw.circle(s, (255, 0, 0, alpha), (radius, radius), radius)
-                    screen.blit(s, (int(self.x - self.size // 3 - radius), int(self.y - self.size // 6 - radius)))
-                    screen.blit(s, (int(self.x + self.size // 3 - radius), int(self.y - self.size // 6 - radius)))
+                    surface.blit(s, (int(x - self.size // 3 - radius), int(y - self.size // 6 - radius)))
+                    surface.blit(s, (int(x + self.size // 3 - radius), int(y - self.size // 6 - radius)))
                 
                 # Evil grin
-                pygame.draw.arc(screen, WHITE, 
-                               (self.x - self.size // 3, self.y + self.size // 6, self.size * 2 // 3, self.size // 3), 
+                pygame.draw.arc(surface, WHITE, 
+                               (x - self.size // 3, y + self.size // 6, self.size * 2 // 3, self.size // 3), 
                                0, math.pi, 4)
-                
-                # Draw projectiles
-                self.draw_projectiles()
-            
-            # Draw boss health bar
-            self.draw_health_bar()
+
+    def draw_projectiles(self):
+        for p in self.projectiles:
+            pygame.draw.circle(screen, p.color, (int(p.x), int(p.y)), p.size)
             
-        # Draw ice crystals if frozen
-        if self.frozen:
-            # Draw small ice crystals around the enemy
-            for i in range(5):
-                angle = random.random() * math.pi * 2
-                distance = self.size * 0.6
-                crystal_x = self.x + math.cos(angle) * distance
-                crystal_y = self.y + math.sin(angle) * distance
-                crystal_size = random.randint(3, 6)
+            # Add glow effect for final boss projectiles
+            if self.boss_level == 4:
+                glow_size = p.size + 10
+                glow_surface = get_glow(glow_size, tuple(
+                    ((*p.color, 150 - i * 40), glow_size - i * 3) for i in range(3)))
                 
-                # Draw a small blue crystal
-                pygame.draw.polygon(screen, (100, 150, 255), [
-                    (crystal_x, crystal_y - crystal_size),
-                    (crystal_x + crystal_size, crystal_y),
-                    (crystal_x, crystal_y + crystal_size),
-                    (crystal_x - crystal_size, crystal_y)
-                ])
-        
-        # Draw slow effect if slowed
-        elif self.slowed:
-            # Draw yellow sparkles around the enemy to indicate slowdown
-            for i in range(3):
-                angle = (pygame.time.get_ticks() / 200 + i * 2.1) % (2 * math.pi)  # Rotating sparkles
-                distance = self.size * 0.7
-                sparkle_x = self.x + math.cos(angle) * distance
-                sparkle_y = self.y + math.sin(angle) * distance
-                sparkle_size = random.randint(2, 4)
-                
-                # Draw a small yellow sparkle
-                pygame.draw.circle(screen, (255, 255, 0), (int(sparkle_x), int(sparkle_y)), sparkle_size)
-
-    def draw_projectiles(self):
-        for p in self.projectiles:
-            pygame.draw.circle(screen, p['color'], (int(p['x']), int(p['y'])), p['size'])
-            
-            # Add glow effect for final boss projectiles
-            if self.boss_level == 4:
-                glow_size = p['size'] + 10
-                glow_surface = pygame.Surface((glow_size*2, glow_size*2), pygame.SRCALPHA)
-                for i in range(3):
-                    alpha = 150 - i * 40
-                    radius = glow_size - i * 3
-                    pygame.draw.circle(glow_surface, (*p['color'], alpha), (glow_size, glow_size), radius)
-                
-                screen.blit(glow_surface, (int(p['x'] - glow_size), int(p['y'] - glow_size)), special_flags=pygame.BLEND_ADD)
-
-    def update_projectiles(self):
-        new_projectiles = []
-        for p in self.projectiles:
-            p['x'] += p['dx']
-            p['y'] += p['dy']
-            
-            # Remove if out of bounds
-            if 0 <= p['x'] <= WIDTH and 0 <= p['y'] <= HEIGHT:
-                new_projectiles.append(p)
+                screen.blit(glow_surface, (int(p.x - glow_size), int(p.y - glow_size)), special_flags=pygame.BLEND_ADD)
+
+    def update_projectiles(self, dt=SIM_STEP_MS):
+        step = dt / FRAME_MS
+        new_projectiles = []
+        for p in self.projectiles:
+            p.x += p.dx * step
+            p.y += p.dy * step
+            
+            # Remove if out of bounds
+            if 0 <= p.x <= WIDTH and 0 <= p.y <= HEIGHT:
+                new_projectiles.append(p)
+            else:
+                free_projectile(p)
         
         self.projectiles = new_projectiles
 
-    def shoot(self, target_x, target_y):
+    def shoot(self, target_x, target_y, current_time):
         # Don't shoot if frozen
         if self.frozen:
             return
             
-        current_time = pygame.time.get_ticks()
         if current_time - self.last_shot > self.cooldown:
             self.last_shot = current_time
             
@@ -1233,22 +2182,24 @@ class Enemy:
             
             # Create projectile
             if self.boss_level == 4:  # Final boss shoots bigger projectiles
-                self.projectiles.append({
-                    'x': self.x, 'y': self.y,
-                    'dx': dx * 5, 'dy': dy * 5,
-                    'size': 20, 'color': (255, 0, 100),
-                    'damage': self.damage
-                })
+                self.projectiles.append(new_projectile(Projectile,
+                    kind=ProjectileKind.ENEMY_SHOT,
+                    x=self.x, y=self.y,
+                    dx=dx * 5, dy=dy * 5,
+                    size=20, color=(255, 0, 100),
+                    damage=self.damage
+                ))
             else:
-                self.projectiles.append({
-                    'x': self.x, 'y': self.y,
-                    'dx': dx * 4, 'dy': dy * 4,
-                    'size': 10, 'color': self.color,
-                    'damage': self.damage
-                })
+                self.projectiles.append(new_projectile(Projectile,
+                    kind=ProjectileKind.ENEMY_SHOT,
+                    x=self.x, y=self.y,
+                    dx=dx * 4, dy=dy * 4,
+                    size=10, color=self.color,
+                    damage=self.damage
+                ))
 
     def draw_health_bar(self):
-        if self.type == 'boss':
+        if self.type == EnemyType.BOSS:
             # Health bar dimensions
             bar_width = self.size * 1.5
             bar_height = 10
@@ -1278,14 +2229,13 @@ class Enemy:
             pygame.draw.rect(screen, BLACK, (x, y, bar_width, bar_height), 2)
             
             # Draw health text
-            font = pygame.font.SysFont('Arial', 14)
-            health_text = font.render(f"{self.health}/{self.max_health}", True, WHITE)
+            font = get_font(14)
+            health_text = render_text(font, f"{self.health}/{self.max_health}", WHITE)
             text_rect = health_text.get_rect(center=(self.x, y - 10))
             screen.blit(health_text, text_rect)
 
-    def move(self, player_x, player_y, modifier=1.0):
+    def move(self, player_x, player_y, current_time, modifier=1.0, step=1.0):
         # Don't move if frozen
-        current_time = pygame.time.get_ticks()
         if self.frozen and current_time < self.frozen_until:
             return
         elif self.frozen:
@@ -1305,169 +2255,167 @@ class Enemy:
         # Move towards player
         dx = player_x - self.x
         dy = player_y - self.y
-        distance = max(1, (dx**2 + dy**2)**0.5)  # Avoid division by zero
+        # math.sqrt and x * x, not ** (libm pow), which can round differently
+        # from the NumPy ops EnemyBatch.move uses
+        distance = max(1, math.sqrt(dx * dx + dy * dy))  # Avoid division by zero
         dx /= distance
         dy /= distance
         
         # Apply speed and modifier
-        self.x += dx * self.speed * current_modifier
-        self.y += dy * self.speed * current_modifier
+        self.x += dx * self.speed * current_modifier * step
+        self.y += dy * self.speed * current_modifier * step
     
-    def freeze(self, duration):
+    def freeze(self, duration, current_time):
         self.frozen = True
-        self.frozen_until = pygame.time.get_ticks() + duration
+        self.frozen_until = current_time + duration
     
-    def slow(self, duration, factor):
+    def slow(self, duration, factor, current_time):
         self.slowed = True
-        self.slowed_until = pygame.time.get_ticks() + duration
+        self.slowed_until = current_time + duration
         self.slow_factor = factor  # Factor < 1.0 means slower
     
-    def is_hit_by_projectile(self, projectile):
-        # For projectiles that can pass through enemies
-        penetrates = projectile.get('penetrate', False)
-        
-        if projectile['type'] == 'sword':
-            # For sword, check distance from sword center
-            dx = self.x - projectile['x']
-            dy = self.y - projectile['y']
-            distance = (dx**2 + dy**2)**0.5
-            
-            # Increase effective hitbox for sword's length
-            sword_reach = projectile['length'] // 2 + self.size // 2
-            return distance < sword_reach
-        
-        elif projectile['type'] == 'knight_arc_wave':
-            # For knight's arc wave, check if enemy is in the arc area
-            # Calculate distance from player (wave origin)
-            dx = self.x - projectile['x']
-            dy = self.y - projectile['y']
-            distance = (dx**2 + dy**2)**0.5
-            
-            # Calculate angle between wave direction and enemy
-            wave_angle = projectile['angle']
-            enemy_angle = math.atan2(dy, dx)
-            
-            # Normalize angle difference
-            angle_diff = abs((enemy_angle - wave_angle + math.pi) % (2 * math.pi) - math.pi)
-            
-            # Check if enemy is within wave's arc width and range
-            arc_radius = min(projectile['range'], projectile['stage'] * 10)
-            arc_width_rad = math.radians(projectile['width'] / 2)
-            
-            return distance <= arc_radius and angle_diff <= arc_width_rad
-        
-        elif projectile['type'] == 'beam':
-            # For robot's awakening beam, check if enemy is in the beam's path
-            start_x, start_y = projectile['x'], projectile['y']
-            beam_angle = projectile['angle']
-            beam_length = projectile['length']
-            
-            # Calculate end point of beam
-            end_x = start_x + math.cos(beam_angle) * beam_length
-            end_y = start_y + math.sin(beam_angle) * beam_length
-            
-            # Calculate closest point on line segment to enemy center
-            line_vec_x = end_x - start_x
-            line_vec_y = end_y - start_y
-            line_len = (line_vec_x**2 + line_vec_y**2)**0.5
-            
-            if line_len == 0:  # If beam has zero length
-                return False
-                
-            # Normalize line vector
-            line_vec_x /= line_len
-            line_vec_y /= line_len
-            
-            # Calculate vector from start point to enemy
-            enemy_vec_x = self.x - start_x
-            enemy_vec_y = self.y - start_y
-            
-            # Project enemy vector onto line vector (dot product)
-            projection = enemy_vec_x * line_vec_x + enemy_vec_y * line_vec_y
-            
-            # Clamp projection to line segment
-            projection = max(0, min(line_len, projection))
-            
-            # Calculate closest point on line
-            closest_x = start_x + projection * line_vec_x
-            closest_y = start_y + projection * line_vec_y
-            
-            # Calculate distance from closest point to enemy center
-            dx = self.x - closest_x
-            dy = self.y - closest_y
-            distance = (dx**2 + dy**2)**0.5
-            
-            # Check if enemy is within beam width
-            beam_width = projectile['width'] + self.size // 2
-            return distance < beam_width
-            
-        elif projectile['type'] == 'explosion':
-            # Check if enemy is within explosion radius
-            dx = self.x - projectile['x']
-            dy = self.y - projectile['y']
-            distance = (dx**2 + dy**2)**0.5
-            return distance < (projectile['radius'] + self.size // 2)
-            
-        elif projectile['type'] == 'samurai_slice':
-            # For samurai's slice, check if enemy is in range and within the slice angle
-            dx = self.x - projectile['x']
-            dy = self.y - projectile['y']
-            distance = (dx**2 + dy**2)**0.5
-            
-            if distance > projectile['size'] + self.size // 2:
-                return False
-                
-            # Check if enemy is within the slice angle
-            enemy_angle = math.atan2(dy, dx)
-            slice_angle = projectile['angle']
-            
-            # Calculate angle difference
-            angle_diff = abs((enemy_angle - slice_angle + math.pi) % (2 * math.pi) - math.pi)
-            
-            # Check if within slice width
-            return angle_diff <= math.radians(projectile['width'] / 2)
-            
-        elif projectile['type'] == 'sniper_bullet':
-            # For sniper's rectangular bullet
-            dx = self.x - projectile['x']
-            dy = self.y - projectile['y']
-            distance = (dx**2 + dy**2)**0.5
-            
-            # Use a slightly larger hitbox for rectangular bullet
-            bullet_reach = max(projectile['length'], projectile['size']) / 2 + self.size / 2
-            return distance < bullet_reach
-        
-        elif projectile['type'] == 'bouncing_ball':
-            # For sniper's bouncing ball awakening
-            dx = self.x - projectile['x']
-            dy = self.y - projectile['y']
-            distance = (dx**2 + dy**2)**0.5
-            
-            hit = distance < (self.size // 2 + projectile['size'])
-            return hit
-            
-        elif projectile['type'] == 'slow_wave':
-            # For shooter's awakening slow wave
-            dx = self.x - projectile['x']
-            dy = self.y - projectile['y']
-            distance = (dx**2 + dy**2)**0.5
-            
-            # If hit by slow wave, apply slow effect
-            if distance < (self.size // 2 + projectile['size'] * 1.5):
-                self.slow(projectile['slow_duration'], projectile['slow_factor'])
-                return True
-            return False
-            
-        else:
-            # For bullet/laser/magic projectiles
-            dx = self.x - projectile['x']
-            dy = self.y - projectile['y']
-            distance = (dx**2 + dy**2)**0.5
-            hit = distance < (self.size // 2 + projectile['size'])
-            return hit
+    def is_hit_by_projectile(self, projectile, current_time):
+        return HIT_KERNELS[projectile.kind](self, projectile, current_time)
+
+# Collision kernels, one per projectile shape. Each takes (enemy, projectile,
+# current_time) and compares squared distances, so the common miss costs no
+# sqrt; the angle test of the sector shapes only runs for enemies in range.
+
+def hit_circle(enemy, p, current_time):
+    # Bullet, laser, magic and the other round projectiles
+    dx = enemy.x - p.x
+    dy = enemy.y - p.y
+    reach = enemy.size // 2 + p.size
+    return dx * dx + dy * dy < reach * reach
+
+def hit_explosion(enemy, p, current_time):
+    dx = enemy.x - p.x
+    dy = enemy.y - p.y
+    reach = p.radius + enemy.size // 2
+    return dx * dx + dy * dy < reach * reach
+
+def hit_slow_wave(enemy, p, current_time):
+    # Shooter's awakening: slows whatever it hits
+    dx = enemy.x - p.x
+    dy = enemy.y - p.y
+    reach = enemy.size // 2 + p.size * 1.5
+    if dx * dx + dy * dy < reach * reach:
+        enemy.slow(p.slow_duration, p.slow_factor, current_time)
+        return True
+    return False
+
+def hit_sword(enemy, p, current_time):
+    # Reach circle around the sword's centre: half the blade plus the enemy
+    dx = enemy.x - p.x
+    dy = enemy.y - p.y
+    reach = p.length // 2 + enemy.size // 2
+    return dx * dx + dy * dy < reach * reach
+
+def hit_sniper_bullet(enemy, p, current_time):
+    # Rectangular bullet, with a slightly larger hitbox than its width
+    dx = enemy.x - p.x
+    dy = enemy.y - p.y
+    reach = max(p.length, p.size) / 2 + enemy.size / 2
+    return dx * dx + dy * dy < reach * reach
+
+def hit_segment(enemy, p, current_time):
+    # Robot's beam: distance from the enemy to the closest point on the beam
+    if p.length <= 0:
+        return False
+    ex = enemy.x - p.x
+    ey = enemy.y - p.y
+    reach = p.width + enemy.size // 2
+    projection = ex * p.dir_x + ey * p.dir_y
+    projection = max(0, min(p.length, projection))
+    dx = ex - projection * p.dir_x
+    dy = ey - projection * p.dir_y
+    return dx * dx + dy * dy < reach * reach
+
+def in_sector(dx, dy, radius, angle, half_width):
+    # Within radius of the sector's origin and half_width radians of its direction
+    if dx * dx + dy * dy > radius * radius:
+        return False
+    angle_diff = abs((math.atan2(dy, dx) - angle + math.pi) % (2 * math.pi) - math.pi)
+    return angle_diff <= half_width
+
+def hit_arc_wave(enemy, p, current_time):
+    # Knight's arc wave grows outward from where it was cast
+    arc_radius = min(p.range, p.stage * 10)
+    return in_sector(enemy.x - p.x, enemy.y - p.y, arc_radius, p.angle, p.half_width)
+
+def hit_samurai_slice(enemy, p, current_time):
+    return in_sector(enemy.x - p.x, enemy.y - p.y, p.size + enemy.size // 2, p.angle, p.half_width)
+
+HIT_KERNELS = {kind: hit_circle for kind in ProjectileKind}
+HIT_KERNELS.update({
+    ProjectileKind.EXPLOSION: hit_explosion,
+    ProjectileKind.SLOW_WAVE: hit_slow_wave,
+    ProjectileKind.SWORD: hit_sword,
+    ProjectileKind.SNIPER_BULLET: hit_sniper_bullet,
+    ProjectileKind.BEAM: hit_segment,
+    ProjectileKind.KNIGHT_ARC_WAVE: hit_arc_wave,
+    ProjectileKind.SAMURAI_SLICE: hit_samurai_slice,
+})
+
+# The area-of-effect kernels again, for arrays of enemy positions and sizes
+# (EnemyBatch columns). Each returns a hit mask with the same result as the
+# single-enemy kernel for every enemy.
+
+def segment_hit_mask(p, xs, ys, sizes):
+    if p.length <= 0:
+        return np.zeros(len(xs), dtype=bool)
+    ex = xs - p.x
+    ey = ys - p.y
+    reach = p.width + sizes // 2
+    projection = np.clip(ex * p.dir_x + ey * p.dir_y, 0, p.length)
+    dx = ex - projection * p.dir_x
+    dy = ey - projection * p.dir_y
+    return dx * dx + dy * dy < reach * reach
+
+def sector_mask(dx, dy, radius, angle, half_width):
+    # The radius test is vectorized; the angle test uses math.atan2 like
+    # in_sector, since np.arctan2 can round differently by an ulp and flip
+    # an enemy right on the edge
+    inside = dx * dx + dy * dy <= radius * radius
+    candidates = np.flatnonzero(inside)
+    for i, x, y in zip(candidates.tolist(), dx[candidates].tolist(), dy[candidates].tolist()):
+        inside[i] = abs((math.atan2(y, x) - angle + math.pi) % (2 * math.pi) - math.pi) <= half_width
+    return inside
+
+def arc_wave_hit_mask(p, xs, ys, sizes):
+    arc_radius = min(p.range, p.stage * 10)
+    return sector_mask(xs - p.x, ys - p.y, arc_radius, p.angle, p.half_width)
+
+def samurai_slice_hit_mask(p, xs, ys, sizes):
+    return sector_mask(xs - p.x, ys - p.y, p.size + sizes // 2, p.angle, p.half_width)
+
+AREA_HIT_MASKS = {
+    ProjectileKind.BEAM: segment_hit_mask,
+    ProjectileKind.KNIGHT_ARC_WAVE: arc_wave_hit_mask,
+    ProjectileKind.SAMURAI_SLICE: samurai_slice_hit_mask,
+}
+
+def area_hit_set(p, enemies, xs, ys, sizes):
+    # The set of enemies an area-of-effect projectile hits, tested against
+    # all of them at once. A set rather than a mask, because removing
+    # enemies moves batch rows around.
+    if not enemies:
+        return set()
+    mask = AREA_HIT_MASKS[p.kind](p, xs, ys, sizes)
+    return {enemies[i] for i in np.flatnonzero(mask).tolist()}
+
+enemy_pool = Pool(Enemy)
+
+def pool_stats():
+    # Free-list sizes and hit rates, keyed by record class name
+    stats = {cls.__name__: pool.stats() for cls, pool in projectile_pools.items()}
+    stats['Enemy'] = enemy_pool.stats()
+    return stats
 
 # Heart drop class
 class Heart:
+    __slots__ = ('x', 'y', 'size', 'color', 'is_boss_heart')
+    
     def __init__(self, x, y, is_boss_heart=False):
         self.x = x
         self.y = y
@@ -1478,42 +2426,875 @@ class Heart:
     
     def draw(self):
         # Draw a heart shape
-        pygame.draw.circle(screen, self.color, (self.x - self.size // 4, self.y - self.size // 4), self.size // 2)
-        pygame.draw.circle(screen, self.color, (self.x + self.size // 4, self.y - self.size // 4), self.size // 2)
-        points = [
-            (self.x - self.size // 2, self.y - self.size // 5),
-            (self.x + self.size // 2, self.y - self.size // 5),
-            (self.x, self.y + self.size // 2)
-        ]
-        pygame.draw.polygon(screen, self.color, points)
+        sprite, left, top = self.sprite()
+        screen.blit(sprite, (int(self.x) + left, int(self.y) + top))
         
         # Add glow effect for boss hearts
         if self.is_boss_heart:
             glow_size = self.size + 10
-            glow_surface = pygame.Surface((glow_size*2, glow_size*2), pygame.SRCALPHA)
             
             # Draw the glow as a soft circle
-            for i in range(3):
-                alpha = 100 - i * 30
-                size = glow_size - i * 3
-                pygame.draw.circle(glow_surface, (*self.color, alpha), (glow_size, glow_size), size)
+            glow_surface = get_glow(glow_size, tuple(
+                ((*self.color, 100 - i * 30), glow_size - i * 3) for i in range(3)))
             
             screen.blit(glow_surface, (self.x - glow_size, self.y - glow_size), special_flags=pygame.BLEND_ADD)
     
+    def sprite(self):
+        # The cached look draw() blits
+        return get_sprite(('heart', self.size, self.color), self.size, self.paint)
+    
+    def bounds(self):
+        # Screen area draw() covers, glow included
+        if self.is_boss_heart:
+            return centered_rect(self.x, self.y, self.size + 10)
+        return sprite_rect(self.sprite(), self.x, self.y)
+    
+    def paint(self, surface, x, y):
+        pygame.draw.circle(surface, self.color, (x - self.size // 4, y - self.size // 4), self.size // 2)
+        pygame.draw.circle(surface, self.color, (x + self.size // 4, y - self.size // 4), self.size // 2)
+        points = [
+            (x - self.size // 2, y - self.size // 5),
+            (x + self.size // 2, y - self.size // 5),
+            (x, y + self.size // 2)
+        ]
+        pygame.draw.polygon(surface, self.color, points)
+    
     def is_collected(self, player_x, player_y, player_size):
         dx = self.x - player_x
         dy = self.y - player_y
         distance = (dx**2 + dy**2)**0.5
         return distance < (player_size // 2 + self.size // 2)
 
+# Uniform grid spatial hash for the player projectile vs enemy broad phase.
+# Items go into every cell their area touches; a query returns the items
+# sharing a cell with the query box, so each enemy is only tested against
+# projectiles near it instead of every projectile on screen.
+SPATIAL_CELL_SIZE = 64
+# Enemies never leave this area (they spawn just above the screen and chase
+# the player), so huge areas like the 900 px arc wave are clipped to it
+SPATIAL_MARGIN = 200
+
+class SpatialHash:
+    def __init__(self, cell_size=SPATIAL_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+    
+    def clear(self):
+        self.cells.clear()
+    
+    def add(self, item, cell):
+        bucket = self.cells.get(cell)
+        if bucket is None:
+            self.cells[cell] = [item]
+        else:
+            bucket.append(item)
+    
+    def insert(self, item, min_x, min_y, max_x, max_y):
+        cs = self.cell_size
+        cells = self.cells
+        for cx in range(int(min_x // cs), int(max_x // cs) + 1):
+            for cy in range(int(min_y // cs), int(max_y // cs) + 1):
+                bucket = cells.get((cx, cy))
+                if bucket is None:
+                    cells[(cx, cy)] = [item]
+                else:
+                    bucket.append(item)
+    
+    def insert_circle(self, item, x, y, radius):
+        self.insert(item, x - radius, y - radius, x + radius, y + radius)
+    
+    def insert_circles(self, items, xs, ys, radii):
+        # Insert circles from NumPy arrays, one per entry of items
+        cs = self.cell_size
+        cells = self.cells
+        min_cx = np.floor_divide(xs - radii, cs).astype(int).tolist()
+        min_cy = np.floor_divide(ys - radii, cs).astype(int).tolist()
+        max_cx = np.floor_divide(xs + radii, cs).astype(int).tolist()
+        max_cy = np.floor_divide(ys + radii, cs).astype(int).tolist()
+        for item, x0, y0, x1, y1 in zip(items, min_cx, min_cy, max_cx, max_cy):
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    bucket = cells.get((cx, cy))
+                    if bucket is None:
+                        cells[(cx, cy)] = [item]
+                    else:
+                        bucket.append(item)
+    
+    def insert_segment(self, item, x0, y0, x1, y1, radius):
+        # Thick line (beam): walk along it in half-cell steps and only insert
+        # the cells near the line, not its whole bounding box
+        cs = self.cell_size
+        length = math.hypot(x1 - x0, y1 - y0)
+        samples = int(length / (cs / 2)) + 1
+        cells = set()
+        for i in range(samples + 1):
+            t = i / samples
+            px = x0 + (x1 - x0) * t
+            py = y0 + (y1 - y0) * t
+            for cx in range(int((px - radius) // cs), int((px + radius) // cs) + 1):
+                for cy in range(int((py - radius) // cs), int((py + radius) // cs) + 1):
+                    cells.add((cx, cy))
+        for cell in cells:
+            self.add(item, cell)
+    
+    def insert_sector(self, item, x, y, radius, angle, half_width):
+        # Pie slice (arc wave, samurai slice): only cells that could overlap
+        # the slice, using a conservative distance and angle test per cell
+        cs = self.cell_size
+        half_diagonal = cs * 0.7072
+        # Clip to the area enemies can be in
+        min_x = max(x - radius, -SPATIAL_MARGIN)
+        min_y = max(y - radius, -SPATIAL_MARGIN)
+        max_x = min(x + radius, WIDTH + SPATIAL_MARGIN)
+        max_y = min(y + radius, HEIGHT + SPATIAL_MARGIN)
+        for cx in range(int(min_x // cs), int(max_x // cs) + 1):
+            for cy in range(int(min_y // cs), int(max_y // cs) + 1):
+                dx = (cx + 0.5) * cs - x
+                dy = (cy + 0.5) * cs - y
+                distance = math.hypot(dx, dy)
+                if distance > radius + half_diagonal:
+                    continue
+                if distance > half_diagonal:
+                    slack = math.asin(half_diagonal / distance)
+                    angle_diff = abs((math.atan2(dy, dx) - angle + math.pi) % (2 * math.pi) - math.pi)
+                    if angle_diff > half_width + slack:
+                        continue
+                self.add(item, (cx, cy))
+    
+    def query(self, min_x, min_y, max_x, max_y):
+        # Returns the distinct items near the box, in insertion order
+        cs = self.cell_size
+        cells = self.cells
+        found = set()
+        for cx in range(int(min_x // cs), int(max_x // cs) + 1):
+            for cy in range(int(min_y // cs), int(max_y // cs) + 1):
+                bucket = cells.get((cx, cy))
+                if bucket:
+                    found.update(bucket)
+        return sorted(found)
+
+def insert_projectile(grid, index, p):
+    # Insert a player projectile along the whole area it can hit. The reach
+    # here matches the HIT_KERNELS kernel minus the enemy's own size,
+    # which the enemy adds to its query box.
+    if p.kind == ProjectileKind.BEAM:
+        grid.insert_segment(index, p.x, p.y, p.end_x, p.end_y, p.width)
+    elif p.kind == ProjectileKind.KNIGHT_ARC_WAVE:
+        arc_radius = min(p.range, p.stage * 10)
+        grid.insert_sector(index, p.x, p.y, arc_radius, p.angle, p.half_width)
+    elif p.kind == ProjectileKind.SAMURAI_SLICE:
+        grid.insert_sector(index, p.x, p.y, p.size, p.angle, p.half_width)
+    elif p.kind == ProjectileKind.SWORD:
+        grid.insert_circle(index, p.x, p.y, p.length // 2)
+    elif p.kind == ProjectileKind.SNIPER_BULLET:
+        grid.insert_circle(index, p.x, p.y, max(p.length, p.size) / 2)
+    elif p.kind == ProjectileKind.EXPLOSION:
+        grid.insert_circle(index, p.x, p.y, p.radius)
+    elif p.kind == ProjectileKind.SLOW_WAVE:
+        grid.insert_circle(index, p.x, p.y, p.size * 1.5)
+    else:
+        grid.insert_circle(index, p.x, p.y, p.size)
+
+# Dirty-rectangle presentation (--dirty-rects). Each frame records the
+# screen areas it drew into. The next frame erases only those areas instead
+# of filling the whole screen, and only last frame's and this frame's areas
+# are sent to the display. An entity's area last frame and this frame mostly
+# overlap, so overlapping areas are merged before they're measured and sent.
+# Frames that cover too much of the screen (most awakening effects) are
+# presented with a full flip instead.
+DIRTY_FULL_FRAME_RATIO = 0.4  # Dirty area, as a fraction of the screen, above which we flip
+
+def centered_rect(x, y, half_size):
+    # Square around (x, y), with a pixel to spare for rounding
+    half_size += 2
+    return pygame.Rect(int(x) - half_size, int(y) - half_size, half_size * 2, half_size * 2)
+
+def projectile_bounds(p):
+    # Screen area a projectile draws into, or None if it may draw anywhere
+    if p.kind == ProjectileKind.KNIGHT_ARC_WAVE:
+        return None
+    if p.kind == ProjectileKind.BOUNCING_BALL:
+        # Pulsing glow up to 1.95 times the ball's size, and a trail up to
+        # ten steps back
+        steps = min(5, p.bounces + 1) * 2
+        return centered_rect(p.x, p.y, int(p.size * 2)).union(
+            centered_rect(p.x - p.dx * steps, p.y - p.dy * steps, int(p.size)))
+    if p.kind == ProjectileKind.BEAM:
+        glow = p.width + 8  # Widest glow layer
+        rect = pygame.Rect(int(min(p.x, p.end_x)), int(min(p.y, p.end_y)),
+                           int(abs(p.end_x - p.x)) + 1, int(abs(p.end_y - p.y)) + 1)
+        return rect.inflate(glow * 2 + 4, glow * 2 + 4)
+    if p.kind == ProjectileKind.SAMURAI_SLICE:
+        return centered_rect(p.x, p.y, p.size + 2)  # Slice and trail
+    if p.kind in (ProjectileKind.SWORD, ProjectileKind.SNIPER_BULLET):
+        return centered_rect(p.x, p.y, (p.length + p.size) // 2)  # Rotated rect
+    if p.kind == ProjectileKind.MAGIC_ORB:
+        return centered_rect(p.x, p.y, p.size + 10)  # Glow
+    if p.kind == ProjectileKind.EXPLOSION:
+        return centered_rect(p.x, p.y, int(p.radius))
+    if p.kind == ProjectileKind.FREEZE_WAVE:
+        return centered_rect(p.x, p.y, 15)
+    if p.kind == ProjectileKind.SLOW_WAVE:
+        return centered_rect(p.x, p.y, 30)  # Golden glow
+    return centered_rect(p.x, p.y, int(p.size))
+
+def merge_rects(rects):
+    # Replace overlapping rects with their union until none overlap
+    merged = []
+    for rect in rects:
+        if not rect.w or not rect.h:
+            continue
+        rect = rect.copy()
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+class DirtyRects:
+    def __init__(self, threshold=DIRTY_FULL_FRAME_RATIO):
+        self.threshold = threshold
+        self.previous = None  # Areas drawn last frame; None means the whole screen
+        self.current = []
+        self.full = False  # Something this frame may have drawn anywhere
+    
+    def add(self, rect):
+        if rect is None:
+            self.full = True
+        else:
+            self.current.append(rect)
+    
+    def invalidate(self):
+        # The screen was drawn without tracking (menus, pause overlay)
+        self.previous = None
+        self.current = []
+        self.full = False
+    
+    def erase(self, surface, color=BLACK):
+        if self.previous is None:
+            surface.fill(color)
+        else:
+            for rect in self.previous:
+                surface.fill(color, rect)
+    
+    def present(self):
+        # Show this frame and return the rects sent to the display (None for a flip)
+        rects = None
+        if not self.full and self.previous is not None:
+            screen_rect = screen.get_rect()
+            rects = merge_rects([rect.clip(screen_rect) for rect in self.previous + self.current])
+            if sum(rect.w * rect.h for rect in rects) > self.threshold * WIDTH * HEIGHT:
+                rects = None
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+        self.previous = None if self.full else self.current
+        self.current = []
+        self.full = False
+        return rects
+
+PROFILE_WINDOW = 120  # Frames averaged by the profiler overlay
+PROFILE_REFRESH = 15  # Frames between overlay redraws
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of an already sorted sequence
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+# Times each phase of a frame (or headless tick) and keeps every sample from
+# the current game, so the overlay can show rolling averages and export()
+# can report percentiles. mark(phase) charges the time since the previous
+# mark to that phase; update_game may run several times in a frame and its
+# phases add up. A game usually ends partway through a frame, so an export
+# asked for then is written by end_frame, once that frame's sample is in.
+class FrameProfiler:
+    PHASES = ('input', 'movement', 'spawning', 'collision', 'drawing', 'display')
+    COUNTS = ('enemies', 'player_projectiles', 'enemy_projectiles', 'hearts')
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.samples = {name: array('d') for name in self.PHASES + ('frame',)}
+        self.counts = {name: array('l') for name in self.COUNTS}
+        self.current = dict.fromkeys(self.PHASES, 0.0)
+        self.frame_start = self.last = time.perf_counter()
+        self.overlay = None  # Cached overlay surface, redrawn every PROFILE_REFRESH frames
+        self.in_frame = False
+        self.export_path = None  # Export waiting for the current frame to end
+    
+    def begin_frame(self):
+        self.in_frame = True
+        self.frame_start = self.last = time.perf_counter()
+        for name in self.PHASES:
+            self.current[name] = 0.0
+    
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.current[phase] += (now - self.last) * 1000
+        self.last = now
+    
+    def end_frame(self, counts):
+        for name in self.PHASES:
+            self.samples[name].append(self.current[name])
+        self.samples['frame'].append((self.last - self.frame_start) * 1000)
+        for name in self.COUNTS:
+            self.counts[name].append(counts[name])
+        if len(self.samples['frame']) % PROFILE_REFRESH == 0:
+            self.overlay = None
+        self.in_frame = False
+        if self.export_path is not None:
+            path, self.export_path = self.export_path, None
+            self.export(path)
+    
+    def frames(self):
+        return len(self.samples['frame'])
+    
+    def summary(self):
+        # Mean, p50, p95, p99 and max of every phase (ms), the whole frame
+        # (ms) and every entity count
+        metrics = {}
+        for name, values in list(self.samples.items()) + list(self.counts.items()):
+            ordered = sorted(values)
+            metrics[name] = {
+                'mean': sum(ordered) / len(ordered) if ordered else 0.0,
+                'p50': percentile(ordered, 0.50),
+                'p95': percentile(ordered, 0.95),
+                'p99': percentile(ordered, 0.99),
+                'max': ordered[-1] if ordered else 0.0,
+            }
+        return {'frames': self.frames(), 'metrics': metrics}
+    
+    def export(self, path):
+        # JSON for .json paths, CSV (one row per metric) otherwise
+        if self.in_frame:
+            self.export_path = path
+            return
+        summary = self.summary()
+        with open(path, 'w', newline='') as file:
+            if path.lower().endswith('.json'):
+                json.dump(summary, file, indent=2)
+            else:
+                writer = csv.writer(file)
+                writer.writerow(['metric', 'mean', 'p50', 'p95', 'p99', 'max'])
+                for name, stats in summary['metrics'].items():
+                    writer.writerow([name] + [round(stats[key], 4) for key in ('mean', 'p50', 'p95', 'p99', 'max')])
+    
+    def draw_overlay(self, surface, x, y):
+        # Rolling ms per phase and the latest entity counts; returns the rect drawn
+        if self.overlay is None:
+            font = get_font(14)
+            lines = []
+            for name in self.PHASES + ('frame',):
+                recent = self.samples[name][-PROFILE_WINDOW:]
+                mean = sum(recent) / len(recent) if recent else 0.0
+                lines.append(f"{name}: {mean:.2f} ms")
+            for name in self.COUNTS:
+                count = self.counts[name][-1] if self.counts[name] else 0
+                lines.append(f"{name.replace('_', ' ')}: {count}")
+            texts = [font.render(line, True, WHITE) for line in lines]
+            width = max(text.get_width() for text in texts) + 12
+            height = sum(text.get_height() for text in texts) + 12
+            self.overlay = pygame.Surface((width, height), pygame.SRCALPHA)
+            self.overlay.fill((0, 0, 0, 160))
+            top = 6
+            for text in texts:
+                self.overlay.blit(text, (6, top))
+                top += text.get_height()
+        return surface.blit(self.overlay, (x, y - self.overlay.get_height()))
+
+# Game state snapshots are nested tuples of plain values (see
+# Game.snapshot_state), stored with marshal, which is fast and compact but
+# tied to the Python version that wrote them.
+STATE_VERSION = 2
+SNAPSHOT_MAGIC = b'ECSS'  # Starts a save_snapshot() file
+SNAPSHOT_FILE = "savestate.bin"
+
+def pack_state(state):
+    return marshal.dumps(state)
+
+def unpack_state(blob):
+    state = marshal.loads(blob)
+    if state[0] != STATE_VERSION:
+        raise ValueError(f"Snapshot version {state[0]}, expected {STATE_VERSION}")
+    return state
+
+def write_varint(buf, value):
+    # Unsigned LEB128
+    while value >= 0x80:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def write_signed_varint(buf, value):
+    write_varint(buf, value * 2 if value >= 0 else -value * 2 - 1)  # Zigzag
+
+def read_signed_varint(data, pos):
+    value, pos = read_varint(data, pos)
+    return (value >> 1) ^ -(value & 1), pos
+
+# Per-tick state checksums, to find the first tick where two runs of the
+# same game (a recording and its replay, NumPy and --no-numpy) stop
+# agreeing. Each checksummed value (player position and health, score,
+# enemy positions and health, projectile positions) is hashed by its exact
+# float64 bits together with a seed for its kind, and the hashes are added
+# up mod 2**64, so the order entities are stored in doesn't matter (bullets
+# live in a ProjectileStore with NumPy and in the projectile list without).
+# With NumPy the hashing is done a column at a time over every entity.
+CHECKSUM_SEEDS = (0x9e3779b97f4a7c15, 0x632be59bd9b4e019, 0x85157af5ee9f5d3b,
+                  0xd6e8feb86659fd93, 0xa0761d6478bd642f)  # Player, score, enemies, projectiles, enemy shots
+MASK64 = 2 ** 64 - 1
+
+def mix64(h):
+    # SplitMix64 finalizer, for Python ints or NumPy uint64 arrays
+    h = (h ^ (h >> 30)) * 0xbf58476d1ce4e5b9 & MASK64
+    h = (h ^ (h >> 27)) * 0x94d049bb133111eb & MASK64
+    return h ^ (h >> 31)
+
+def state_checksum(game):
+    player = game.player
+    enemies = game.enemies
+    batch = game.enemy_batch
+    if batch is not None:
+        n = len(batch)
+        enemy_columns = (batch.x[:n], batch.y[:n], [enemy.health for enemy in batch.members])
+    else:
+        enemy_columns = ([enemy.x for enemy in enemies], [enemy.y for enemy in enemies],
+                         [enemy.health for enemy in enemies])
+    projectile_x = [p.x for p in player.projectiles]
+    projectile_y = [p.y for p in player.projectiles]
+    bullets = player.bullets
+    shot_x = [p.x for enemy in enemies for p in enemy.projectiles]
+    shot_y = [p.y for enemy in enemies for p in enemy.projectiles]
+    
+    if np is None:
+        sections = (([player.x], [player.y], [player.health]), ([game.score], [0], [0]), enemy_columns,
+                    (projectile_x, projectile_y, [0] * len(projectile_x)), (shot_x, shot_y, [0] * len(shot_x)))
+        total = 0
+        for seed, columns in zip(CHECKSUM_SEEDS, sections):
+            xs, ys, values = (array('Q', array('d', column).tobytes()) for column in columns)
+            for x, y, value in zip(xs, ys, values):
+                total += mix64(mix64(mix64(seed ^ x) ^ y) ^ value)
+        return total & MASK64
+    
+    if bullets is not None:
+        projectile_x = np.concatenate((projectile_x, bullets.x[:bullets.count]))
+        projectile_y = np.concatenate((projectile_y, bullets.y[:bullets.count]))
+    counts = (1, 1, len(enemies), len(projectile_x), len(shot_x))
+    x = np.concatenate(([player.x, game.score], enemy_columns[0], projectile_x, shot_x)).astype(np.float64)
+    y = np.concatenate(([player.y, 0], enemy_columns[1], projectile_y, shot_y)).astype(np.float64)
+    value = np.zeros(len(x))
+    value[0] = player.health
+    value[2:2 + len(enemies)] = enemy_columns[2]
+    h = np.repeat(np.array(CHECKSUM_SEEDS, dtype=np.uint64), counts)
+    for column in (x, y, value):
+        h = mix64(h ^ column.view(np.uint64))
+    return int(h.sum(dtype=np.uint64))
+
+def read_checksums(path):
+    # A --checksums file: "tick checksum" lines -> {tick: checksum}
+    with open(path) as f:
+        return {int(tick): int(value, 16) for tick, value in (line.split() for line in f if line.strip())}
+
+def write_checksums(path, checksums, first_tick):
+    with open(path, 'w') as f:
+        for tick, value in enumerate(checksums, first_tick):
+            f.write(f"{tick} {value:016x}\n")
+
+def first_divergence(checksums, reference):
+    # The first tick both {tick: checksum} maps have that they disagree on
+    for tick in sorted(checksums.keys() & reference.keys()):
+        if checksums[tick] != reference[tick]:
+            return tick
+    return None
+
+# Recordings: the settings a game started with, the movement keys held on
+# every tick and every mouse action, plus a full state keyframe at tick 0
+# and every REPLAY_KEYFRAME_TICKS ticks after, which is everything
+# update_game needs to play the game out again from any keyframe (and lets
+# warm-started games be recorded too), and the state checksum after every
+# tick, to check a replay against. File layout:
+#   REPLAY_MAGIC, version (uint16), header length (uint32), JSON header
+#   per segment: zlib(keyframe state), zlib(inputs for the segment's ticks),
+#                zlib(its checksums, uint64 each)
+#   index: one REPLAY_INDEX_ENTRY per segment
+#   footer: REPLAY_FOOTER (index offset, segment count, REPLAY_MAGIC), the
+#           last REPLAY_FOOTER.size bytes of the file
+# A segment's inputs are its key masks run-length encoded (run length
+# varint, mask byte), then its action count and actions, each stored as
+# tick and game time deltas (varints) plus action byte and int16 x, y.
+REPLAY_MAGIC = b'ECSR'
+REPLAY_VERSION = 3
+REPLAY_KEYFRAME_TICKS = 600  # 10 seconds of game time
+# First tick, end tick, keyframe offset/size, inputs offset/size, checksums offset/size
+REPLAY_INDEX_ENTRY = struct.Struct('<IIQIQIQI')
+REPLAY_FOOTER = struct.Struct('<QI4s')
+REPLAY_POSITION = struct.Struct('<hh')
+
+def encode_inputs(keys, actions, start_tick):
+    buf = bytearray()
+    run_start = 0
+    for i in range(1, len(keys) + 1):
+        if i == len(keys) or keys[i] != keys[run_start]:
+            write_varint(buf, i - run_start)
+            buf.append(keys[run_start])
+            run_start = i
+    write_varint(buf, len(actions))
+    previous_tick, previous_time = start_tick, 0
+    for tick, action, x, y, current_time in actions:
+        write_varint(buf, tick - previous_tick)
+        write_signed_varint(buf, current_time - previous_time)
+        buf.append(action)
+        buf += REPLAY_POSITION.pack(x, y)
+        previous_tick, previous_time = tick, current_time
+    return zlib.compress(bytes(buf), 9)
+
+def decode_inputs(blob, start_tick, tick_count):
+    data = zlib.decompress(blob)
+    keys = bytearray()
+    pos = 0
+    while len(keys) < tick_count:
+        run, pos = read_varint(data, pos)
+        keys += bytes((data[pos],)) * run
+        pos += 1
+    count, pos = read_varint(data, pos)
+    actions = []
+    tick, current_time = start_tick, 0
+    for _ in range(count):
+        delta, pos = read_varint(data, pos)
+        time_delta, pos = read_signed_varint(data, pos)
+        tick += delta
+        current_time += time_delta
+        action = data[pos]
+        x, y = REPLAY_POSITION.unpack_from(data, pos + 1)
+        pos += 1 + REPLAY_POSITION.size
+        actions.append((tick, action, x, y, current_time))
+    return keys, actions
+
+class InputRecorder:
+    def __init__(self, character_type, swarm):
+        self.header = {
+            'character': character_type.name,
+            'swarm': swarm,
+            'tick_ms': SIM_STEP_MS,
+        }
+        self.keys = bytearray()  # Key mask per tick
+        self.actions = []  # (tick, action, x, y, game time), in order
+        self.keyframes = []  # (tick, compressed state)
+    
+    def record_keys(self, keys):
+        self.keys.append(keys_to_mask(keys))
+    
+    def record_action(self, tick, action, x, y, current_time):
+        self.actions.append((tick, int(action), x, y, current_time))
+    
+    def keyframe(self, tick, state):
+        # Compressed right away so long recordings stay small in memory
+        self.keyframes.append((tick, zlib.compress(pack_state(state), 1)))
+    
+    def save(self, path, result, checksums):
+        # result is the game's outcome, which a replay should reproduce;
+        # checksums has the state checksum after each tick
+        ticks = len(self.keys)
+        header = json.dumps(dict(self.header, ticks=ticks, result=result)).encode()
+        index = []
+        next_action = 0
+        with open(path, 'wb') as f:
+            f.write(REPLAY_MAGIC + struct.pack('<HI', REPLAY_VERSION, len(header)))
+            f.write(header)
+            for i, (start, keyframe) in enumerate(self.keyframes):
+                end = self.keyframes[i + 1][0] if i + 1 < len(self.keyframes) else ticks
+                first_action = next_action
+                while next_action < len(self.actions) and self.actions[next_action][0] < end:
+                    next_action += 1
+                inputs = encode_inputs(self.keys[start:end], self.actions[first_action:next_action], start)
+                segment_checksums = zlib.compress(checksums[start:end].tobytes(), 1)
+                keyframe_offset = f.tell()
+                f.write(keyframe)
+                f.write(inputs)
+                f.write(segment_checksums)
+                index.append(REPLAY_INDEX_ENTRY.pack(start, end, keyframe_offset, len(keyframe),
+                                                     keyframe_offset + len(keyframe), len(inputs),
+                                                     keyframe_offset + len(keyframe) + len(inputs),
+                                                     len(segment_checksums)))
+            index_offset = f.tell()
+            f.write(b''.join(index))
+            f.write(REPLAY_FOOTER.pack(index_offset, len(index), REPLAY_MAGIC))
+
+class Replay:
+    # A recording opened with mmap. Inputs are small and decoded up front;
+    # keyframes are only read and decompressed when asked for. Close it (or
+    # use it in a with block) once its keyframes are no longer needed.
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            data = self.data
+            if data[:4] != REPLAY_MAGIC:
+                raise ValueError(f"{path} is not a replay file")
+            version, header_length = struct.unpack_from('<HI', data, 4)
+            if version != REPLAY_VERSION:
+                raise ValueError(f"{path} is replay version {version}, expected {REPLAY_VERSION}")
+            self.header = json.loads(data[10:10 + header_length])
+            index_offset, count, magic = REPLAY_FOOTER.unpack_from(data, len(data) - REPLAY_FOOTER.size)
+            if magic != REPLAY_MAGIC:
+                raise ValueError(f"{path} is truncated")
+            self.index = [REPLAY_INDEX_ENTRY.unpack_from(data, index_offset + i * REPLAY_INDEX_ENTRY.size)
+                          for i in range(count)]
+            self.keys = bytearray()
+            self.actions = []
+            self.checksums = array('Q')  # Checksum after each tick
+            for start, end, _, _, inputs_offset, inputs_size, checksums_offset, checksums_size in self.index:
+                keys, actions = decode_inputs(data[inputs_offset:inputs_offset + inputs_size], start, end - start)
+                self.keys += keys
+                self.actions += actions
+                self.checksums.frombytes(zlib.decompress(data[checksums_offset:checksums_offset + checksums_size]))
+        except Exception:
+            self.close()
+            raise
+    
+    def close(self):
+        # Unmaps the file, which also releases the mmap's file descriptor
+        self.data.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def keyframe_at(self, tick):
+        # The state at the last keyframe at or before tick, and its tick
+        starts = [entry[0] for entry in self.index]
+        start, _, offset, size, _, _, _, _ = self.index[max(0, bisect.bisect_right(starts, tick) - 1)]
+        return start, unpack_state(zlib.decompress(self.data[offset:offset + size]))
+    
+    def controller(self, start_tick=0):
+        # A run_headless controller that feeds the recorded input back in.
+        # Actions for a tick happen before its update, so a game restored
+        # to a keyframe at start_tick hasn't seen them yet.
+        next_action = [bisect.bisect_left(self.actions, (start_tick,))]
+        def controller(game):
+            tick = game.tick
+            actions = self.actions
+            while next_action[0] < len(actions) and actions[next_action[0]][0] == tick:
+                _, action, x, y, current_time = actions[next_action[0]]
+                game.player_action(PlayerAction(action), x, y, current_time)
+                next_action[0] += 1
+            return mask_to_keys(self.keys[tick]) if tick < len(self.keys) else None
+        return controller
+
+def run_replay(path, profile_path=None, start_tick=0, checksum_path=None):
+    # Play a recording back headless at full speed, starting from the
+    # keyframe at or before start_tick. The ticks from the keyframe up to
+    # start_tick aren't timed. Every tick's state checksum is checked
+    # against the recording's; 'diverged_at' is the first tick that differs.
+    with Replay(path) as replay:
+        header = replay.header
+        tick_ms = header['tick_ms']
+        start_tick = min(start_tick, header['ticks'])
+        keyframe_tick, state = replay.keyframe_at(start_tick)
+    game = Game(headless=True, swarm=header['swarm'], profile_path=profile_path, checksum_path=checksum_path)
+    def setup(game):
+        game.restore_state(state)
+        game.collect_checksums()
+        controller = replay.controller(keyframe_tick)
+        while game.tick < start_tick and game.state == GameState.PLAYING:
+            game.game_clock.advance(tick_ms)
+            game.update_game(controller(game) or NO_KEYS, tick_ms)
+    result = game.run_headless(header['ticks'] - start_tick, CharacterType[header['character']],
+                               replay.controller(start_tick), tick_ms=tick_ms, setup=setup)
+    result['matches'] = game.session_result() == header['result']
+    result['diverged_at'] = first_divergence(game.checksum_stream(), dict(enumerate(replay.checksums, 1)))
+    return result
+
+# Practice mode rewind: the state at the end of every tick, newest last.
+# Every REWIND_KEYFRAME_TICKS ticks a full keyframe is stored; the ticks in
+# between only store how they differ from their keyframe (see diff_state),
+# which for a moving crowd is mostly enemy and projectile positions. Both are
+# marshalled and zlib-compressed. When the buffer is over its byte budget or
+# holds more than the wanted seconds of play, the oldest keyframe goes along
+# with the ticks that depend on it.
+REWIND_KEYFRAME_TICKS = 60  # 1 second of game time
+REWIND_BUDGET = 16 * 1024 * 1024  # Bytes
+REWIND_SECONDS = 10
+
+def diff_rows(base, rows):
+    # Rows that match the same row of base are left out, rows with the same
+    # record class (or enemy type) store only their changed fields, the rest
+    # are stored whole
+    whole = []
+    patches = []
+    for i, row in enumerate(rows):
+        if i < len(base):
+            old = base[i]
+            if row == old:
+                continue
+            if len(row) == len(old) and row[0] == old[0]:
+                patches.append((i, tuple((j, value) for j, value in enumerate(row) if value != old[j])))
+                continue
+        whole.append((i, row))
+    return (len(rows), tuple(whole), tuple(patches))
+
+def patch_rows(base, delta):
+    count, whole, patches = delta
+    rows = list(base[:count])
+    rows += [None] * (count - len(rows))
+    for i, row in whole:
+        rows[i] = row
+    for i, changes in patches:
+        row = list(base[i])
+        for j, value in changes:
+            row[j] = value
+        rows[i] = tuple(row)
+    return tuple(rows)
+
+def diff_random(base, random_state):
+    # Drawing a few numbers from a Mersenne Twister only moves its position
+    # (the last word of its state); the other 624 words change together once
+    # every 624 draws
+    if random_state == base:
+        return None
+    version, words, gauss_next = random_state
+    return (version, tuple((i, word) for i, (word, old) in enumerate(zip(words, base[1])) if word != old),
+            gauss_next)
+
+def patch_random(base, delta):
+    if delta is None:
+        return base
+    version, changes, gauss_next = delta
+    words = list(base[1])
+    for i, word in changes:
+        words[i] = word
+    return (version, tuple(words), gauss_next)
+
+def diff_state(key, state):
+    # A snapshot_state() result as a difference from an earlier one
+    return (state[1], diff_random(key[2], state[2]), state[3],
+            diff_rows(key[4], state[4]), diff_rows(key[5], state[5]), state[6])
+
+def patch_state(key, delta):
+    game, random_state, player_state, projectiles, enemies, hearts = delta
+    return (key[0], game, patch_random(key[2], random_state), player_state,
+            patch_rows(key[4], projectiles), patch_rows(key[5], enemies), hearts)
+
+class RewindBuffer:
+    def __init__(self, seconds=REWIND_SECONDS, budget=REWIND_BUDGET, keyframe_ticks=REWIND_KEYFRAME_TICKS):
+        self.max_ticks = int(seconds * 1000 / SIM_STEP_MS)
+        self.budget = budget
+        self.keyframe_ticks = keyframe_ticks
+        self.groups = deque()  # [compressed keyframe, [compressed deltas]], oldest first
+        self.key = None  # The newest group's keyframe, uncompressed
+        self.ticks = 0  # States held
+        self.size = 0  # Bytes held
+    
+    def __len__(self):
+        return self.ticks
+    
+    def seconds(self):
+        return self.ticks * SIM_STEP_MS / 1000
+    
+    def push(self, state):
+        groups = self.groups
+        blob = None
+        if groups and len(groups[-1][1]) + 1 < self.keyframe_ticks:
+            blob = zlib.compress(marshal.dumps(diff_state(self.key, state)), 1)
+            if len(blob) * 2 > len(groups[-1][0]):
+                blob = None  # Drifted too far (the random state turned over); start a new keyframe
+            else:
+                groups[-1][1].append(blob)
+        if blob is None:
+            blob = zlib.compress(pack_state(state), 1)
+            groups.append([blob, []])
+            self.key = state
+        self.ticks += 1
+        self.size += len(blob)
+        # Oldest first, but always keep the group being written
+        while len(groups) > 1 and (self.size > self.budget
+                                   or self.ticks - len(groups[0][1]) - 1 >= self.max_ticks):
+            blob, deltas = groups.popleft()
+            self.ticks -= 1 + len(deltas)
+            self.size -= len(blob) + sum(len(delta) for delta in deltas)
+    
+    def pop(self):
+        # Drop the newest state and return the one before it, or None
+        # (leaving the buffer as is) when there's nothing older
+        groups = self.groups
+        if self.ticks < 2:
+            return None
+        blob, deltas = groups[-1]
+        if deltas:
+            self.size -= len(deltas.pop())
+        else:
+            groups.pop()
+            self.size -= len(blob)
+            self.key = unpack_state(zlib.decompress(groups[-1][0]))
+        self.ticks -= 1
+        deltas = groups[-1][1]
+        if not deltas:
+            return self.key
+        return patch_state(self.key, marshal.loads(zlib.decompress(deltas[-1])))
+    
+    def clear(self):
+        self.groups.clear()
+        self.key = None
+        self.ticks = self.size = 0
+
+# How long an idle menu or pause screen sleeps waiting for input before
+# checking again
+IDLE_WAIT_MS = 500
+
 # Game class
 class Game:
-    def __init__(self):
+    # Timers, score and progression, as saved in snapshots
+    SNAPSHOT_FIELDS = ('tick', 'game_start_time', 'last_enemy_spawn', 'last_score_update', 'score',
+                       'general_defeated', 'general_defeat_time', 'final_boss_spawned', 'final_boss_defeated')
+    
+    def __init__(self, headless=False, time_scale=1.0, swarm=1, dirty_rects=False, profile_path=None,
+                 record_path=None, snapshot_path=SNAPSHOT_FILE, rewind_seconds=0,
+                 rewind_budget=REWIND_BUDGET, checksum_path=None):
+        self.headless = headless  # No window, no high score file writes
+        self.swarm = swarm  # Enemy spawn multiplier ("swarm" difficulty)
+        self.dirty_rects = DirtyRects() if dirty_rects else None  # Partial display updates
+        self.profiler = FrameProfiler()  # Per-phase frame times for the current game
+        self.profile_path = profile_path  # Where end_game exports them, if anywhere
+        self.show_profile = False  # Profiler overlay, toggled with F3
+        self.record_path = record_path  # Where each game's input recording is saved
+        self.recorder = None  # InputRecorder for the current game, when recording
+        self.snapshot_path = snapshot_path  # Where S on the pause screen saves the game
+        self.rewind = RewindBuffer(rewind_seconds, rewind_budget) if rewind_seconds else None  # Practice mode
+        self.rewinding = False  # R held down in practice mode
+        self.tick = 0  # update_game calls since the game started
+        self.checksum_path = checksum_path  # Where each game's state checksums are written
+        self.checksums = None  # State checksum after each tick, when collecting (recording, checksum_path)
+        self.checksum_start = 0  # Tick the checksums start after
+        self.menu_layers = {}  # Menu name -> (key, pre-drawn screen), see draw_menu_layer
+        self.pause_layer = None  # Paused game frame with the pause overlay on it
+        self.idle_wall_time = 0.0  # Seconds spent in menus or paused (see run)
+        self.idle_cpu_time = 0.0  # CPU seconds used in that time
+        self.game_clock = GameClock(time_scale)
         self.state = GameState.HOME
         self.selected_character = CharacterType.SQUARE
         self.player = None
         self.enemies = []
+        self.dead_enemies = 0  # Enemies flagged by remove_enemy() since the last sweep
+        self.enemy_batch = None  # batch_store while it's in use, see pick_enemy_batch
+        self.batch_store = EnemyBatch() if USE_NUMPY else None
         self.hearts = []
+        self.projectile_grid = SpatialHash()  # Collision broad phase, rebuilt every tick
         self.score = 0
         self.high_score = 0
         self.game_start_time = 0
@@ -1547,29 +3328,177 @@ class Game:
     def start_game(self):
         self.player = Character(self.selected_character)
         self.enemies = []
+        self.dead_enemies = 0
+        self.enemy_batch = None  # batch_store while it's in use, see pick_enemy_batch
+        self.batch_store = EnemyBatch() if USE_NUMPY else None
         self.hearts = []
         self.score = 0
-        self.game_start_time = pygame.time.get_ticks()
-        self.last_enemy_spawn = pygame.time.get_ticks()
-        self.last_score_update = pygame.time.get_ticks()
+        current_time = self.game_clock.now()
+        self.game_start_time = current_time
+        self.last_enemy_spawn = current_time
+        self.last_score_update = current_time
         self.general_defeated = False
         self.general_defeat_time = 0
         self.final_boss_spawned = False
         self.final_boss_defeated = False
         self.state = GameState.PLAYING
+        if self.record_path:
+            # Each recorded game gets a seed of its own (drawn from the --seed stream)
+            sim_random.seed(sim_random.randrange(2 ** 32))
+        self.begin_session()
+    
+    def start_from_snapshot(self, path):
+        # Warm start: carry on from a save_snapshot() file
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:4] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        self.restore_state(unpack_state(data[4:]))
+        self.begin_session()
+    
+    def save_snapshot(self, path):
+        with open(path, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC + pack_state(self.snapshot_state()))
+    
+    def begin_session(self):
+        # A game starts, fresh or from a snapshot: new profile, new recording
+        self.profiler.reset()
+        self.tick = 0
+        self.checksums = None
+        if self.record_path or self.checksum_path:
+            self.collect_checksums()
+        if self.record_path:
+            self.recorder = InputRecorder(self.selected_character, self.swarm)
+            self.recorder.keyframe(0, self.snapshot_state())
+        if self.rewind is not None:
+            self.rewind.clear()
+            self.rewind.push(self.snapshot_state())
+    
+    def collect_checksums(self):
+        # Start a fresh checksum stream from the current tick
+        self.checksums = array('Q')
+        self.checksum_start = self.tick
+    
+    def checksum_stream(self):
+        # {tick: state checksum after that tick}
+        return dict(enumerate(self.checksums or (), self.checksum_start + 1))
+    
+    def snapshot_state(self):
+        # Everything update_game depends on, between two ticks
+        player = self.player
+        projectiles = [record_state(p) for p in player.projectiles]
+        if player.bullets is not None:
+            projectiles += player.bullets.record_states()
+            projectiles.sort(key=record_seq)  # Fire order, however they're stored
+        batch = self.enemy_batch
+        if batch is not None:
+            # Read the batched fields a column at a time
+            columns = [getattr(batch, name)[:len(batch)].tolist() for name in EnemyBatch.COLUMNS]
+            enemies = tuple(
+                (int(enemy.type), enemy.boss_level)
+                + tuple(column[enemy._slot] for column in columns)
+                + (enemy.last_shot, enemy.health, tuple(record_state(p) for p in enemy.projectiles))
+                for enemy in self.enemies)
+        else:
+            enemies = tuple(
+                (int(enemy.type), enemy.boss_level)
+                + tuple(plain(getattr(enemy, name)) for name in Enemy.SNAPSHOT_FIELDS)
+                + (tuple(record_state(p) for p in enemy.projectiles),)
+                for enemy in self.enemies)
+        return (
+            STATE_VERSION,
+            (self.game_clock.time,) + tuple(getattr(self, name) for name in self.SNAPSHOT_FIELDS),
+            sim_random.getstate(),
+            (player.type.value,) + tuple(plain(getattr(player, name)) for name in Character.SNAPSHOT_FIELDS),
+            tuple(projectiles),
+            enemies,
+            tuple((heart.x, heart.y, heart.is_boss_heart) for heart in self.hearts),
+        )
+    
+    def restore_state(self, state):
+        # Replace the game in progress with a snapshot_state() result. The
+        # game is rebuilt in place: the player, enemy batch and bullet store
+        # are kept (the player if it's the same character), and enemies and
+        # projectile records come back out of their pools.
+        version, game, random_state, player_state, projectiles, enemies, hearts = state
+        if version != STATE_VERSION:
+            raise ValueError(f"Snapshot version {version}, expected {STATE_VERSION}")
+        self.game_clock.time = game[0]
+        for name, value in zip(self.SNAPSHOT_FIELDS, game[1:]):
+            setattr(self, name, value)
+        
+        self.selected_character = CharacterType(player_state[0])
+        player = self.player
+        if player is None or player.type != self.selected_character:
+            self.player = player = Character(self.selected_character)
+        else:
+            player.clear_projectiles()
+        for name, value in zip(Character.SNAPSHOT_FIELDS, player_state[1:]):
+            setattr(player, name, value)
+        for row in projectiles:
+            player.place_projectile(restore_record(row))
+        
+        for enemy in self.enemies:
+            for p in enemy.projectiles:
+                free_projectile(p)
+            enemy_pool.release(enemy)
+        self.enemies.clear()
+        self.dead_enemies = 0
+        batch = self.enemy_batch
+        if batch is not None:
+            batch.clear()
+            if len(enemies) < BATCH_MIN_ENEMIES // 2:
+                self.enemy_batch = batch = None
+        batched = len(EnemyBatch.COLUMNS) if batch is not None else 0
+        for row in enemies:
+            enemy = enemy_pool.acquire(EnemyType(row[0]), row[1])
+            for name, value in zip(Enemy.SNAPSHOT_FIELDS[batched:], row[2 + batched:]):
+                setattr(enemy, name, value)
+            enemy.projectiles = [restore_record(shot) for shot in row[-1]]
+            self.enemies.append(enemy)
+        if batch is not None:
+            # The batched fields go in a column at a time
+            batch.add_many(self.enemies, [[row[2 + i] for row in enemies] for i in range(batched)])
+        
+        # Hearts aren't pooled, but the ones on screen are reused
+        kept = self.hearts[:len(hearts)]
+        for i, (x, y, is_boss_heart) in enumerate(hearts):
+            if i < len(kept):
+                kept[i].__init__(x, y, is_boss_heart)
+            else:
+                kept.append(Heart(x, y, is_boss_heart))
+        self.hearts = kept
+        
+        # Last, since creating the enemies drew from it
+        sim_random.setstate(random_state)
+        self.state = GameState.PLAYING
+    
+    def draw_menu_layer(self, name, key, compose):
+        # Menu screens only change with their key (selected character,
+        # scores). compose() draws the screen from scratch; the result is
+        # kept and blitted as is until the key changes.
+        cached = self.menu_layers.get(name)
+        if cached is None or cached[0] != key:
+            compose()
+            self.menu_layers[name] = (key, screen.copy())
+        else:
+            screen.blit(cached[1], (0, 0))
     
     def draw_home_screen(self):
+        self.draw_menu_layer('home', (self.selected_character, self.high_score), self.compose_home_screen)
+    
+    def compose_home_screen(self):
         # Background
         screen.fill(BLACK)
         
         # Title
-        font = pygame.font.SysFont('Arial', 50)
-        title = font.render("Epic Adventure", True, WHITE)
+        font = get_font(50)
+        title = render_text(font, "Epic Adventure", WHITE)
         screen.blit(title, (WIDTH // 2 - title.get_width() // 2, 50))
         
         # Character selection
-        font = pygame.font.SysFont('Arial', 30)
-        text = font.render("Select Your Character:", True, WHITE)
+        font = get_font(30)
+        text = render_text(font, "Select Your Character:", WHITE)
         screen.blit(text, (WIDTH // 2 - text.get_width() // 2, 150))
         
         # Character display
@@ -1716,78 +3645,92 @@ class Game:
         ])
         
         # Character name and description
-        name_text = font.render(character_name, True, WHITE)
+        name_text = render_text(font, character_name, WHITE)
         screen.blit(name_text, (WIDTH // 2 - name_text.get_width() // 2, 320))
         
-        desc_font = pygame.font.SysFont('Arial', 24)
-        desc_text = desc_font.render(character_desc, True, WHITE)
+        desc_font = get_font(24)
+        desc_text = render_text(desc_font, character_desc, WHITE)
         screen.blit(desc_text, (WIDTH // 2 - desc_text.get_width() // 2, 360))
         
         # Awakening description
-        awakening_text = desc_font.render(character_awakening, True, WHITE)
+        awakening_text = render_text(desc_font, character_awakening, WHITE)
         screen.blit(awakening_text, (WIDTH // 2 - awakening_text.get_width() // 2, 390))
         
         # Controls info
-        controls_text = desc_font.render("Right-click to use awakening ability", True, WHITE)
+        controls_text = render_text(desc_font, "Right-click to use awakening ability", WHITE)
         screen.blit(controls_text, (WIDTH // 2 - controls_text.get_width() // 2, 420))
         
         # Play button
         pygame.draw.rect(screen, YELLOW, (WIDTH // 2 - 75, 450, 150, 50))
-        play_text = font.render("Play", True, BLACK)
+        play_text = render_text(font, "Play", BLACK)
         screen.blit(play_text, (WIDTH // 2 - play_text.get_width() // 2, 460))
         
         # High score display
-        high_score_font = pygame.font.SysFont('Arial', 24)
-        high_score_text = high_score_font.render(f"High Score: {self.high_score}", True, WHITE)
+        high_score_font = get_font(24)
+        high_score_text = render_text(high_score_font, f"High Score: {self.high_score}", WHITE)
         screen.blit(high_score_text, (WIDTH // 2 - high_score_text.get_width() // 2, 520))
 
     def draw_victory_screen(self):
+        self.draw_menu_layer('victory', (self.score, self.high_score), self.compose_victory_screen)
+    
+    def compose_victory_screen(self):
         # Background
         screen.fill(BLACK)
         
         # Victory message
-        font = pygame.font.SysFont('Arial', 50)
-        title = font.render("Congratulations!", True, RED)
+        font = get_font(50)
+        title = render_text(font, "Congratulations!", RED)
         screen.blit(title, (WIDTH // 2 - title.get_width() // 2, 150))
         
         # Subtext
-        subtitle_font = pygame.font.SysFont('Arial', 36)
-        subtitle = subtitle_font.render("You completed the game!", True, WHITE)
+        subtitle_font = get_font(36)
+        subtitle = render_text(subtitle_font, "You completed the game!", WHITE)
         screen.blit(subtitle, (WIDTH // 2 - subtitle.get_width() // 2, 220))
         
         # Score display
-        score_font = pygame.font.SysFont('Arial', 30)
-        score_text = score_font.render(f"Final Score: {self.score}", True, YELLOW)
+        score_font = get_font(30)
+        score_text = render_text(score_font, f"Final Score: {self.score}", YELLOW)
         screen.blit(score_text, (WIDTH // 2 - score_text.get_width() // 2, 300))
         
-        high_score_text = score_font.render(f"High Score: {self.high_score}", True, GREEN)
+        high_score_text = render_text(score_font, f"High Score: {self.high_score}", GREEN)
         screen.blit(high_score_text, (WIDTH // 2 - high_score_text.get_width() // 2, 340))
         
         # Return to main menu button
         pygame.draw.rect(screen, BLUE, (WIDTH // 2 - 100, 450, 200, 60))
-        menu_font = pygame.font.SysFont('Arial', 28)
-        menu_text = menu_font.render("Main Menu", True, WHITE)
+        menu_font = get_font(28)
+        menu_text = render_text(menu_font, "Main Menu", WHITE)
         screen.blit(menu_text, (WIDTH // 2 - menu_text.get_width() // 2, 465))
     
     def draw_pause_screen(self):
+        # The overlay goes over a snapshot of the last game frame, taken when
+        # the game paused (draw_game_screen drops the snapshot on resume)
+        if self.pause_layer is None:
+            self.compose_pause_screen()
+            self.pause_layer = screen.copy()
+        else:
+            screen.blit(self.pause_layer, (0, 0))
+    
+    def compose_pause_screen(self):
         # Semi-transparent overlay
         overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
         overlay.fill((0, 0, 0, 180))  # Black with 70% opacity
         screen.blit(overlay, (0, 0))
         
         # Pause text
-        font = pygame.font.SysFont('Arial', 50)
-        title = font.render("PAUSED", True, WHITE)
+        font = get_font(50)
+        title = render_text(font, "PAUSED", WHITE)
         screen.blit(title, (WIDTH // 2 - title.get_width() // 2, 200))
         
         # Instructions
-        inst_font = pygame.font.SysFont('Arial', 24)
-        inst_text = inst_font.render("Press ESC to resume or M for main menu", True, WHITE)
+        inst_font = get_font(24)
+        inst_text = render_text(inst_font, "Press ESC to resume or M for main menu", WHITE)
         screen.blit(inst_text, (WIDTH // 2 - inst_text.get_width() // 2, 280))
+        save_text = render_text(get_font(20), "Press S to save the game", LIGHT_GRAY)
+        screen.blit(save_text, (WIDTH // 2 - save_text.get_width() // 2, 315))
         
         # Current score
-        score_font = pygame.font.SysFont('Arial', 28)
-        score_text = score_font.render(f"Score: {self.score}", True, YELLOW)
+        score_font = get_font(28)
+        score_text = render_text(score_font, f"Score: {self.score}", YELLOW)
         screen.blit(score_text, (WIDTH // 2 - score_text.get_width() // 2, 350))
     
     def handle_home_events(self, event):
@@ -1830,33 +3773,47 @@ class Game:
                 self.state = GameState.PLAYING
             elif event.key == pygame.K_m:
                 self.state = GameState.HOME
+                self.end_session()
+            elif event.key == pygame.K_s:
+                self.save_snapshot(self.snapshot_path)
+                if self.pause_layer is not None:
+                    # Note it on the pause screen
+                    text = render_text(get_font(20), f"Saved to {self.snapshot_path}", LIGHT_GREEN)
+                    self.pause_layer.blit(text, (WIDTH // 2 - text.get_width() // 2, 400))
     
     def draw_game_screen(self):
-        # Background
-        screen.fill(BLACK)
+        current_time = self.game_clock.now()
+        dirty = self.dirty_rects
+        self.pause_layer = None  # Pausing snapshots a fresh frame
+        
+        # Background (only what was drawn last frame needs clearing in dirty-rect mode)
+        if dirty is None:
+            screen.fill(BLACK)
+        else:
+            dirty.erase(screen)
         
         # Draw player
-        self.player.draw()
-        self.player.draw_projectiles()
+        self.player.draw(current_time)
+        self.player.draw_projectiles(current_time)
         
         # Draw enemies
         for enemy in self.enemies:
-            enemy.draw()
+            enemy.draw(current_time)
         
         # Draw hearts
         for heart in self.hearts:
             heart.draw()
         
         # Draw score and health
-        font = pygame.font.SysFont('Arial', 24)
-        score_text = font.render(f"Score: {self.score}", True, WHITE)
-        screen.blit(score_text, (20, 20))
+        font = get_font(24)
+        score_text = render_text(font, f"Score: {self.score}", WHITE)
+        score_rect = screen.blit(score_text, (20, 20))
         
-        health_text = font.render(f"Health: {self.player.health}", True, WHITE)
-        screen.blit(health_text, (20, 50))
+        health_text = render_text(font, f"Health: {self.player.health}", WHITE)
+        health_rect = screen.blit(health_text, (20, 50))
         
         # Draw awakening cooldown indicator
-        self.player.draw_awakening_cooldown()
+        self.player.draw_awakening_cooldown(current_time)
         
         # Draw pause button in top right corner
         pause_button_width = 80
@@ -1869,10 +3826,44 @@ class Game:
         pygame.draw.rect(screen, BLACK, (pause_x, pause_y, pause_button_width, pause_button_height), 2)
         
         # Draw button text
-        pause_font = pygame.font.SysFont('Arial', 20)
-        pause_text = pause_font.render("PAUSE", True, BLACK)
+        pause_font = get_font(20)
+        pause_text = render_text(pause_font, "PAUSE", BLACK)
         text_rect = pause_text.get_rect(center=(pause_x + pause_button_width//2, pause_y + pause_button_height//2))
         screen.blit(pause_text, text_rect)
+        
+        if dirty is not None:
+            self.mark_dirty(dirty, current_time)
+            dirty.add(score_rect)
+            dirty.add(health_rect)
+            dirty.add(pygame.Rect(pause_x, pause_y, pause_button_width, pause_button_height))
+        
+        if self.rewind is not None:
+            # Practice mode: how far back R can go
+            label = "REWINDING" if self.rewinding else "Hold R to rewind"
+            rewind_text = render_text(font, f"{label} ({self.rewind.seconds():.0f}s)",
+                                      YELLOW if self.rewinding else GRAY)
+            rewind_rect = screen.blit(rewind_text, (WIDTH // 2 - rewind_text.get_width() // 2, 20))
+            if dirty is not None:
+                dirty.add(rewind_rect)
+        
+        if self.show_profile:
+            overlay_rect = self.profiler.draw_overlay(screen, 10, HEIGHT - 10)
+            if dirty is not None:
+                dirty.add(overlay_rect)
+    
+    def mark_dirty(self, dirty, current_time):
+        # Record where draw_game_screen drew the player, enemies, hearts and
+        # projectiles, and the awakening indicator
+        dirty.add(self.player.bounds())
+        for p in self.player.all_projectiles():
+            dirty.add(projectile_bounds(p))
+        for enemy in self.enemies:
+            dirty.add(enemy.bounds())
+            for p in enemy.projectiles:
+                dirty.add(centered_rect(p.x, p.y, p.size + 10))  # With the final boss glow
+        for heart in self.hearts:
+            dirty.add(heart.bounds())
+        dirty.add(self.player.awakening_indicator_rect())
     
     def handle_game_events(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
@@ -1890,52 +3881,93 @@ class Game:
             
             # Left mouse button for normal attack
             if event.button == 1:  
-                self.player.shoot(mouse_x, mouse_y)
+                self.player_action(PlayerAction.SHOOT, mouse_x, mouse_y)
             # Right mouse button for awakening ability
             elif event.button == 3:  
-                self.player.awakening(mouse_x, mouse_y)
+                self.player_action(PlayerAction.AWAKEN, mouse_x, mouse_y)
                 
         elif event.type == pygame.KEYDOWN:
             if event.key == pygame.K_ESCAPE:
                 self.state = GameState.PAUSED
+            elif event.key == pygame.K_F3:
+                self.show_profile = not self.show_profile
     
-    def update_game(self):
-        current_time = pygame.time.get_ticks()
+    def player_action(self, action, x, y, current_time=None):
+        # Mouse input goes through here so it can be recorded and replayed
+        if current_time is None:
+            current_time = self.game_clock.now()
+        if self.recorder is not None:
+            self.recorder.record_action(self.tick, action, x, y, current_time)
+        if action == PlayerAction.SHOOT:
+            self.player.shoot(x, y, current_time)
+        else:
+            self.player.awakening(x, y, current_time)
+    
+    def entity_counts(self):
+        enemy_projectiles = 0
+        for enemy in self.enemies:
+            enemy_projectiles += len(enemy.projectiles)
+        player_projectiles = len(self.player.projectiles)
+        if self.player.bullets is not None:
+            player_projectiles += self.player.bullets.count
+        return {
+            'enemies': len(self.enemies),
+            'player_projectiles': player_projectiles,
+            'enemy_projectiles': enemy_projectiles,
+            'hearts': len(self.hearts),
+        }
+    
+    def update_game(self, keys=None, dt=SIM_STEP_MS):
+        # Advances the simulation by one step of dt milliseconds of game time
+        current_time = self.game_clock.now()
         game_elapsed = current_time - self.game_start_time
+        step = dt / FRAME_MS
+        profiler = self.profiler
         
-        # Move player
-        keys = pygame.key.get_pressed()
-        self.player.move(keys)
+        # Move player (headless runs pass their own key state)
+        if keys is None:
+            keys = pygame.key.get_pressed()
+        if self.recorder is not None:
+            self.recorder.record_keys(keys)
+        self.tick += 1
+        self.player.move(keys, current_time, step)
         
         # Update projectiles
-        self.player.update_projectiles()
+        self.player.update_projectiles(dt)
         
         # Update enemy projectiles (for final boss)
         for enemy in self.enemies:
             if hasattr(enemy, 'projectiles') and enemy.projectiles:
-                enemy.update_projectiles()
+                enemy.update_projectiles(dt)
                 
                 # Check if enemy projectiles hit player
-                for projectile in enemy.projectiles[:]:
-                    dx = self.player.x - projectile['x']
-                    dy = self.player.y - projectile['y']
+                kept = []
+                for i, projectile in enumerate(enemy.projectiles):
+                    dx = self.player.x - projectile.x
+                    dy = self.player.y - projectile.y
                     distance = (dx**2 + dy**2)**0.5
                     
-                    if distance < (self.player.size // 2 + projectile['size']):
-                        self.player.health -= projectile['damage']
-                        enemy.projectiles.remove(projectile)
+                    if distance < (self.player.size // 2 + projectile.size):
+                        self.player.health -= projectile.damage
+                        free_projectile(projectile)
                         
                         if self.player.health <= 0:
-                            self.end_game()
-                            return
+                            kept += enemy.projectiles[i + 1:]  # Left as they are
+                            break
+                    else:
+                        kept.append(projectile)
+                enemy.projectiles = kept
+                if self.player.health <= 0:
+                    return self.finish_tick(game_over=True)
             
             # Have the final boss shoot at the player
-            if enemy.type == 'boss' and enemy.boss_level == 4:
-                enemy.shoot(self.player.x, self.player.y)
+            if enemy.type == EnemyType.BOSS and enemy.boss_level == 4:
+                enemy.shoot(self.player.x, self.player.y, current_time)
                 
             # Check if enemies should be frozen (for samurai awakening)
             if self.player.type == CharacterType.SAMURAI and current_time < self.player.freeze_end_time:
-                enemy.freeze(5000)  # Freeze for 5 seconds
+                enemy.freeze(5000, current_time)  # Freeze for 5 seconds
+        profiler.mark('movement')
         
         # Different enemy spawning logic based on game state
         if self.general_defeated:
@@ -1944,7 +3976,7 @@ class Game:
             # Spawn final boss after 150 seconds
             if time_since_general >= 150000 and not self.final_boss_spawned:
                 self.final_boss_spawned = True
-                self.enemies.append(Enemy('boss', 4))  # Add final boss
+                self.add_enemy(enemy_pool.acquire(EnemyType.BOSS, 4))  # Add final boss
             
             # Otherwise spawn enemies in waves based on time since general defeat
             elif current_time - self.last_enemy_spawn >= 3000:  # Every 3 seconds
@@ -1955,32 +3987,32 @@ class Game:
                 
                 # Determine spawn counts based on time since general defeat
                 if time_since_general >= 80000:  # 80+ seconds
-                    red_count = random.randint(8, 10)
-                    purple_count = random.randint(6, 7)
-                    green_count = random.randint(3, 4)
+                    red_count = sim_random.randint(8, 10)
+                    purple_count = sim_random.randint(6, 7)
+                    green_count = sim_random.randint(3, 4)
                 elif time_since_general >= 40000:  # 40-80 seconds
-                    red_count = random.randint(7, 8)
-                    purple_count = random.randint(4, 5)
-                    green_count = random.randint(2, 3)
+                    red_count = sim_random.randint(7, 8)
+                    purple_count = sim_random.randint(4, 5)
+                    green_count = sim_random.randint(2, 3)
                 else:  # 0-40 seconds
                     red_count = 6
-                    purple_count = random.randint(3, 4)
-                    green_count = random.randint(2, 3)
+                    purple_count = sim_random.randint(3, 4)
+                    green_count = sim_random.randint(2, 3)
                 
                 # Spawn red enemies
-                for _ in range(red_count):
-                    self.enemies.append(Enemy('normal'))
+                for _ in range(red_count * self.swarm):
+                    self.add_enemy(enemy_pool.acquire(EnemyType.NORMAL))
                 
                 # Spawn purple enemies
-                for _ in range(purple_count):
-                    self.enemies.append(Enemy('purple'))
+                for _ in range(purple_count * self.swarm):
+                    self.add_enemy(enemy_pool.acquire(EnemyType.PURPLE))
                 
                 # Spawn green enemies
-                for _ in range(green_count):
-                    enemy = Enemy('green')
+                for _ in range(green_count * self.swarm):
+                    enemy = enemy_pool.acquire(EnemyType.GREEN)
                     if green_faster:
                         enemy.speed *= 1.5  # Make 1.2x faster (offsetting the initial 0.8x)
-                    self.enemies.append(enemy)
+                    self.add_enemy(enemy)
         
         else:
             # Standard game progression (before general boss)
@@ -1989,90 +4021,138 @@ class Game:
                 # Spawn General boss if not present
                 general_present = False
                 for enemy in self.enemies:
-                    if enemy.type == 'boss' and enemy.boss_level == 3:
+                    if enemy.type == EnemyType.BOSS and enemy.boss_level == 3:
                         general_present = True
                         break
                 
                 if not general_present:
-                    self.enemies.append(Enemy('boss', 3))  # Add General boss
+                    self.add_enemy(enemy_pool.acquire(EnemyType.BOSS, 3))  # Add General boss
             
             # For regular enemies
             if current_time - self.last_enemy_spawn >= 3000:  # Every 3 seconds
                 self.last_enemy_spawn = current_time
                 
                 # Spawn standard enemies
-                spawn_count = self.get_spawn_count(game_elapsed)
+                spawn_count = self.get_spawn_count(game_elapsed) * self.swarm
                 
                 for _ in range(spawn_count):
-                    enemy_type = 'normal'
-                    if game_elapsed >= 150000 and random.random() < 0.3:
-                        enemy_type = 'purple'
+                    enemy_type = EnemyType.NORMAL
+                    if game_elapsed >= 150000 and sim_random.random() < 0.3:
+                        enemy_type = EnemyType.PURPLE
                     
-                    self.enemies.append(Enemy(enemy_type))
+                    self.add_enemy(enemy_pool.acquire(enemy_type))
         
         # Update score every half second
         if current_time - self.last_score_update >= 500:
             self.score += 1
             self.last_score_update = current_time
+        profiler.mark('spawning')
         
-        # Move enemies and check for collisions
-        speed_modifier = self.get_speed_modifier(game_elapsed)
+        # Move enemies, then check for collisions
+        speed_modifier = self.get_speed_modifier(game_elapsed, current_time)
         
-        for enemy in self.enemies[:]:
-            # Move enemies
+        # Move every enemy towards the player, in one batched pass when
+        # there's a batch, before any collision checks
+        if self.batch_store is not None:
+            self.pick_enemy_batch()
+        if self.enemy_batch is not None:
+            self.enemy_batch.move(self.player.x, self.player.y, current_time, speed_modifier, step)
+        for enemy in self.enemies:
             if hasattr(enemy, 'is_projectile') and enemy.is_projectile:
                 # For boss projectiles, move in straight line
-                enemy.x += enemy.dx
-                enemy.y += enemy.dy
+                enemy.x += enemy.dx * step
+                enemy.y += enemy.dy * step
                 
                 # Remove if out of bounds
                 if not (0 <= enemy.x <= WIDTH and 0 <= enemy.y <= HEIGHT):
-                    self.enemies.remove(enemy)
-                    continue
-            else:
-                # Normal movement towards player
-                enemy.move(self.player.x, self.player.y, speed_modifier)
+                    self.remove_enemy(enemy)
+            elif self.enemy_batch is None:
+                enemy.move(self.player.x, self.player.y, current_time, speed_modifier, step)
+        profiler.mark('movement')
+        
+        # Rebuild the projectile grid so each enemy only tests nearby projectiles
+        # (items are indices into projectiles, which is in fire order)
+        projectiles, listed_at, stored_at = self.player.ordered_projectiles() if self.enemies else ([], (), ())
+        spent = set()  # Indices of projectiles removed this tick
+        area_hits = {}  # Projectile index -> set of enemies it hits
+        self.projectile_grid.clear()
+        if projectiles:
+            for index, projectile in zip(listed_at, self.player.projectiles):
+                insert_projectile(self.projectile_grid, index, projectile)
+            if stored_at:
+                self.player.bullets.insert_into(self.projectile_grid, stored_at)
+            
+            # With enough enemies, area-of-effect projectiles are tested
+            # against all of them at once, batched or not. Fewer, and the grid
+            # keeps the per-enemy kernels cheaper.
+            if USE_NUMPY and len(self.enemies) - self.dead_enemies >= AREA_MASK_MIN_ENEMIES:
+                area = [(index, projectile) for index, projectile in zip(listed_at, self.player.projectiles)
+                        if projectile.kind in AREA_HIT_MASKS]
+                if area:
+                    columns = self.area_columns()
+                    for index, projectile in area:
+                        area_hits[index] = area_hit_set(projectile, *columns)
+        
+        # remove_enemy() only flags enemies, so the list can be walked directly
+        for enemy in self.enemies:
+            if enemy.dead:
+                continue  # Left the screen
             
             # Check if enemy hits player
-            dx = self.player.x - enemy.x
-            dy = self.player.y - enemy.y
+            enemy_x = enemy.x
+            enemy_y = enemy.y
+            dx = self.player.x - enemy_x
+            dy = self.player.y - enemy_y
             distance = (dx**2 + dy**2)**0.5
             
             if distance < (self.player.size // 2 + enemy.size // 2):
                 self.player.health -= enemy.damage
-                self.enemies.remove(enemy)
+                self.remove_enemy(enemy)
                 
                 if self.player.health <= 0:
-                    self.end_game()
-                    return
+                    return self.finish_tick(game_over=True)
                 continue
             
             # Check if enemy is hit by player projectiles
+            if not projectiles:
+                continue
             enemy_hit = False
-            for projectile in self.player.projectiles[:]:
-                if enemy.is_hit_by_projectile(projectile):
-                    enemy.health -= projectile['damage']
+            half_size = enemy.size / 2
+            nearby = self.projectile_grid.query(enemy_x - half_size, enemy_y - half_size,
+                                                enemy_x + half_size, enemy_y + half_size)
+            for index in nearby:
+                if index in spent:
+                    continue
+                projectile = projectiles[index]
+                hits = area_hits.get(index)
+                if hits is not None:
+                    hit = enemy in hits
+                else:
+                    hit = enemy.is_hit_by_projectile(projectile, current_time)
+                if hit:
+                    enemy.health -= projectile.damage
                     
                     # For bouncing ball, don't remove since it bounces
-                    if projectile['type'] == 'bouncing_ball':
+                    if projectile.kind == ProjectileKind.BOUNCING_BALL:
                         continue
                     
                     # For slow wave, just check if it hit (don't remove)
-                    if projectile['type'] == 'slow_wave':
+                    if projectile.kind == ProjectileKind.SLOW_WAVE:
                         continue
                     
                     # For explosion projectiles, don't remove them on hit
-                    if projectile['type'] == 'explosion':
+                    if projectile.kind == ProjectileKind.EXPLOSION:
                         continue
                     
                     # Remove projectile only if it doesn't penetrate
-                    if not projectile.get('penetrate', False) and projectile['type'] not in ['sword', 'beam', 'knight_arc_wave']:
-                        self.player.projectiles.remove(projectile)
+                    if not projectile.penetrate and projectile.kind not in (ProjectileKind.SWORD, ProjectileKind.BEAM, ProjectileKind.KNIGHT_ARC_WAVE):
+                        self.player.remove_projectile(projectile)
+                        spent.add(index)
                     
                     enemy_hit = True
                     if enemy.health <= 0:
                         # Handle enemy defeat
-                        if enemy.type == 'boss':
+                        if enemy.type == EnemyType.BOSS:
                             # Track which boss was defeated
                             if enemy.boss_level == 3:  # General boss
                                 self.general_defeated = True
@@ -2084,39 +4164,121 @@ class Game:
                             elif enemy.boss_level == 4:  # Final boss
                                 self.final_boss_defeated = True
                                 self.score += 1000  # Big bonus for final boss
-                                self.end_game(won=True)
-                                return
+                                return self.finish_tick(game_over=True, won=True)
                         else:
                             # Add score for regular enemy
                             self.score += 10
                         
-                        self.enemies.remove(enemy)
+                        self.remove_enemy(enemy)
                         break
                     
                     # Only process one hit per enemy per frame (except for penetrating projectiles and explosions)
-                    if enemy_hit and not projectile.get('penetrate', False) and projectile['type'] not in ['explosion', 'slow_wave']:
+                    if enemy_hit and not projectile.penetrate and projectile.kind not in (ProjectileKind.EXPLOSION, ProjectileKind.SLOW_WAVE):
                         break
         
         # Check heart collections
-        for heart in self.hearts[:]:
+        kept = []
+        for heart in self.hearts:
             if heart.is_collected(self.player.x, self.player.y, self.player.size):
                 # Boss hearts give more health
                 health_bonus = 2 if heart.is_boss_heart else 1
                 self.player.health += health_bonus
-                self.hearts.remove(heart)
+            else:
+                kept.append(heart)
+        self.hearts = kept
+        self.finish_tick()
+    
+    def finish_tick(self, game_over=False, won=False):
+        # Every tick ends here, the one that ends the game too: drop the
+        # enemies and projectiles that were used up, then checksum and save
+        # the resulting state
+        self.sweep_enemies()
+        self.player.compact_projectiles()
+        self.profiler.mark('collision')
+        
+        if self.checksums is not None:
+            self.checksums.append(state_checksum(self))
+        if self.recorder is not None and self.tick % REPLAY_KEYFRAME_TICKS == 0:
+            self.recorder.keyframe(self.tick, self.snapshot_state())
+        if self.rewind is not None:
+            self.rewind.push(self.snapshot_state())
+        if game_over:
+            self.end_game(won)
+    
+    def rewind_tick(self):
+        # Practice mode: go back to the state one tick ago. False once
+        # there's nothing older left.
+        state = self.rewind.pop()
+        if state is None:
+            return False
+        self.restore_state(state)
+        return True
+    
+    def area_columns(self):
+        # Every live enemy with its position and size as arrays, straight
+        # from the batch if there is one
+        if self.enemy_batch is not None:
+            return self.enemy_batch.columns()
+        enemies = [enemy for enemy in self.enemies if not enemy.dead]
+        return (enemies, np.array([enemy.x for enemy in enemies], dtype=np.float64),
+                np.array([enemy.y for enemy in enemies], dtype=np.float64),
+                np.array([enemy.size for enemy in enemies], dtype=np.int32))
+    
+    def pick_enemy_batch(self):
+        # Batch the enemies' movement once there are enough of them for the
+        # array ops to pay off, and go back to moving them one by one once
+        # there aren't. The gap between the two thresholds stops it flipping
+        # every tick. They move the same way either way.
+        batch = self.enemy_batch
+        if batch is None:
+            enemies = [enemy for enemy in self.enemies if not enemy.dead]
+            if len(enemies) < BATCH_MIN_ENEMIES:
+                return
+            self.enemy_batch = batch = self.batch_store
+            batch.add_many(enemies, [[getattr(enemy, name) for enemy in enemies] for name in EnemyBatch.COLUMNS])
+        elif len(batch) < BATCH_MIN_ENEMIES // 2:
+            batch.release_all()
+            self.enemy_batch = None
+    
+    def add_enemy(self, enemy):
+        self.enemies.append(enemy)
+        if self.enemy_batch is not None:
+            self.enemy_batch.add(enemy)
+    
+    def remove_enemy(self, enemy):
+        # Flag the enemy; sweep_enemies() drops it from the list at the end of the tick
+        enemy.dead = True
+        self.dead_enemies += 1
+        if self.enemy_batch is not None:
+            self.enemy_batch.remove(enemy)
+    
+    def sweep_enemies(self):
+        if not self.dead_enemies:
+            return
+        kept = []
+        for enemy in self.enemies:
+            if enemy.dead:
+                # Its shots vanish with it
+                for p in enemy.projectiles:
+                    free_projectile(p)
+                enemy_pool.release(enemy)
+            else:
+                kept.append(enemy)
+        self.enemies = kept
+        self.dead_enemies = 0
     
     def get_spawn_count(self, game_elapsed):
         # Return number of enemies to spawn based on game time
         if game_elapsed < 30000:  # first 30 seconds
-            return random.randint(2, 3)
+            return sim_random.randint(2, 3)
         elif game_elapsed < 60000:  # 30-60 seconds
-            return random.randint(2, 4)
+            return sim_random.randint(2, 4)
         elif game_elapsed < 120000:  # 60-120 seconds
-            return random.randint(2, 4)
+            return sim_random.randint(2, 4)
         else:  # after 120 seconds
-            return random.randint(3, 5)
+            return sim_random.randint(3, 5)
     
-    def get_speed_modifier(self, game_elapsed):
+    def get_speed_modifier(self, game_elapsed, current_time):
         # Return speed multiplier based on game time
         base_modifier = 1.0
         
@@ -2126,7 +4288,7 @@ class Game:
             
         # Speed increases after defeating general
         if self.general_defeated:
-            time_since_general = pygame.time.get_ticks() - self.general_defeat_time
+            time_since_general = current_time - self.general_defeat_time
             if time_since_general >= 40000:  # 40 seconds after general
                 base_modifier *= 1.2
         
@@ -2135,17 +4297,48 @@ class Game:
     def end_game(self, won=False):
         if self.score > self.high_score:
             self.high_score = self.score
-            self.save_high_score()
+            # Balance runs shouldn't overwrite the player's high score
+            if not self.headless:
+                self.save_high_score()
         
         if won:
             self.state = GameState.VICTORY
         else:
             self.state = GameState.HOME
+        self.end_session()
+    
+    def session_result(self):
+        return {'ticks': self.tick, 'score': self.score, 'health': self.player.health}
+    
+    def end_session(self):
+        # A game is over (or abandoned): write out its profile and recording
+        if self.profile_path:
+            self.profiler.export(self.profile_path)
+        if self.recorder is not None:
+            self.recorder.save(self.record_path, self.session_result(), self.checksums)
+            self.recorder = None
+        if self.checksum_path and self.checksums is not None:
+            write_checksums(self.checksum_path, self.checksums, self.checksum_start + 1)
     
     def run(self):
         running = True
+        frame_ms = 0
+        drawn_state = None  # State shown on screen, for idle redraws
         while running:
-            for event in pygame.event.get():
+            # Menus and pause only change on input, so instead of spinning at
+            # FPS they sleep until an event arrives (or IDLE_WAIT_MS passes)
+            idle = self.state != GameState.PLAYING
+            if not idle:
+                self.profiler.begin_frame()
+            if idle:
+                idle_start = time.perf_counter()
+                cpu_start = time.process_time()
+                event = pygame.event.wait(IDLE_WAIT_MS)
+                events = [] if event.type == pygame.NOEVENT else [event] + pygame.event.get()
+            else:
+                events = pygame.event.get()
+            
+            for event in events:
                 if event.type == pygame.QUIT:
                     running = False
                 elif self.state == GameState.HOME:
@@ -2157,24 +4350,394 @@ class Game:
                 elif self.state == GameState.PAUSED:
                     self.handle_pause_events(event)
             
+            if not idle:
+                self.profiler.mark('input')
+            
+            if idle and not events and self.state == drawn_state:
+                # Nothing happened; the screen is still up to date
+                self.end_idle_frame(idle, idle_start, cpu_start)
+                continue
+            drawn_state = self.state
+            
             # Update game state
             if self.state == GameState.HOME:
                 self.draw_home_screen()
             elif self.state == GameState.PLAYING:
-                self.update_game()
+                # Fixed timestep: run as many simulation steps as the real
+                # time since the last frame covers. A slow frame costs drawn
+                # frames, not game speed. Holding R in practice mode runs
+                # the same steps backwards instead.
+                self.rewinding = self.rewind is not None and pygame.key.get_pressed()[pygame.K_r]
+                for _ in range(self.game_clock.update(frame_ms)):
+                    if self.rewinding:
+                        if not self.rewind_tick():
+                            break
+                        continue
+                    self.game_clock.advance(self.game_clock.step_ms)
+                    self.update_game(dt=self.game_clock.step_ms)
+                    if self.state != GameState.PLAYING:
+                        break
                 self.draw_game_screen()
+                self.profiler.mark('drawing')
             elif self.state == GameState.VICTORY:
                 self.draw_victory_screen()
             elif self.state == GameState.PAUSED:
                 self.draw_pause_screen()
             
             # Update display
-            pygame.display.flip()
-            clock.tick(FPS)
+            if self.state == GameState.PLAYING and self.dirty_rects is not None:
+                self.dirty_rects.present()
+            else:
+                pygame.display.flip()
+                if self.dirty_rects is not None:
+                    self.dirty_rects.invalidate()
+            if not idle:
+                self.profiler.mark('display')
+                self.profiler.end_frame(self.entity_counts())
+            
+            # Game time only runs while playing, so timers don't expire in menus or while paused
+            if self.state == GameState.PLAYING:
+                self.game_clock.resume()
+            else:
+                self.game_clock.pause()
+            frame_ms = clock.tick(FPS)
+            if idle:
+                # Time spent waiting in a menu isn't simulation backlog
+                frame_ms = 0
+                self.end_idle_frame(idle, idle_start, cpu_start)
         
+        if self.state in (GameState.PLAYING, GameState.PAUSED):
+            self.end_session()  # Quit mid-game
         pygame.quit()
+    
+    def end_idle_frame(self, idle, idle_start, cpu_start):
+        # Add an idle frame's wall and CPU time to the idle CPU figure
+        if idle:
+            self.idle_wall_time += time.perf_counter() - idle_start
+            self.idle_cpu_time += time.process_time() - cpu_start
+    
+    def idle_cpu_percent(self):
+        # CPU use while in menus or paused, as a percentage of one core
+        if self.idle_wall_time == 0:
+            return 0.0
+        return 100 * self.idle_cpu_time / self.idle_wall_time
+    
+    def run_headless(self, ticks, character_type=CharacterType.SQUARE, controller=None, tick_ms=SIM_STEP_MS,
+                     setup=None, render=False):
+        # Run update_game in a tight loop with no display and no frame rate cap.
+        # The game clock is stepped by tick_ms of game time per tick, so game
+        # time runs as fast as the CPU allows.
+        # controller(game) is called before every tick and may shoot/awaken and
+        # return a KeyState for the player's movement (None means no keys held).
+        # setup(game) is called once the game has started. With render, every
+        # tick is also drawn to the off-screen surface.
+        self.selected_character = character_type
+        self.start_game()
+        if setup:
+            setup(self)
+        
+        ticks_run = 0
+        start = time.perf_counter()
+        while ticks_run < ticks and self.state == GameState.PLAYING:
+            self.profiler.begin_frame()
+            self.game_clock.advance(tick_ms)
+            keys = controller(self) if controller else None
+            self.profiler.mark('input')
+            self.update_game(keys if keys is not None else NO_KEYS, tick_ms)
+            if render and self.state == GameState.PLAYING:
+                self.draw_game_screen()
+                self.profiler.mark('drawing')
+            self.profiler.end_frame(self.entity_counts())
+            ticks_run += 1
+        wall_time = time.perf_counter() - start
+        if self.state == GameState.PLAYING:
+            self.end_session()  # Ran out of ticks before the game ended
+        
+        return {
+            'ticks': ticks_run,
+            'wall_time': wall_time,
+            'ticks_per_second': ticks_run / wall_time if wall_time > 0 else 0.0,
+            'game_time': self.game_clock.now() - self.game_start_time,
+            'score': self.score,
+            'health': self.player.health,
+            'state': self.state.name,
+            'pools': pool_stats(),
+            'profile': self.profiler.summary(),
+        }
+
+# Benchmark scenarios: each one sets up a demanding moment of the game and
+# runs it headless for a fixed number of ticks with a fixed seed
+BENCH_TICKS = 600
+BENCH_SEED = 1
+BENCH_HEALTH = 1000000  # The player can't die mid-benchmark
+BENCH_REGRESSION = 0.10  # Ticks/s this far below the baseline counts as a regression
+BENCH_BASELINE = "bench_baseline.json"
+BENCH_BARRAGE_BOSSES = 6  # Final bosses firing at once in final_boss_barrage
+BENCH_BARRAGE_COOLDOWN = 200  # ms between each one's shots (normally 1500)
+
+def bench_controller(shoot=True, awaken_every=0, crowd=0):
+    # Aim at the nearest enemy; awaken every awaken_every ms, ignoring the
+    # cooldown; keep at least crowd enemies on screen
+    next_awakening = [0]
+    def controller(game):
+        player = game.player
+        now = game.game_clock.now()
+        if len(game.enemies) < crowd:
+            bench_crowd(game, crowd - len(game.enemies))
+        if not game.enemies:
+            return None
+        target = min(game.enemies, key=lambda enemy: (enemy.x - player.x) ** 2 + (enemy.y - player.y) ** 2)
+        if shoot:
+            player.shoot(target.x, target.y, now)
+        if awaken_every and now >= next_awakening[0]:
+            next_awakening[0] = now + awaken_every
+            player.last_awakening = now - player.awakening_cooldown - 1
+            player.awakening(target.x, target.y, now)
+        return None
+    return controller
+
+def bench_crowd(game, count):
+    # Surround the player with a ring of enemies
+    for i in range(count):
+        enemy = enemy_pool.acquire(EnemyType.NORMAL)
+        angle = 2 * math.pi * i / count
+        distance = sim_random.uniform(150, 280)
+        enemy.x = game.player.x + math.cos(angle) * distance
+        enemy.y = game.player.y + math.sin(angle) * distance
+        game.add_enemy(enemy)
+
+def setup_post_general_wave(game):
+    # 80 seconds after the General fell, with a wave due now
+    now = game.game_clock.now()
+    game.general_defeated = True
+    game.general_defeat_time = now - 80000
+    game.last_enemy_spawn = now - 3000
+    game.player.health = BENCH_HEALTH
+
+def setup_invulnerable(game):
+    game.player.health = BENCH_HEALTH
+
+def setup_final_boss(game):
+    # A ring of final bosses pinned out of reach, unkillable and firing fast,
+    # so there's a steady barrage of shots in flight
+    game.final_boss_spawned = True
+    for i in range(BENCH_BARRAGE_BOSSES):
+        boss = enemy_pool.acquire(EnemyType.BOSS, 4)
+        angle = 2 * math.pi * i / BENCH_BARRAGE_BOSSES
+        boss.x = game.player.x + math.cos(angle) * 250
+        boss.y = game.player.y + math.sin(angle) * 250
+        boss.speed = 0
+        boss.health = boss.max_health = BENCH_HEALTH
+        boss.cooldown = BENCH_BARRAGE_COOLDOWN
+        game.add_enemy(boss)
+    game.player.health = BENCH_HEALTH
+
+# Name -> (character, setup, controller factory, minimum entity counts at the
+# end). The minimums catch a scenario that stopped exercising what it's named for.
+BENCH_SCENARIOS = {
+    'post_general_wave': (CharacterType.SQUARE, setup_post_general_wave, lambda: bench_controller(), {}),
+    'sniper_bouncing_ball': (CharacterType.SNIPER, setup_invulnerable,
+                             lambda: bench_controller(awaken_every=1000, crowd=40), {}),
+    'robot_beam': (CharacterType.ROBOT, setup_invulnerable, lambda: bench_controller(awaken_every=2000, crowd=40),
+                   {}),
+    'shooter_slow_wave': (CharacterType.SHOOTER, setup_invulnerable,
+                          lambda: bench_controller(awaken_every=1000, crowd=60), {}),
+    'final_boss_barrage': (CharacterType.SQUARE, setup_final_boss, lambda: bench_controller(shoot=False),
+                           {'enemy_projectiles': 20}),
+    # Enough bullets in flight for the NumPy projectile store to take over
+    'square_bullet_storm': (CharacterType.SQUARE, setup_invulnerable,
+                            lambda: bench_controller(awaken_every=150, crowd=40),
+                            {'player_projectiles': STORE_MIN_PROJECTILES}),
+}
+
+def run_benchmark(name, ticks=BENCH_TICKS, render=False, seed=BENCH_SEED):
+    character_type, setup, make_controller, minimums = BENCH_SCENARIOS[name]
+    sim_random.seed(seed)
+    game = Game(headless=True)
+    result = game.run_headless(ticks, character_type, make_controller(), setup=setup, render=render)
+    counts = game.entity_counts()
+    for entity, minimum in minimums.items():
+        if counts[entity] < minimum:
+            raise RuntimeError(f"Benchmark {name} ended with {counts[entity]} {entity}, expected at least {minimum}")
+    frame = result['profile']['metrics']['frame']
+    return {
+        'ticks': result['ticks'],
+        'ticks_per_second': result['ticks_per_second'],
+        'p50': frame['p50'],
+        'p95': frame['p95'],
+        'p99': frame['p99'],
+    }
+
+def run_benchmarks(names, ticks=BENCH_TICKS, render=False, seed=BENCH_SEED,
+                   baseline_path=BENCH_BASELINE, save_baseline=False):
+    # Run each scenario, print it next to its baseline and return the names
+    # of the scenarios that regressed. Rendered and --no-numpy runs get their
+    # own baseline entries ("name+render", "name+no-numpy").
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    
+    regressions = []
+    results = {}
+    for name in names:
+        key = name
+        if render:
+            key += "+render"
+        if not USE_NUMPY:
+            key += "+no-numpy"
+        result = run_benchmark(name, ticks, render, seed)
+        results[key] = result
+        line = (f"{key:<36}{result['ticks']:6d} ticks {result['ticks_per_second']:9.0f} ticks/s   "
+                f"p50 {result['p50']:.3f}  p95 {result['p95']:.3f}  p99 {result['p99']:.3f} ms")
+        previous = baseline.get(key)
+        if previous:
+            change = result['ticks_per_second'] / previous['ticks_per_second'] - 1
+            line += f"   {change:+.0%} vs baseline"
+            if change < -BENCH_REGRESSION:
+                line += "  REGRESSION"
+                regressions.append(key)
+        print(line)
+    
+    if save_baseline:
+        baseline.update(results)
+        with open(baseline_path, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Saved baseline to {baseline_path}")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Epic Adventure cube shooter")
+    parser.add_argument('--headless', action='store_true',
+                        help="run the game logic without a window and without a frame rate cap")
+    parser.add_argument('--ticks', type=int, default=None,
+                        help=f"number of update ticks to simulate in headless mode (default {FPS * 60}) "
+                             f"or per benchmark scenario (default {BENCH_TICKS})")
+    parser.add_argument('--character', default=CharacterType.SQUARE.name,
+                        choices=[c.name for c in CharacterType],
+                        help="character to play in headless mode")
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help="game speed multiplier (2.0 plays at double speed)")
+    parser.add_argument('--no-numpy', action='store_true',
+                        help="use the plain per-object projectile and enemy code instead of NumPy")
+    parser.add_argument('--swarm', type=int, default=1,
+                        help="multiply every enemy wave by this much")
+    parser.add_argument('--dirty-rects', action='store_true',
+                        help="only redraw and update the parts of the screen that changed")
+    parser.add_argument('--idle-stats', action='store_true',
+                        help="print how much CPU the game used while in menus or paused")
+    parser.add_argument('--profile', metavar='PATH', default=None,
+                        help="write p50/p95/p99 frame and phase times to PATH (.json or .csv) when a game ends; "
+                             "F3 shows them in game")
+    parser.add_argument('--bench', nargs='*', metavar='SCENARIO', default=None,
+                        help="run benchmark scenarios (all of them if none are named): "
+                             + ", ".join(BENCH_SCENARIOS))
+    parser.add_argument('--bench-render', action='store_true',
+                        help="also draw every benchmark tick to an off-screen surface")
+    parser.add_argument('--baseline', default=BENCH_BASELINE,
+                        help="benchmark baseline file to compare against")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store this benchmark run as the new baseline")
+    parser.add_argument('--record', metavar='PATH', default=None,
+                        help="record each game's seed and input to PATH")
+    parser.add_argument('--replay', metavar='PATH', default=None,
+                        help="play a recording back headless at full speed and check it ends the same way")
+    parser.add_argument('--seek', type=int, default=0, metavar='TICK',
+                        help="start a --replay at TICK, from the nearest keyframe instead of from the start")
+    parser.add_argument('--load-state', metavar='PATH', default=None,
+                        help="start straight into the game saved in PATH")
+    parser.add_argument('--save-state', metavar='PATH', default=None,
+                        help=f"where S on the pause screen saves the game (default {SNAPSHOT_FILE}); "
+                             "headless runs save their final state there")
+    parser.add_argument('--practice', type=float, nargs='?', const=REWIND_SECONDS, default=0, metavar='SECONDS',
+                        help=f"practice mode: hold R to rewind up to SECONDS of play (default {REWIND_SECONDS})")
+    parser.add_argument('--rewind-budget', type=float, default=REWIND_BUDGET / 2 ** 20, metavar='MB',
+                        help=f"memory for the practice mode rewind buffer (default {REWIND_BUDGET // 2 ** 20} MB)")
+    parser.add_argument('--checksums', metavar='PATH', default=None,
+                        help="write the state checksum after every tick of the game (or replay) to PATH")
+    parser.add_argument('--compare-checksums', nargs=2, metavar=('PATH', 'REFERENCE'), default=None,
+                        help="report the first tick where two --checksums files differ")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="random seed for spawn positions, speeds and wave sizes")
+    args = parser.parse_args(argv)
+    if args.practice and args.record:
+        parser.error("--record can't be combined with --practice (a rewound game can't be replayed)")
+    return args
+
+def main(argv=None):
+    global USE_NUMPY
+    args = parse_args(argv)
+    if args.no_numpy:
+        USE_NUMPY = False
+    if args.seed is not None:
+        sim_random.seed(args.seed)
+    
+    if args.bench is not None:
+        names = args.bench or list(BENCH_SCENARIOS)
+        unknown = [name for name in names if name not in BENCH_SCENARIOS]
+        if unknown:
+            raise SystemExit(f"Unknown benchmark scenario: {', '.join(unknown)}")
+        regressions = run_benchmarks(names, args.ticks or BENCH_TICKS, args.bench_render,
+                                     BENCH_SEED if args.seed is None else args.seed,
+                                     args.baseline, args.save_baseline)
+        pygame.quit()
+        if regressions:
+            raise SystemExit(f"Slower than baseline: {', '.join(regressions)}")
+        return regressions
+    
+    if args.compare_checksums:
+        path, reference_path = args.compare_checksums
+        checksums, reference = read_checksums(path), read_checksums(reference_path)
+        tick = first_divergence(checksums, reference)
+        common = len(checksums.keys() & reference.keys())
+        if tick is None:
+            print(f"{common} common ticks, all checksums match")
+        else:
+            print(f"{common} common ticks, first differs at tick {tick}")
+        pygame.quit()
+        return tick
+    
+    if args.replay:
+        result = run_replay(args.replay, args.profile, args.seek, args.checksums)
+        print(f"Replayed {result['ticks']} ticks in {result['wall_time']:.2f}s "
+              f"({result['ticks_per_second']:.0f} ticks/s), score {result['score']}, "
+              f"health {result['health']}: {'matches' if result['matches'] else 'DIFFERS FROM'} the recording")
+        if result['diverged_at'] is not None:
+            print(f"  state checksums first differ at tick {result['diverged_at']}")
+        pygame.quit()
+        return result
+    
+    if args.headless:
+        game = Game(headless=True, swarm=args.swarm, profile_path=args.profile, checksum_path=args.checksums)
+        setup = None
+        if args.load_state:
+            setup = lambda game: game.start_from_snapshot(args.load_state)
+        result = game.run_headless(args.ticks or FPS * 60, CharacterType[args.character], setup=setup)
+        if args.save_state and game.state == GameState.PLAYING:
+            game.save_snapshot(args.save_state)
+        print(f"{result['ticks']} ticks ({result['game_time'] / 1000:.1f}s game time) in {result['wall_time']:.2f}s "
+              f"({result['ticks_per_second']:.0f} ticks/s), score {result['score']}, "
+              f"health {result['health']}, state {result['state']}")
+        frame = result['profile']['metrics']['frame']
+        print(f"  tick time: p50 {frame['p50']:.3f} ms, p95 {frame['p95']:.3f} ms, p99 {frame['p99']:.3f} ms")
+        for name, stats in result['pools'].items():
+            if stats['created'] or stats['reused']:
+                print(f"  {name} pool: {stats['created']} created, {stats['reused']} reused "
+                      f"({stats['hit_rate']:.0%} hit rate), {stats['free']} free")
+        pygame.quit()
+        return result
+    
+    open_window()
+    game = Game(time_scale=args.time_scale, swarm=args.swarm, dirty_rects=args.dirty_rects,
+                profile_path=args.profile, record_path=args.record,
+                snapshot_path=args.save_state or SNAPSHOT_FILE, rewind_seconds=args.practice,
+                rewind_budget=int(args.rewind_budget * 2 ** 20), checksum_path=args.checksums)
+    if args.load_state:
+        game.start_from_snapshot(args.load_state)
+    game.run()
+    if args.idle_stats:
+        print(f"Idle: {game.idle_cpu_percent():.1f}% CPU over {game.idle_wall_time:.1f}s in menus or paused")
 
 # Start the game
 if __name__ == "__main__":
-    game = Game()
-    game.run()
+    main()